@@ -9,6 +9,9 @@ from typing import List, Dict, Optional
 import shlex
 import argparse
 import time
+# The safety policy engine is shared by every variant (osagent_common/, beside this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osagent_common.safety_policy import SafetyPolicy
 
 
 # --- VIRTUAL ENVIRONMENT CHECK ---
@@ -41,77 +44,8 @@ LOG_DIR = "logs"
 SAFETY_LEVEL = "strict"  # Options: "permissive", "moderate", "strict"
 
 # --- ENHANCED SAFETY SYSTEM ---
-DANGEROUS_COMMANDS = [
-    # Destructive commands
-    r"rm\s+-rf\s+/",
-    r":(){ :|:& };:",
-    r"mkfs\.",
-    r"dd\s+if=.*of=/dev/",
-    r">\s*/dev/sd",
-    r"chmod\s+-R\s+777\s+/",
-    r">\s*/etc/passwd",
-    r">\s*/etc/shadow",
-    r"mv\s+/.*/\s+/dev/null",
-    # Privilege escalation risks
-    r"sudo\s+rm",
-    r"su\s+-c",
-    r"echo\s+.*>\s*/etc/sudoers",
-    # System modification risks
-    r"systemctl\s+disable\s+.*ssh",
-    r"service\s+.*stop\s+.*ssh",
-    r"iptables\s+-F",
-    r"ufw\s+disable",
-    # Network risks
-    r"wget\s+http.*\|\s*bash",
-    r"curl\s+.*\|\s*bash",
-    r"nc\s+-l\s+.*>\s*/dev/tcp",
-]
-
-SAFE_COMMAND_PATTERNS = [
-    # Safe system administration commands
-    r"^systemctl\s+(status|show|is-active|is-enabled)\s+",
-    r"^service\s+.*\s+(status|)",
-    r"^df\s+-h",
-    r"^du\s+-sh",
-    r"^free\s+-h",
-    r"^top\s+-b\s+-n\s+1",
-    r"^ps\s+aux",
-    r"^ls\s+(-[a-zA-Z]*l[a-zA-Z]*)?\s+",
-    r"^cat\s+",
-    r"^grep\s+",
-    r"^tail\s+",
-    r"^head\s+",
-    r"^mkdir\s+-p\s+",
-    r"^cp\s+",
-    r"^mv\s+(?!/)",  # mv but not to root
-    r"^chmod\s+[0-7]{3,4}\s+",  # chmod with numeric permissions
-    r"^chown\s+[a-zA-Z0-9_.:-]+\s+[a-zA-Z0-9_.:-]+\s+",  # chown user:group file
-    r"^find\s+/[^ ]*\s+-type\s+f\s+-name\s+",
-    r"^tar\s+-[czx]",
-    r"^gzip\s+",
-    r"^gunzip\s+",
-    r"^apt\s+update",
-    r"^apt\s+list\s+--upgradable",
-    r"^apt-cache\s+search",
-    r"^which\s+",
-    r"^whoami",
-    r"^hostname",
-    r"^date",
-    r"^uname\s+-a",
-    r"^lsb_release\s+-a",
-    r"^netstat\s+-tuln",
-    r"^ss\s+-tuln",
-    r"^ping\s+-c\s+[0-9]+\s+",
-    r"^traceroute\s+",
-    r"^mtr\s+-r",
-    r"^journalctl\s+-n\s+[0-9]+",
-    r"^dmesg\s+-T",
-    r"^lsblk",
-    r"^blkid",
-    r"^fdisk\s+-l",
-    r"^df\s+-h",
-    r"^du\s+-sh",
-]
+# Dangerous patterns and the strict-mode safe list, compiled once into a single matcher
+SAFETY_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_policy.yaml")
 
 # --- EMBEDDED KNOWLEDGE BASE ---
 KNOWLEDGE_BASE = {
@@ -205,6 +139,8 @@ class SessionLogger:
 class SafetyChecker:
     """Handles safety validation of commands."""
 
+    policy = SafetyPolicy.load(SAFETY_POLICY_FILE)
+
     @staticmethod
     def is_command_safe(
         command: str, safety_level: str = SAFETY_LEVEL
@@ -213,77 +149,8 @@ class SafetyChecker:
         Check if a command is safe to execute.
         Returns (is_safe, reason_if_unsafe)
         """
-        command = command.strip()
-
-        # Empty command check
-        if not command:
-            return False, "Empty command"
-
-        # Check against dangerous patterns
-        for pattern in DANGEROUS_COMMANDS:
-            if re.search(pattern, command, re.IGNORECASE):
-                return False, f"Command matches dangerous pattern: {pattern}"
-
-        # For strict mode, only allow explicitly safe commands
-        if safety_level == "strict":
-            # Check if command matches any safe patterns
-            is_safe_pattern = False
-            for pattern in SAFE_COMMAND_PATTERNS:
-                if re.match(pattern, command):
-                    is_safe_pattern = True
-                    break
-
-            if not is_safe_pattern:
-                # Additional checks for common safe commands
-                safe_prefixes = [
-                    "echo ",
-                    "ls ",
-                    "cat ",
-                    "grep ",
-                    "head ",
-                    "tail ",
-                    "mkdir ",
-                    "cp ",
-                    "mv ",
-                    "chmod ",
-                    "chown ",
-                    "df ",
-                    "du ",
-                    "free ",
-                    "ps ",
-                    "top ",
-                    "systemctl ",
-                    "service ",
-                    "apt ",
-                    "which ",
-                    "whoami ",
-                    "hostname ",
-                    "date ",
-                    "uname ",
-                    "lsb_release ",
-                    "netstat ",
-                    "ss ",
-                    "ping ",
-                    "traceroute ",
-                    "mtr ",
-                    "journalctl ",
-                    "dmesg ",
-                    "lsblk ",
-                    "blkid ",
-                    "fdisk ",
-                ]
-
-                is_safe_prefix = any(
-                    command.startswith(prefix) for prefix in safe_prefixes
-                )
-
-                if not is_safe_prefix:
-                    return (
-                        False,
-                        f"Command not in approved safe list for strict mode: {command}",
-                    )
-
-        return True, "Command passed safety check"
+        verdict = SafetyChecker.policy.check(command, (safety_level,))
+        return verdict.allowed, verdict.reason
 
 
 class TerminalTool:
@@ -294,10 +161,6 @@ class TerminalTool:
         if not is_safe:
             return f"Error: Command blocked by safety filter - {reason}"
 
-        # Additional blocking for obvious destructive commands
-        if any(x in command for x in ["rm -rf /", ":(){ :|:& };:"]):
-            return "Error: High-risk command blocked by safety filter."
-
         try:
             result = subprocess.run(
                 command, shell=True, capture_output=True, text=True, timeout=30
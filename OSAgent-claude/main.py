@@ -4,9 +4,14 @@ import json
 import requests
 import subprocess
 import sys
+import difflib
+import time
 from datetime import datetime
 from typing import List, Dict, Optional
 import argparse
+# The safety policy engine is shared by every variant (osagent_common/, beside this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osagent_common.safety_policy import SafetyPolicy, command_key
 
 # --- CONFIGURATION ---
 import os
@@ -16,6 +21,19 @@ MODEL_TEMPERATURE = float(os.getenv("OSAGENT_MODEL_TEMPERATURE", "0.1"))
 MODEL_AUTOMATION = os.getenv("OSAGENT_MODEL_AUTOMATION", "False").lower() == "true"
 LOG_DIR = os.getenv("OSAGENT_LOG_DIR", "logs")
 MAX_COMMAND_EXECUTIONS = int(os.getenv("OSAGENT_MAX_COMMAND_EXECUTIONS", "50"))
+# A command repeated within a session, or on a later --loop iteration, only sends what changed
+# since its last run: a unified diff, or "unchanged since HH:MM". The full output is saved to a file.
+DELTA_OUTPUT = os.getenv("OSAGENT_DELTA_OUTPUT", "True").lower() == "true"
+DELTA_MAX_CHANGED_RATIO = float(os.getenv("OSAGENT_DELTA_MAX_CHANGED_RATIO", "0.3"))
+# --loop shows each iteration the latest outputs of the previous ones, newest first and up to this
+# size; outputs beyond it are forgotten and sent in full when run again
+DELTA_CARRY_MAX_BYTES = int(os.getenv("OSAGENT_DELTA_CARRY_MAX_BYTES", str(16 * 1024)))
+DELTA_DIR = os.path.join(LOG_DIR, "last_output")
+# Dangerous patterns and length/pipe limits, compiled once into a single matcher
+SAFETY_POLICY_FILE = os.getenv(
+    "OSAGENT_SAFETY_POLICY_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_policy.yaml"),
+)
 
 # --- EMBEDDED KNOWLEDGE BASE ---
 KNOWLEDGE_BASE = {
@@ -79,68 +97,14 @@ class SessionLogger:
 
 
 class TerminalTool:
-    # List of dangerous command patterns to block
-    DANGEROUS_PATTERNS = [
-        # File system destruction
-        r"rm\s+-rf\s+/",  # rm -rf /
-        r"rm\s+-rf\s+/\*",  # rm -rf /*
-        r"mkfs",  # Format filesystem commands
-        r"dd\s+if=.*of=/dev/sd",  # Direct disk writes
-        r">\s*/dev/sd",  # Redirects to disk devices
-        # Fork bombs and resource exhaustion
-        r":\(\|\)&\|:\)&",  # Fork bomb variants
-        r"\[\s*\]\s*&\s*\[\s*\]",  # Array fork bomb
-        # Privilege escalation and backdoors
-        r"sudo\s+.*",  # sudo commands (could be restricted further)
-        r"su\s+",  # Switch user
-        r"chmod\s+.*[47]",  # Setting SUID/SGID bits
-        r"chown\s+.*root",  # Changing ownership to root
-        # Network and data exfiltration
-        r"nc\s+-l",  # Netcat listener
-        r"telnet\s+",  # Telnet
-        r"wget\s+.*http",  # wget with URLs
-        r"curl\s+.*http",  # curl with URLs
-        r"/etc/passwd",  # Access to password file
-        r"/etc/shadow",  # Access to shadow file
-        # System manipulation
-        r"mount\s+",  # Mount commands
-        r"umount\s+",  # Unmount commands
-        r"iptables\s+",  # Firewall manipulation
-        r"systemctl\s+",  # Service control
-        r"service\s+",  # Service control (older)
-        # Process manipulation
-        r"kill\s+-9\s+1",  # Kill init process
-        r"pkill\s+",  # Process killing
-        r"killall\s+",  # Process killing by name
-        # Reconnaissance
-        r"ps\s+aux",  # Detailed process listing
-        r"netstat\s+-",  # Network statistics
-        r"ss\s+-",  # Socket statistics
-        r"lsof\s+",  # List open files
-        r"ifconfig\s+",  # Network interfaces
-        r"ip\s+addr\s+",  # IP address info
-        # Archive and compression (could be used to hide data)
-        r"tar\s+.*czf",  # Creating compressed archives
-        r"zip\s+.*\-r",  # Recursive zip
-    ]
+    # Dangerous command patterns and length/pipe limits (see SAFETY_POLICY_FILE)
+    policy = SafetyPolicy.load(SAFETY_POLICY_FILE)
 
     @staticmethod
     def execute(command: str) -> str:
-        # Check against dangerous patterns
-        import re
-
-        for pattern in TerminalTool.DANGEROUS_PATTERNS:
-            if re.search(pattern, command, re.IGNORECASE):
-                return f"Error: Command blocked by safety filter - matches dangerous pattern: {pattern}"
-
-        # Additional safety checks
-        # Block commands with excessive length (potential buffer overflow attempts)
-        if len(command) > 500:
-            return "Error: Command too long - potential security risk."
-
-        # Block commands with too many pipes or redirects (potential for obfuscation)
-        if command.count("|") > 10 or command.count(">") > 5 or command.count("<") > 5:
-            return "Error: Command has excessive pipes/redirects - potential security risk."
+        verdict = TerminalTool.policy.check(command)
+        if not verdict.allowed:
+            return f"Error: {verdict.reason}"
 
         try:
             result = subprocess.run(
@@ -150,8 +114,9 @@ class TerminalTool:
             errors = result.stderr if result.stderr else ""
             if result.returncode != 0:
                 return f"Execution Error (Exit Code {result.returncode}):\n{errors}"
-            return (
-                output if output.strip() else f"Success (no output). Stderr: {errors}"
+            return OutputDelta.apply(
+                command,
+                output if output.strip() else f"Success (no output). Stderr: {errors}",
             )
         except subprocess.TimeoutExpired:
             return "Error: Command timed out after 30 seconds."
@@ -159,6 +124,83 @@ class TerminalTool:
             return f"Error executing command: {str(e)}"
 
 
+class OutputDelta:
+    """
+    Remembers the last output of each command within the current conversation and replaces a
+    repeat that barely changed with a unified diff against it, or a one-line note. Earlier
+    command output is not carried into the next interactive prompt, so that conversation starts
+    again with full output. --loop iterations keep it and pass it on (carry_over), so a repeat
+    is diffed against output the model has been shown.
+    """
+
+    _last: Dict[str, tuple] = {}  # command -> (output, changed_at, seen_at, path)
+    _files = 0
+
+    @staticmethod
+    def new_conversation():
+        OutputDelta._last.clear()
+
+    @staticmethod
+    def carry_over() -> str:
+        """
+        The latest output of each remembered command, newest first, for the next conversation.
+        Outputs beyond DELTA_CARRY_MAX_BYTES are forgotten: the model will not see them.
+        """
+        kept, sections, size = [], [], 0
+        for key, entry in reversed(list(OutputDelta._last.items())):
+            output, _, seen_at, path = entry
+            ran = time.strftime("%H:%M", time.localtime(seen_at))
+            section = f"$ {key}\n[Run at {ran}. Full output: cat {path}]\n{output.rstrip()}"
+            if size + len(section.encode()) > DELTA_CARRY_MAX_BYTES:
+                continue
+            size += len(section.encode())
+            kept.append((key, entry))
+            sections.append(section)
+        OutputDelta._last = dict(reversed(kept))
+        return "\n\n".join(sections)
+
+    @staticmethod
+    def _save(path: str, output: str):
+        try:
+            os.makedirs(DELTA_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(output)
+        except IOError as e:
+            print(f"Logging error: {e}", file=sys.stderr)
+
+    @staticmethod
+    def apply(command: str, output: str) -> str:
+        # Reading a saved full output must return it, not a note pointing at another file
+        if not DELTA_OUTPUT or DELTA_DIR in command:
+            return output
+        key = command_key(command)
+        now = time.time()
+        previous = OutputDelta._last.get(key)
+        if previous is None:
+            OutputDelta._files += 1
+            path = os.path.join(DELTA_DIR, f"command_{os.getpid()}_{OutputDelta._files}.txt")
+            OutputDelta._save(path, output)
+            OutputDelta._last[key] = (output, now, now, path)
+            return output
+        old, changed_at, seen_at, path = previous
+        if old == output:
+            OutputDelta._last[key] = (output, changed_at, now, path)
+            note = f"[Output unchanged since {time.strftime('%H:%M', time.localtime(changed_at))}. Full output: cat {path}]"
+            return note if len(note) < len(output) else output
+        OutputDelta._save(path, output)
+        OutputDelta._last[key] = (output, now, now, path)
+        old_lines, new_lines = old.splitlines(), output.splitlines()
+        diff = list(difflib.unified_diff(old_lines, new_lines, n=1, lineterm=""))[2:]
+        changed = sum(1 for line in diff if line[:1] in "+-")
+        if changed > DELTA_MAX_CHANGED_RATIO * max(len(old_lines), len(new_lines)):
+            return output
+        delta = (
+            f"[Output changed since the run at {time.strftime('%H:%M', time.localtime(seen_at))}; "
+            f"unified diff below. Full output: cat {path}]\n" + "\n".join(diff)
+        )
+        return delta if len(delta) < len(output) else output
+
+
 # --- AGENT CORE ---
 
 
@@ -231,6 +273,7 @@ def run_agentic_session():
             )
 
         messages = [{"role": "system", "content": current_system_message}]
+        OutputDelta.new_conversation()
         messages.extend(history)
         messages.append({"role": "user", "content": user_input})
         history.append({"role": "user", "content": user_input})
@@ -279,8 +322,9 @@ def run_agentic_session():
                 break
 
 
-def run_single_prompt(prompt: str):
-    """Run a single prompt and exit"""
+def run_single_prompt(prompt: str, carry_outputs: bool = False):
+    """Run a single prompt and exit. carry_outputs (--loop): show the model the command output
+    of the previous run and diff repeats against it."""
     terminal = TerminalTool()
     logger = SessionLogger(LOG_DIR)
 
@@ -305,6 +349,15 @@ def run_single_prompt(prompt: str):
     if specialized_context:
         current_system_message += f"\n\n--- ACTIVE KNOWLEDGE ---\n{specialized_context}"
 
+    if carry_outputs:
+        previous_output = OutputDelta.carry_over()
+        if previous_output:
+            current_system_message += (
+                f"\n\n--- COMMAND OUTPUT FROM THE PREVIOUS RUN ---\n{previous_output}"
+            )
+    else:
+        OutputDelta.new_conversation()
+
     messages = [{"role": "system", "content": current_system_message}]
     messages.extend(history)
     messages.append({"role": "user", "content": prompt})
@@ -381,7 +434,7 @@ if __name__ == "__main__":
             print("Running in loop mode. Press Ctrl+C to exit.")
             try:
                 while True:
-                    run_single_prompt(args.prompt)
+                    run_single_prompt(args.prompt, carry_outputs=True)
                     print("\n--- Press Enter for next iteration or Ctrl+C to exit ---")
                     input()
             except KeyboardInterrupt:
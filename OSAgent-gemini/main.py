@@ -20,6 +20,10 @@ import sys
 from datetime import datetime
 from typing import List, Dict, Optional
 
+# The safety policy engine is shared by every variant (osagent_common/, beside this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osagent_common.safety_policy import SafetyPolicy
+
 # --- CONFIGURATION ---
 # API endpoint for the local LLM server (using llama.cpp or similar)
 API_URL = "http://10.167.32.1:1234/v1/chat/completions"
@@ -29,6 +33,8 @@ MODEL_TEMPERATURE = 0.1
 MODEL_AUTOMATION = False
 # Directory for storing session logs
 LOG_DIR = "logs"
+# Dangerous patterns and critical paths, compiled once into a single matcher
+SAFETY_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_policy.yaml")
 
 # To run this agent with proper dependency management:
 # 1. Ensure you have uv installed: https://docs.astral.sh/uv/
@@ -133,45 +139,8 @@ class SessionLogger:
 
 
 class TerminalTool:
-    # List of dangerous commands/patterns that should never be executed
-    DANGEROUS_PATTERNS = [
-        # Destructive file operations
-        r"rm\s+-[rf]{1,2}",  # rm -r, rm -f, rm -rf
-        r"rm\s+-[rf]{1,2}\s+/",  # rm -rf / (already covered but explicit)
-        r">\s*/dev/(sd|hd|vd)",  # Writing directly to disk devices
-        r"dd\s+if=.*of=/dev/(sd|hd|vd)",  # dd to disk devices
-        r">\s*/",  # Redirecting to root directory
-        # Fork bombs and resource exhaustion
-        r":\(\)\s*{\s*:\|:\&\ };:",  # Classic fork bomb
-        r"\(\)\s*{\s*.*\s*\&\s*}",  # Other fork bomb variants
-        # System modification commands
-        r"mkfs\.",  # Formatting filesystems
-        r"fdisk",  # Partition manipulation
-        r"parted",  # Partition manipulation
-        r"fsck",  # Filesystem check (can be dangerous if misused)
-        r"mount.*bind",  # Bind mounts (can be used maliciously)
-        r"chroot",  # Changing root directory
-        # Privilege escalation risks
-        r"sudo\s+rm",  # sudo with remove commands
-        r"su\s+-",  # Switching user
-        r"sudo\s+su",  # Double sudo/su
-        # Network dangers
-        r"wget\s+.*\|\s*sh",  # Piping download to shell
-        r"curl\s+.*\|\s*sh",  # Piping download to shell
-        r"nc\s+.*\-e",  # Netcat with exec
-        r"bash\s+.*i\s+>\s*&",  # Reverse shell
-        # System control
-        r"shutdown",  # Shutting down system
-        r"reboot",  # Rebooting system
-        r"halt",  # Halting system
-        r"init\s+[0-6]",  # Changing runlevels
-        r"systemctl\s+(stop|disable)",  # Stopping/disabling services
-        # Dangerous utilities
-        r">\s*&>",  # Redirecting both stdout and stderr to file (can overwrite important files)
-        r">\s*/etc/",  # Writing to /etc directory
-        r">\s*/boot/",  # Writing to /boot directory
-        r">\s*/var/",  # Writing to /var directory (can fill logs)
-    ]
+    # Dangerous commands/patterns that should never be executed (see SAFETY_POLICY_FILE)
+    policy = SafetyPolicy.load(SAFETY_POLICY_FILE)
 
     @staticmethod
     def _is_command_safe(command: str) -> tuple[bool, str]:
@@ -180,31 +149,8 @@ class TerminalTool:
         Returns:
             tuple: (is_safe, reason_if_unsafe)
         """
-        command_lower = command.lower().strip()
-
-        # Check against dangerous patterns
-        for pattern in TerminalTool.DANGEROUS_PATTERNS:
-            if re.search(pattern, command_lower, re.IGNORECASE):
-                return False, f"Command matches dangerous pattern: {pattern}"
-
-        # Additional safety checks
-        # Prevent commands that try to modify critical system files without explicit allowance
-        critical_paths = [
-            r"/etc/passwd",
-            r"/etc/shadow",
-            r"/etc/gshadow",
-            r"/etc/sudoers",
-            r"/boot/",
-            r"/dev/",
-            r"/proc/sys/",
-        ]
-
-        for path in critical_paths:
-            # Check for write operations to critical paths
-            if re.search(rf">\s*{path}|>>\s*{path}|\|\s*tee\s*{path}", command_lower):
-                return False, f"Attempt to write to critical path: {path}"
-
-        return True, ""
+        verdict = TerminalTool.policy.check(command)
+        return verdict.allowed, verdict.reason
 
     @staticmethod
     def execute(command: str) -> str:
@@ -6,12 +6,17 @@ import subprocess
 import sys
 from datetime import datetime
 from typing import List, Dict, Optional
+# The safety policy engine is shared by every variant (osagent_common/, beside this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osagent_common.safety_policy import SafetyPolicy
 
 # --- CONFIGURATION ---
 API_URL = "http://10.167.32.1:1234/v1/chat/completions"
 MODEL_TEMPERATURE = 0.1
 MODEL_AUTOMATION = False
 LOG_DIR = "logs"
+# High-risk command patterns, compiled once into a single matcher
+SAFETY_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_policy.yaml")
 
 # --- EMBEDDED KNOWLEDGE BASE ---
 KNOWLEDGE_BASE = {
@@ -144,43 +149,14 @@ class SessionLogger:
 
 
 class TerminalTool:
+    # Enhanced safety filters for Ubuntu 24.04 system administration (see SAFETY_POLICY_FILE)
+    policy = SafetyPolicy.load(SAFETY_POLICY_FILE)
+
     @staticmethod
     def execute(command: str) -> str:
-        # Enhanced safety filters for Ubuntu 24.04 system administration
-        dangerous_patterns = [
-            # Destructive file operations
-            r"rm\s+-rf\s+/",  # rm -rf / or variations
-            r"rm\s+-rf\s+/\*",  # rm -rf /*
-            r"mkfs\.",  # Formatting commands
-            r"dd\s+if=.*of=/dev/",  # dd to disk devices
-            r">\s*/dev/sd",  # Redirecting to disk devices
-            # System critical modifications
-            r"chmod\s+[0-9]*\s+/(etc|bin|sbin|usr|lib|lib64)",  # Dangerous chmod
-            r"chown\s+-R\s+.*\/(etc|bin|sbin|usr|lib|lib64)",  # Dangerous chown
-            # Kernel and boot modifications
-            r"rm\s+.*\.(ko|mod)$",  # Removing kernel modules
-            r"mv\s+/boot/",  # Moving boot files
-            r"rm\s+/boot/",  # Removing boot files
-            # Fork bombs and resource exhaustion
-            r":\(\s*\)\s*{\s*:|\s*&}",  # Fork bomb variations
-            # Privilege escalation risks
-            r"echo\s+.*>>\s*/etc/sudoers",  # Unsafe sudoers modification
-            r"visudo.*-f\s+/etc/sudoers",  # Unsafe sudoers editing
-            # Network configuration risks
-            r"ifconfig.*down",  # Bringing down network interfaces
-            r"ip link.*down",  # Equivalent in ip command
-            r"route del.*default",  # Deleting default route
-            r"iptables.*-P.*DROP",  # Dropping all packets
-            # Package management risks
-            r"apt-get.*remove.*--purge.*linux-image",  # Removing kernel images
-            r"dpkg.*--purge.*linux-image",  # Same with dpkg
-        ]
-
-        import re
-
-        for pattern in dangerous_patterns:
-            if re.search(pattern, command, re.IGNORECASE):
-                return f"Error: High-risk command blocked by safety filter. Pattern matched: {pattern}"
+        verdict = TerminalTool.policy.check(command)
+        if not verdict.allowed:
+            return f"Error: {verdict.reason}"
 
         try:
             result = subprocess.run(
@@ -0,0 +1,154 @@
+"""
+Admission control: costly commands only start while the host has headroom for them.
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from osagent_common.safety_policy import command_segments
+from config import (ADMISSION_CONTROL, ADMISSION_HEAVY_SLOTS, ADMISSION_MAX_WAIT, ADMISSION_POLL_INTERVAL,
+                    ADMISSION_THRESHOLDS, COMMAND_COST_CLASSES)
+
+
+class AdmissionTicket(NamedTuple):
+    admitted: bool
+    cost: str  # "light", "medium" or "heavy"
+    note: str  # Why the command waited or was rejected ("" if it started straight away)
+
+
+class AdmissionController:
+    """
+    Decides whether a command may start now, given its cost class and the host's load.
+
+    Readings: 1-minute load average per CPU, PSI "some avg10" for cpu/io/memory, and
+    MemAvailable as a percentage of MemTotal. Missing sources (no PSI on older kernels)
+    are simply not checked. Heavy commands also queue for ADMISSION_HEAVY_SLOTS.
+    """
+    _classes = [(re.compile(pattern), cost) for pattern, cost in COMMAND_COST_CLASSES]
+    _heavy_slots = threading.BoundedSemaphore(ADMISSION_HEAVY_SLOTS)
+    _wake = threading.Condition()
+    _cancel_generation = 0
+
+    @classmethod
+    def classify(cls, command: str) -> str:
+        ranks = {"light": 0, "medium": 1, "heavy": 2}
+        cost = "light"
+        for segment in command_segments(command):
+            for pattern, segment_cost in cls._classes:
+                if pattern.search(segment):
+                    if ranks[segment_cost] > ranks[cost]:
+                        cost = segment_cost
+                    break
+        return cost
+
+    @staticmethod
+    def _read_pressure(resource_name: str) -> Optional[float]:
+        try:
+            with open(f"/proc/pressure/{resource_name}", "r") as f:
+                for line in f:
+                    if line.startswith("some "):
+                        return float(line.split("avg10=")[1].split()[0])
+        except (OSError, IndexError, ValueError):
+            pass
+        return None
+
+    @classmethod
+    def sample(cls) -> Dict[str, float]:
+        """Current host readings. Sources that cannot be read are left out."""
+        readings = {}
+        try:
+            readings["load_per_cpu"] = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            pass
+        for resource_name in ("cpu", "io", "memory"):
+            pressure = cls._read_pressure(resource_name)
+            if pressure is not None:
+                readings[f"{resource_name}_pressure"] = pressure
+        try:
+            meminfo = {}
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    name, _, value = line.partition(":")
+                    meminfo[name] = int(value.split()[0])
+            readings["memory_available"] = 100 * meminfo["MemAvailable"] / meminfo["MemTotal"]
+        except (OSError, KeyError, ValueError, ZeroDivisionError):
+            pass
+        return readings
+
+    @staticmethod
+    def violations(cost: str, readings: Dict[str, float]) -> List[str]:
+        """Human-readable reasons the host is too busy for this cost class."""
+        limits = ADMISSION_THRESHOLDS.get(cost, {})
+        reasons = []
+        for name, limit in limits.items():
+            if name == "min_memory_available":
+                value = readings.get("memory_available")
+                if value is not None and value < limit:
+                    reasons.append(f"only {value:.0f}% memory available, below {limit}%")
+            elif name == "load_per_cpu":
+                value = readings.get(name)
+                if value is not None and value > limit:
+                    reasons.append(f"load {value * (os.cpu_count() or 1):.1f} on {os.cpu_count() or 1} CPUs, above {limit} per CPU")
+            else:
+                value = readings.get(name)
+                if value is not None and value > limit:
+                    reasons.append(f"{name.replace('_', ' ')} {value:.0f}%, above {limit}%")
+        return reasons
+
+    @classmethod
+    def admit(cls, command: str) -> AdmissionTicket:
+        """Wait until the command may start (or give up). Release admitted tickets with release()."""
+        cost = cls.classify(command) if ADMISSION_CONTROL else "light"
+        if cost == "light":
+            return AdmissionTicket(True, cost, "")
+        generation = cls._cancel_generation
+        started = time.monotonic()
+        deadline = started + ADMISSION_MAX_WAIT
+        queued = False
+        if cost == "heavy":
+            queued = not cls._heavy_slots.acquire(blocking=False)
+            if queued and not cls._heavy_slots.acquire(timeout=ADMISSION_MAX_WAIT):
+                return AdmissionTicket(False, cost, (
+                    f"Error: Command postponed: another heavy command is still running after "
+                    f"{ADMISSION_MAX_WAIT}s. Try again later."
+                ))
+        try:
+            while True:
+                reasons = cls.violations(cost, cls.sample())
+                if not reasons:
+                    break
+                if time.monotonic() >= deadline or generation != cls._cancel_generation:
+                    if cost == "heavy":
+                        cls._heavy_slots.release()
+                    return AdmissionTicket(False, cost, (
+                        f"Error: Command postponed: the host is too busy for a {cost} command ("
+                        + "; ".join(reasons)
+                        + f"), still after waiting {time.monotonic() - started:.0f}s. "
+                        "Try a lighter or narrower command, or try again later."
+                    ))
+                with cls._wake:
+                    cls._wake.wait(min(ADMISSION_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+        except KeyboardInterrupt:
+            if cost == "heavy":
+                cls._heavy_slots.release()
+            raise
+        waited = time.monotonic() - started
+        if waited < 0.5:
+            return AdmissionTicket(True, cost, "")
+        why = "for a free heavy-command slot and " if queued else "for "
+        return AdmissionTicket(True, cost, f"[admission: {cost} command waited {waited:.0f}s {why}host load to drop]")
+
+    @classmethod
+    def release(cls, ticket: AdmissionTicket):
+        if ticket.admitted and ticket.cost == "heavy" and ADMISSION_CONTROL:
+            cls._heavy_slots.release()
+
+    @classmethod
+    def cancel_waits(cls):
+        """Make every command currently waiting for admission give up."""
+        with cls._wake:
+            cls._cancel_generation += 1
+            cls._wake.notify_all()
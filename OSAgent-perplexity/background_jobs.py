@@ -0,0 +1,253 @@
+"""
+Commands started as background jobs: their output is buffered for polling and logged for READ and SEARCH.
+"""
+
+import atexit
+import os
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from admission import AdmissionController
+from command_cache import CACHE, format_age
+from command_policy import is_command_safe
+from config import (ADMISSION_CONTROL, CANCEL_GRACE_PERIOD, COMMAND_CACHE, JOB_BUFFER_BYTES,
+                    JOB_OUTPUT_MAX_BYTES, JOB_TIMEOUT, MAX_BACKGROUND_JOBS, OUTPUT_SPILL_DIR,
+                    OUTPUT_SPILL_MAX_BYTES)
+from osagent_common.read_only import is_read_only
+from output_buffer import BinaryContent, SpillRegistry
+from preflight import PreflightCheck
+from resource_limits import ResourceLimiter
+from running_command import ProcessTree
+
+
+class BackgroundJob:
+    """
+    One command running detached from the conversation.
+
+    stdout and stderr are merged and read by a daemon thread into a ring buffer of the
+    last JOB_BUFFER_BYTES (addressed by absolute byte offsets, so polling with a cursor
+    survives wrap-around) and into a log file registered as handle 'jobN.out' for READ
+    and SEARCH.
+    """
+
+    def __init__(self, job_id: str, command: str):
+        self.job_id = job_id
+        self.command = command
+        self.buffer = bytearray()
+        self.base = 0  # Absolute offset of buffer[0]
+        self.total = 0
+        self.returncode = None
+        self.state = "running"  # running, exited, timed out, cancelled
+        self.usage = ""
+        self.started = time.monotonic()
+        self.finished = None
+        self._lock = threading.Lock()
+        fd, self.log_path = tempfile.mkstemp(prefix=f"osagent-{job_id}-", suffix=".log", dir=OUTPUT_SPILL_DIR)
+        self._log = os.fdopen(fd, "wb")
+        SpillRegistry.register(f"{job_id}.out", self.log_path)
+        self._baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.process = subprocess.Popen(
+            ResourceLimiter.argv(command, background=True),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        self._reader = threading.Thread(target=self._pump, name=f"osagent-{job_id}", daemon=True)
+        self._reader.start()
+
+    def _pump(self):
+        logged = 0
+        while True:
+            chunk = os.read(self.process.stdout.fileno(), 65536)
+            if not chunk:
+                break
+            with self._lock:
+                self.buffer += chunk
+                self.total += len(chunk)
+                if len(self.buffer) > 2 * JOB_BUFFER_BYTES:
+                    drop = len(self.buffer) - JOB_BUFFER_BYTES
+                    del self.buffer[:drop]
+                    self.base += drop
+            if logged < OUTPUT_SPILL_MAX_BYTES:
+                piece = chunk[: OUTPUT_SPILL_MAX_BYTES - logged]
+                self._log.write(piece)
+                self._log.flush()
+                logged += len(piece)
+        self.process.stdout.close()
+        self._log.close()
+        try:
+            _, status, usage = os.wait4(self.process.pid, 0)
+            self.process.returncode = os.waitstatus_to_exitcode(status)
+            self.usage = ResourceLimiter.describe_usage(usage, time.monotonic() - self.started, self._baseline_rss)
+        except ChildProcessError:
+            self.process.wait()
+        with self._lock:
+            self.returncode = self.process.returncode
+            self.finished = time.monotonic()
+            if self.state == "running":
+                self.state = "exited"
+
+    @property
+    def running(self) -> bool:
+        return self.finished is None
+
+    def stop(self, state: str):
+        """Stop the job's whole process tree; the reader thread records the exit."""
+        with self._lock:
+            if not self.running:
+                return
+            self.state = state
+        ProcessTree.terminate(self.process)
+        self._reader.join(timeout=CANCEL_GRACE_PERIOD + 1)
+
+    def status(self) -> str:
+        with self._lock:
+            elapsed = (self.finished or time.monotonic()) - self.started
+            if self.running:
+                line = f"{self.job_id}: running for {format_age(elapsed)}"
+            else:
+                line = f"{self.job_id}: {self.state} after {format_age(elapsed)} with exit code {self.returncode}"
+            line += f", {self.total} bytes of output. Command: {self.command}"
+            if not self.running and self.usage:
+                line += f"\n{self.usage}"
+        return line
+
+    def output(self, since: int) -> str:
+        with self._lock:
+            since = max(0, since)
+            notes = []
+            if since < self.base:
+                notes.append(
+                    f"[bytes {since}-{self.base} are no longer buffered; "
+                    f"use [[READ: {self.job_id}.out]] for the full log]"
+                )
+                since = self.base
+            start = since - self.base
+            data = bytes(self.buffer[start:start + JOB_OUTPUT_MAX_BYTES])
+            end = since + len(data)
+            total = self.total
+            running = self.running
+            state = "running" if running else f"{self.state}, exit code {self.returncode}"
+        if BinaryContent.looks_binary(data):
+            description, hint = BinaryContent.describe(data) if since == 0 else ("binary data", "file")
+            text = f"[{len(data)} bytes of {description}, not shown. To inspect the log, try: {hint}]"
+        else:
+            text = data.decode("utf-8", errors="replace")
+        if end < total:
+            notes.append(f"[{self.job_id} ({state}): bytes {since}-{end} of {total}; more: [[JOB_OUTPUT: {self.job_id} {end}]]]")
+        elif running:
+            notes.append(f"[{self.job_id} ({state}): bytes {since}-{end}, no more output yet; poll later with [[JOB_OUTPUT: {self.job_id} {end}]]]")
+        else:
+            notes.append(f"[{self.job_id} ({state}): bytes {since}-{end}, end of output]")
+        return "\n".join([text.rstrip("\n")] + notes if text else notes)
+
+
+class JobManager:
+    """Starts background jobs, answers status/output polls and stops everything on exit."""
+    _jobs: Dict[str, BackgroundJob] = {}
+    _counter = 0
+    _lock = threading.Lock()
+    _cleanup_registered = False
+
+    @classmethod
+    def start(cls, command: str, automation_mode: bool = False) -> str:
+        is_safe, reason = is_command_safe(command, automation_mode)
+        if not is_safe:
+            if automation_mode:
+                return "Error: Command blocked by security policy."
+            return f"Error: Command blocked by safety filter. Reason: {reason}"
+        problem = PreflightCheck.check(command)
+        if problem:
+            return problem.replace("the command was not run", "the job was not started")
+        # A job holds the host for a long time, so it is only started while the host is calm
+        cost = AdmissionController.classify(command) if ADMISSION_CONTROL else "light"
+        reasons = AdmissionController.violations(cost, AdmissionController.sample())
+        if reasons:
+            return f"Error: Job not started: the host is too busy for a {cost} command (" + "; ".join(reasons) + "). Try again later."
+        cls._expire()
+        with cls._lock:
+            running = [job for job in cls._jobs.values() if job.running]
+            if len(running) >= MAX_BACKGROUND_JOBS:
+                return (
+                    f"Error: {len(running)} background jobs are already running (limit {MAX_BACKGROUND_JOBS}): "
+                    + ", ".join(job.job_id for job in running)
+                    + ". Wait for one to finish or cancel it with [[JOB_CANCEL: <id>]]."
+                )
+            cls._counter += 1
+            job_id = f"job{cls._counter}"
+            if not cls._cleanup_registered:
+                atexit.register(cls.cleanup)
+                cls._cleanup_registered = True
+        if COMMAND_CACHE and not is_read_only(command):
+            CACHE.invalidate()
+        try:
+            job = BackgroundJob(job_id, command)
+        except OSError as e:
+            if automation_mode:
+                return "Error: Job could not be started."
+            return f"Error starting job: {e}"
+        with cls._lock:
+            cls._jobs[job_id] = job
+        return (
+            f"Started background job {job_id}. Poll it with [[JOB_STATUS: {job_id}]] and "
+            f"[[JOB_OUTPUT: {job_id} 0]]; the full log is handle '{job_id}.out'."
+        )
+
+    @classmethod
+    def _find(cls, job_id: str) -> Optional[BackgroundJob]:
+        job_id = job_id.strip()
+        if job_id.isdigit():
+            job_id = f"job{job_id}"
+        with cls._lock:
+            return cls._jobs.get(job_id)
+
+    @classmethod
+    def _expire(cls):
+        """Stop jobs that have run longer than JOB_TIMEOUT."""
+        with cls._lock:
+            overdue = [job for job in cls._jobs.values() if job.running and time.monotonic() - job.started > JOB_TIMEOUT]
+        for job in overdue:
+            job.stop("timed out")
+
+    @classmethod
+    def status(cls, job_id: str) -> str:
+        cls._expire()
+        if job_id.strip() in ("", "all"):
+            with cls._lock:
+                jobs = list(cls._jobs.values())
+            return "\n".join(job.status() for job in jobs) or "No background jobs."
+        job = cls._find(job_id)
+        return job.status() if job else f"Error: Unknown job '{job_id}'."
+
+    @classmethod
+    def output(cls, args: str) -> str:
+        cls._expire()
+        job_id, _, since = args.strip().partition(" ")
+        job = cls._find(job_id)
+        if job is None:
+            return f"Error: Unknown job '{job_id}'."
+        try:
+            offset = int(since) if since.strip() else 0
+        except ValueError:
+            return "Error: JOB_OUTPUT expects: <id> [byte_offset]"
+        return job.output(offset)
+
+    @classmethod
+    def cancel(cls, job_id: str) -> str:
+        job = cls._find(job_id)
+        if job is None:
+            return f"Error: Unknown job '{job_id}'."
+        job.stop("cancelled")
+        return job.status()
+
+    @classmethod
+    def cleanup(cls):
+        with cls._lock:
+            jobs = list(cls._jobs.values())
+        for job in jobs:
+            job.stop("cancelled")
@@ -0,0 +1,144 @@
+"""
+Results of read-only commands, reused for a short time instead of running the command again.
+"""
+
+import atexit
+import json
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from config import (COMMAND_CACHE_DEFAULT_TTL, COMMAND_CACHE_FILE, COMMAND_CACHE_MAX_ENTRIES,
+                    COMMAND_CACHE_TTLS)
+from osagent_common.safety_policy import command_key
+
+
+def format_age(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class CommandCache:
+    """
+    Results of read-only commands, reused until their TTL (from COMMAND_CACHE_TTLS) runs out.
+
+    Only clean results are stored: exit code 0 and nothing spilled to a handle. Entries are
+    keyed by command_key (whitespace between words collapsed, quoted text kept) and
+    timestamped with wall-clock time so they can be kept in COMMAND_CACHE_FILE between sessions.
+    """
+
+    def __init__(self, path: Optional[str] = COMMAND_CACHE_FILE):
+        self.path = path
+        self.entries: Dict[str, tuple] = {}  # key -> (stored_at, ttl, result)
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self._ttls = [(re.compile(pattern), ttl) for pattern, ttl in COMMAND_CACHE_TTLS]
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @staticmethod
+    def key(command: str) -> str:
+        return command_key(command)
+
+    def ttl_for(self, command: str) -> float:
+        key = self.key(command)
+        for pattern, ttl in self._ttls:
+            if pattern.search(key):
+                return ttl
+        return COMMAND_CACHE_DEFAULT_TTL
+
+    def lookup(self, command: str) -> Optional[str]:
+        """The cached result marked as such, or None on a miss."""
+        key = self.key(command)
+        with self._lock:
+            self._load()
+            entry = self.entries.get(key)
+            now = time.time()
+            if entry is None or now - entry[0] >= entry[1]:
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            stored_at, ttl, result = entry
+            note = (
+                f"[cached result from {format_age(now - stored_at)} ago, valid for "
+                f"{format_age(ttl - (now - stored_at))} more; use [[FRESH: {key}]] (or fresh=true) to re-run. {self._stats()}]"
+            )
+        return f"{note}\n{result}"
+
+    def contains(self, command: str) -> bool:
+        """True if lookup() would hit. Not counted in the statistics."""
+        with self._lock:
+            self._load()
+            entry = self.entries.get(self.key(command))
+            return entry is not None and time.time() - entry[0] < entry[1]
+
+    def store(self, command: str, result: str):
+        ttl = self.ttl_for(command)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._load()
+            if len(self.entries) >= COMMAND_CACHE_MAX_ENTRIES:
+                # Evict the entry closest to expiry
+                del self.entries[min(self.entries, key=lambda k: self.entries[k][0] + self.entries[k][1])]
+            self.entries[self.key(command)] = (time.time(), ttl, result)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._load()
+            self.entries.clear()
+
+    def stats(self) -> str:
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> str:
+        lookups = self.hits + self.misses
+        rate = f"{100 * self.hits / lookups:.0f}%" if lookups else "n/a"
+        return f"Cache: {self.hits} hits / {lookups} lookups ({rate}), {self.bypasses} bypassed, {len(self.entries)} entries."
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        atexit.register(self.save)
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            now = time.time()
+            self.entries = {
+                key: (stored_at, ttl, result)
+                for key, (stored_at, ttl, result) in stored.items()
+                if now - stored_at < ttl
+            }
+        except (OSError, ValueError, TypeError):
+            self.entries = {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            now = time.time()
+            live = {key: entry for key, entry in self.entries.items() if now - entry[0] < entry[1]}
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(live, f)
+        except OSError:
+            pass
+
+
+# Results of read-only commands, shared by every caller (see COMMAND_CACHE)
+CACHE = CommandCache()
@@ -0,0 +1,18 @@
+"""
+The safety policy every command the agent runs or reads through is checked against.
+"""
+
+from config import SAFETY_POLICY_FILE
+from osagent_common.safety_policy import SafetyPolicy
+
+# Dangerous patterns and the automation-mode whitelist (see SAFETY_POLICY_FILE)
+POLICY = SafetyPolicy.load(SAFETY_POLICY_FILE)
+
+
+def is_command_safe(command: str, automation_mode: bool = False) -> tuple[bool, str]:
+    """
+    Check if a command is safe to execute.
+    Returns (is_safe, reason_if_unsafe)
+    """
+    verdict = POLICY.check(command, ("automation",) if automation_mode else ())
+    return verdict.allowed, verdict.reason
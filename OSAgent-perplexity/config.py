@@ -0,0 +1,185 @@
+"""
+Settings of the perplexity agent. main.py and the subsystem modules next to it import the
+settings they use from here.
+"""
+
+import os
+
+API_URL = "http://10.167.32.1:1234/v1/chat/completions"
+MODEL_TEMPERATURE = 0.1
+MODEL_AUTOMATION = False  # Default to ask-first mode for safety
+LOG_DIR = "logs"
+# Knowledge packs (*.yaml, *.yml, *.json) merged over the embedded knowledge base.
+# The directory is watched and changes are picked up between turns without a restart.
+KNOWLEDGE_DIR = "knowledge"
+KNOWLEDGE_POLL_INTERVAL = 5  # Seconds between directory scans when inotify is unavailable
+KNOWLEDGE_RELOAD_DEBOUNCE = 0.5  # Seconds to let a burst of file events settle before rebuilding
+# Command output capture: only a bounded head/tail view is kept in memory and shown to the
+# model; anything beyond it is spilled to a temp file referenced by a handle.
+COMMAND_TIMEOUT = 30  # Seconds
+# Per-command timeouts: (regex, wall-clock seconds, idle seconds or None, max extensions).
+# A command that printed something within TIMEOUT_PROGRESS_WINDOW seconds when its
+# wall-clock limit is reached gets TIMEOUT_EXTENSION more seconds, up to max extensions times.
+# Idle = no output at all for that long. Unlisted commands use the defaults below.
+COMMAND_IDLE_TIMEOUT = 20
+COMMAND_MAX_EXTENSIONS = 2
+TIMEOUT_EXTENSION = 30
+TIMEOUT_PROGRESS_WINDOW = 5
+TIMEOUT_PROFILES = [
+    (r"^(apt|apt-get)\s+(update|upgrade|full-upgrade|dist-upgrade|install|reinstall|remove|purge|autoremove)\b", 120, 60, 6),
+    (r"^snap\s+(install|refresh|remove)\b", 180, 90, 4),
+    (r"^journalctl\b", 60, 20, 4),
+    (r"^(ping|arping|traceroute|tracepath|mtr)\b", 15, 5, 0),
+    (r"^(top|vmstat|iostat|mpstat)\b", 20, 10, 0),
+    (r"^(du|md5sum|sha\d*sum|sleep)\b", 60, None, 0),  # Silent until they finish
+    (r"^(find|grep|rgrep|tar)\b", 60, 30, 2),
+]
+TIMEOUT_LOG = os.path.join(LOG_DIR, "timeouts.jsonl")  # One JSON line per command outcome, for tuning
+OUTPUT_HEAD_BYTES = 8 * 1024
+OUTPUT_TAIL_BYTES = 8 * 1024
+OUTPUT_SPILL_DIR = None  # None = system temp directory
+OUTPUT_SPILL_MAX_BYTES = 256 * 1024 * 1024  # Cap per stream so a runaway command cannot fill the disk
+# Run commands in one long-lived bash worker instead of a fresh /bin/sh per command.
+# Keeps cd, exported variables and shell functions between steps.
+PERSISTENT_SHELL = False
+PERSISTENT_SHELL_PATH = "/bin/bash"
+# Answer a few very common read-only commands (free, uptime, nproc, df, ps aux, cat /proc/...)
+# in-process from /proc and statvfs instead of forking a shell and a binary.
+FAST_PATHS = True
+# Rewrite the padded tables of a few verbose commands (df, free, ps, ss, systemctl list-units,
+# dpkg -l) as compact, column-pruned tables before the model sees them. The untouched output
+# stays readable through a [[READ: ...]] handle.
+COMPACT_OUTPUT = True
+COMPACT_OUTPUT_FORMAT = "tsv"  # "tsv" (header line + tab-separated rows) or "json"
+COMPACT_MAX_CELL_CHARS = 100  # Longer cells (command lines, descriptions) are cut
+COMPACT_MAX_INPUT_BYTES = 4 * 1024 * 1024  # Larger outputs are left as they are
+# Fold log output (journalctl, dmesg, reads of /var/log) into templates with counts, first/last
+# timestamps and an example each, mined in one pass (Drain). Variable parts become <*>.
+LOG_MINING = True
+LOG_MINING_MIN_LINES = 40  # Shorter logs are passed through as they are
+LOG_MINING_SIMILARITY = 0.5  # Fraction of tokens a line must share with a template to join it
+LOG_MINING_DEPTH = 2  # Leading tokens (after the length) that route a line through the parse tree
+LOG_MINING_MAX_CHILDREN = 100  # Per tree node; further distinct tokens share a <*> branch
+LOG_MINING_MAX_TEMPLATES = 1000  # Memory bound; lines that fit none once full are counted as "other"
+LOG_MINING_SHOW_TEMPLATES = 60  # The most frequent ones are listed, in order of first appearance
+# Check each command before starting it: shell syntax (sh -n with the shell that will run it)
+# and that every program it calls exists, from a PATH index rebuilt only when a PATH directory
+# changes. A failure comes back at once, with installed alternatives, instead of costing a run.
+PREFLIGHT_CHECKS = True
+PREFLIGHT_TOOLS_IN_PROMPT = True  # Tell the model which commonly used tools are (not) installed
+CANCEL_GRACE_PERIOD = 2  # Seconds between SIGTERM and SIGKILL when stopping a command and its children
+# Resource limits for agent-issued commands: "heavy" = only commands COMMAND_COST_CLASSES rates
+# heavy, and background jobs; "all" = every command (and the PERSISTENT_SHELL worker); None = off.
+# Applied through a transient systemd scope (cgroup v2) when available, otherwise through nice/ionice.
+RESOURCE_LIMITS = "heavy"
+LIMIT_CPU_PERCENT = 50  # Percent of one CPU (cgroup only); None = unlimited, as for the other limits
+LIMIT_MEMORY_BYTES = 1024 * 1024 * 1024  # cgroup memory.max
+LIMIT_IO_WEIGHT = 10  # cgroup io.weight, 1-10000 (default 100); fallback runs at lowest best-effort I/O priority
+LIMIT_PIDS = 256  # cgroup pids.max
+LIMIT_FALLBACK_NICE = 10
+# Without cgroups, also apply LIMIT_MEMORY_BYTES and LIMIT_PIDS through prlimit. Off by default: the
+# address-space cap stops JVMs, Go binaries and threaded programs well below that much RSS, and
+# RLIMIT_NPROC counts every process of the user, so forks fail on a busy desktop session.
+LIMIT_FALLBACK_PRLIMIT = False
+# Admission control: commands of a costly class only start while the host is below that
+# class's thresholds. Otherwise they wait (up to ADMISSION_MAX_WAIT) and are then rejected.
+ADMISSION_CONTROL = True
+COMMAND_COST_CLASSES = [  # First matching regex (per pipeline segment) wins; unmatched = "light"
+    (r"^(find|du|updatedb|locate|rsync|tar|zip|gzip|bzip2|xz|zstd|md5sum|sha\d*sum|rgrep|fio|stress|make)\b", "heavy"),
+    (r"^(grep|egrep|fgrep)\s+(.*\s)?-\w*[rR]", "heavy"),
+    (r"^(apt|apt-get|dpkg|snap|journalctl|docker|pip|pip3|npm|iostat|lsof)\b", "medium"),
+]
+ADMISSION_THRESHOLDS = {  # A class may start only while every reading is within its limits
+    "heavy": {"load_per_cpu": 1.0, "cpu_pressure": 25, "io_pressure": 10, "memory_pressure": 5, "min_memory_available": 15},
+    "medium": {"load_per_cpu": 2.0, "cpu_pressure": 50, "io_pressure": 30, "memory_pressure": 20, "min_memory_available": 5},
+}
+ADMISSION_HEAVY_SLOTS = 1  # Heavy commands queue for these slots, even within a parallel batch
+ADMISSION_MAX_WAIT = 20  # Seconds
+ADMISSION_POLL_INTERVAL = 2  # Seconds
+# Several tool tags in one response: read-only ones run concurrently on a bounded pool
+MAX_PARALLEL_COMMANDS = 4
+# Ask-first mode: start light commands of the shapes below (at most MAX_PARALLEL_COMMANDS) while
+# the operator is still reading them. Their output is used only once they are approved; on "n"
+# the run is stopped and its output deleted. Never used with PERSISTENT_SHELL.
+SPECULATIVE_EXECUTION = True
+# The only commands started before approval: a bare program name followed by plain words, with
+# no pipes, redirections, expansions, quotes or wrappers. program: (single-letter flags, long
+# options, flags that take a value, maximum number of operands)
+SPECULATIVE_COMMANDS = {
+    "ls": ("aAdFhilrRSt1", {"--all", "--almost-all", "--human-readable", "--inode"}, "", 4),
+    "cat": ("nbsAETv", set(), "", 4),
+    "head": ("qv", set(), "nc", 4),
+    "tail": ("qv", set(), "nc", 4),
+    "wc": ("lwcmL", set(), "", 4),
+    "stat": ("L", set(), "", 4),
+    "du": ("sahcx", {"--max-depth", "--summarize", "--human-readable"}, "d", 4),
+    "df": ("ahiklPT", {"--human-readable"}, "t", 4),
+    "free": ("bkmghtw", {"--human"}, "", 0),
+    "ps": ("aefluxwH", set(), "", 1),
+    "lsblk": ("abfmp", set(), "o", 1),
+    "uname": ("amnoprsv", set(), "", 0),
+    "uptime": ("ps", set(), "", 0),
+    "hostname": ("AfIis", set(), "", 0),
+    "date": ("IRu", set(), "", 0),
+    "id": ("Ggnru", set(), "", 1),
+    "which": ("a", set(), "", 4),
+    "whoami": ("", set(), "", 0),
+    "pwd": ("LP", set(), "", 0),
+    "nproc": ("", {"--all"}, "", 0),
+}
+# Ask-first mode: when a response holds several requests that need approval, list them as a
+# numbered plan and ask once ("y", "n", or the steps to run, e.g. "1,3-4") instead of per request
+BATCH_APPROVAL = True
+MAX_TOOL_REQUESTS_PER_RESPONSE = 10
+# Reuse results of read-only commands for a while. TTLs are matched against the command
+# line in order (first match wins); 0 means never cache. Any command that may change the
+# system empties the cache.
+COMMAND_CACHE = True
+COMMAND_CACHE_FILE = None  # e.g. "command_cache.json" to keep cached facts between sessions
+COMMAND_CACHE_MAX_ENTRIES = 256
+COMMAND_CACHE_DEFAULT_TTL = 5  # Seconds, for read-only commands not listed below
+COMMAND_CACHE_TTLS = [
+    (r"^(uname|arch|nproc|lscpu|lsmem|lspci|lsusb|lsb_release|hostnamectl)\b", 6 * 3600),
+    (r"^cat\s+/(etc/(os-release|lsb-release|debian_version)|proc/cpuinfo)\s*$", 6 * 3600),
+    (r"^(dpkg|apt|snap|which|whereis|getent|id|groups)\b", 300),
+    (r"^(date|sleep|ping|top|vmstat|iostat|mpstat|dig|host|nslookup)\b", 0),
+    (r"^(df|du|free|uptime|ps|w|who|ip|ss|netstat|systemctl|journalctl|dmesg)\b", 10),
+]
+# A command repeated within a session, or on a later --loop-prompt iteration, only sends what
+# changed since its last run: a unified diff, or "unchanged since HH:MM". The full output stays
+# readable by handle.
+DELTA_OUTPUT = True
+DELTA_MAX_CHANGED_RATIO = 0.3  # Above this share of changed lines the full output is sent again
+DELTA_CONTEXT_LINES = 1
+DELTA_MAX_COMMANDS = 128  # Outputs remembered; the oldest is forgotten first
+# --loop-prompt keeps the outputs between iterations and shows the latest ones, newest first and up to
+# this size, to the next iteration; outputs beyond it are forgotten and sent in full when run again
+DELTA_CARRY_MAX_BYTES = 16 * 1024
+# Background jobs ([[JOB: ...]]) for commands that outlive COMMAND_TIMEOUT
+MAX_BACKGROUND_JOBS = 3  # Running at the same time
+JOB_TIMEOUT = 3600  # Seconds before a job is stopped
+JOB_BUFFER_BYTES = 256 * 1024  # Recent output kept in memory per job; the full log is spilled to a file
+JOB_OUTPUT_MAX_BYTES = 8 * 1024  # Returned per [[JOB_OUTPUT: ...]] request
+# [[HELP: <command> [flag|keyword]]]: option lines from the command's man page, indexed per
+# command on first use and kept on disk until the package database changes.
+HELP_INDEX_FILE = "help_index.json"  # None = keep the index in memory only
+HELP_MAN_PATH = ["/usr/local/share/man", "/usr/share/man"]
+HELP_MAX_MATCHES = 12  # Option lines returned per query
+HELP_MAX_DESCRIPTION = 200  # Characters kept per option description
+# Commands without a man page whose '--help' output may be read instead. Lookups need no approval,
+# so only list programs known to print help and exit; anything else is a normal approved command.
+HELP_RUN_COMMANDS = set()
+# Offer the tools through the OpenAI 'tools' API and act on structured 'tool_calls'.
+# The [[EXEC: ...]] text protocol remains the fallback for servers without tool support.
+NATIVE_TOOL_CALLS = False
+# Paged reader ([[READ: ...]] / [[SEARCH: ...]]) for spilled output and files
+READ_DEFAULT_LINES = 50
+READ_MAX_LINES = 200
+READ_MAX_LINE_CHARS = 500
+READ_INDEX_STRIDE = 64  # Keep one newline-index entry per this many lines
+SEARCH_MAX_MATCHES = 30
+# Dangerous patterns and the automation-mode whitelist, compiled once into a single matcher
+SAFETY_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_policy.yaml")
+# Automation mode restrictions
+AUTOMATION_MAX_COMMANDS_PER_MINUTE = 10  # Rate limiting
+AUTOMATION_REQUIRED_CONFIRMATION_INTERVAL = 5  # Require reconfirmation after N commands in automation mode
@@ -0,0 +1,342 @@
+"""
+In-process answers for common read-only diagnostics (free, uptime, nproc, df, ps aux, /proc files).
+"""
+
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+from config import FAST_PATHS
+
+
+class FastPath:
+    """
+    In-process answers for common read-only diagnostics, formatted like procps-ng 4 and
+    GNU coreutils 9 print them.
+
+    Only exact, known forms are handled (e.g. 'free -h', 'df', 'ps aux',
+    'cat /proc/loadavg'); run() returns None for anything else, including unknown
+    options, so the command falls through to the real binary.
+    """
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    PAGE_KB = os.sysconf("SC_PAGE_SIZE") // 1024
+    # Filesystem types df treats as dummies (gnulib ME_DUMMY)
+    DUMMY_FILESYSTEMS = frozenset({
+        "autofs", "proc", "subfs", "debugfs", "devpts", "fusectl", "fuse.portal", "mqueue",
+        "rpc_pipefs", "sysfs", "devfs", "kernfs", "ignore", "none", "rootfs",
+    })
+
+    @classmethod
+    def run(cls, command: str) -> Optional[str]:
+        if not FAST_PATHS or any(c in command for c in "|;&<>$`*?~\\'\"\n"):
+            return None
+        parts = command.split()
+        if not parts:
+            return None
+        handler = {
+            "free": cls._free,
+            "uptime": cls._uptime,
+            "nproc": cls._nproc,
+            "df": cls._df,
+            "ps": cls._ps,
+            "cat": cls._cat,
+        }.get(parts[0])
+        if handler is None:
+            return None
+        try:
+            return handler(parts[1:])
+        except (OSError, ValueError, KeyError, IndexError):
+            return None  # Let the real binary deal with (and report) anything unusual
+
+    @staticmethod
+    def _meminfo() -> Dict[str, int]:
+        meminfo = {}
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                meminfo[name] = int(value.split()[0])
+        return meminfo
+
+    @staticmethod
+    def _free_human(kib: int) -> str:
+        """procps-ng scale_size: at most 4 characters before the 'i'."""
+        size = kib * 1024
+        if size < 1024:
+            return f"{size}B"
+        for power, unit in enumerate("KMGTPE", start=1):
+            value = size / 1024 ** power
+            text = f"{value:.1f}{unit}"
+            if len(text) <= 4:
+                return text + "i"
+            text = f"{int(value)}{unit}"
+            if len(text) <= 4:
+                return text + "i"
+        return f"{size}B"
+
+    @classmethod
+    def _free(cls, args: List[str]) -> Optional[str]:
+        scales = {(): 1, ("-k",): 1, ("--kibi",): 1, ("-b",): None, ("-m",): 1024, ("-g",): 1024 * 1024, ("-h",): 0}
+        if tuple(args) not in scales:
+            return None
+        scale = scales[tuple(args)]
+        meminfo = cls._meminfo()
+        total = meminfo["MemTotal"]
+        available = meminfo.get("MemAvailable", meminfo["MemFree"])
+        buff_cache = meminfo["Buffers"] + meminfo["Cached"] + meminfo.get("SReclaimable", 0)
+        mem = [total, total - available, meminfo["MemFree"], meminfo.get("Shmem", 0), buff_cache, available]
+        swap = [meminfo["SwapTotal"], meminfo["SwapTotal"] - meminfo["SwapFree"], meminfo["SwapFree"]]
+
+        def fmt(kib: int) -> str:
+            if scale == 0:
+                return cls._free_human(kib)
+            if scale is None:
+                return str(kib * 1024)
+            return str(kib // scale)
+
+        lines = ["               total        used        free      shared  buff/cache   available"]
+        lines.append("Mem:    " + "".join(f"{fmt(v):>12}" for v in mem))
+        lines.append("Swap:   " + "".join(f"{fmt(v):>12}" for v in swap))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _count_users() -> int:
+        if os.path.isdir("/run/systemd/system") and os.path.isdir("/run/systemd/sessions"):
+            return sum(1 for name in os.listdir("/run/systemd/sessions") if not name.endswith(".ref"))
+        try:
+            with open("/var/run/utmp", "rb") as f:
+                data = f.read()
+        except OSError:
+            return 0
+        users = 0
+        for offset in range(0, len(data) - 383, 384):  # struct utmp on Linux
+            ut_type = int.from_bytes(data[offset:offset + 2], sys.byteorder)
+            if ut_type == 7 and data[offset + 44] != 0:  # USER_PROCESS with a non-empty ut_user
+                users += 1
+        return users
+
+    @classmethod
+    def _uptime(cls, args: List[str]) -> Optional[str]:
+        if args:
+            return None
+        with open("/proc/uptime", "r") as f:
+            seconds = int(float(f.read().split()[0]))
+        days, rest = divmod(seconds, 86400)
+        hours, minutes = rest // 3600, rest % 3600 // 60
+        text = time.strftime(" %H:%M:%S up ")
+        if days:
+            text += f"{days} {'days' if days > 1 else 'day'}, "
+        text += f"{hours:2d}:{minutes:02d}, " if hours else f"{minutes} min, "
+        users = cls._count_users()
+        load1, load5, load15 = os.getloadavg()
+        text += f"{users:2d} {'users' if users > 1 else 'user'},  load average: {load1:.2f}, {load5:.2f}, {load15:.2f}"
+        return text + "\n"
+
+    @staticmethod
+    def _nproc(args: List[str]) -> Optional[str]:
+        if os.environ.get("OMP_NUM_THREADS") or os.environ.get("OMP_THREAD_LIMIT"):
+            return None
+        if not args:
+            return f"{len(os.sched_getaffinity(0))}\n"
+        if args == ["--all"]:
+            return f"{os.sysconf('SC_NPROCESSORS_CONF')}\n"
+        return None
+
+    @staticmethod
+    def _cat(args: List[str]) -> Optional[str]:
+        # One absolute /proc or /sys file; /proc/self would describe the agent, not cat
+        if len(args) != 1 or not re.match(r"^/(proc|sys)/", args[0]) or "self" in args[0]:
+            return None
+        if not os.path.isfile(args[0]):
+            return None
+        with open(args[0], "rb") as f:
+            return f.read().decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _df_human(size: int) -> str:
+        """coreutils human_readable with -h: powers of 1024, rounded up, one decimal below 10."""
+        if size < 1024:
+            return str(size)
+        exponent = 1
+        while size >= 1024 ** (exponent + 1) and exponent < 8:
+            exponent += 1
+        unit = 1024 ** exponent
+        tenths = -(-size * 10 // unit)
+        if tenths < 100:
+            return f"{tenths // 10}.{tenths % 10}{'KMGTPEZY'[exponent - 1]}"
+        whole = -(-size // unit)
+        if whole >= 1024 and exponent < 8:
+            return f"1.0{'KMGTPEZY'[exponent]}"
+        return f"{whole}{'KMGTPEZY'[exponent - 1]}"
+
+    @staticmethod
+    def _mounts() -> List[tuple]:
+        """(source, mount point, fs type) from /proc/self/mountinfo, in mount order."""
+        def unescape(text: str) -> str:
+            return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), text)
+
+        mounts = []
+        with open("/proc/self/mountinfo", "r") as f:
+            for line in f:
+                left, _, right = line.partition(" - ")
+                fields, tail = left.split(), right.split()
+                mounts.append((unescape(tail[1]), unescape(fields[4]), tail[0]))
+        return mounts
+
+    @classmethod
+    def _df(cls, args: List[str]) -> Optional[str]:
+        human = False
+        paths = []
+        for arg in args:
+            if arg == "-h":
+                human = True
+            elif arg.startswith("-"):
+                return None
+            elif arg.startswith("/"):
+                paths.append(arg)
+            else:
+                return None  # Relative paths depend on the shell's working directory
+        mounts = cls._mounts()
+        if paths:
+            selected = []
+            for path in paths:
+                real = os.path.realpath(path)
+                os.stat(real)  # Missing paths: let df report the error
+                best = None
+                for mount in mounts:
+                    point = mount[1]
+                    if real == point or real.startswith(point.rstrip("/") + "/"):
+                        if best is None or len(point) >= len(best[1]):
+                            best = mount
+                selected.append((best, os.statvfs(real)))
+        else:
+            chosen: Dict[int, int] = {}  # st_dev -> index into entries
+            entries = []
+            for mount in mounts:
+                source, point, fstype = mount
+                if fstype in cls.DUMMY_FILESYSTEMS:
+                    continue
+                try:
+                    device = os.stat(point).st_dev
+                    stats = os.statvfs(point)
+                except OSError:
+                    continue
+                if stats.f_blocks == 0:
+                    continue
+                if device in chosen:
+                    previous = entries[chosen[device]][0]
+                    # Same device mounted twice: keep the "real" device or the one nearer the root
+                    if ("/" in source and "/" not in previous[0]) or len(previous[1]) > len(point) or (
+                        source != previous[0] and point == previous[1]
+                    ):
+                        entries[chosen[device]] = (mount, stats)
+                    continue
+                chosen[device] = len(entries)
+                entries.append((mount, stats))
+            selected = entries
+
+        header = ["Filesystem", "Size" if human else "1K-blocks", "Used", "Avail" if human else "Available", "Use%", "Mounted on"]
+        rows = []
+        for (source, point, _), stats in selected:
+            size = stats.f_blocks * stats.f_frsize
+            used = (stats.f_blocks - stats.f_bfree) * stats.f_frsize
+            avail = stats.f_bavail * stats.f_frsize
+            if human:
+                numbers = [cls._df_human(size), cls._df_human(used), cls._df_human(avail)]
+            else:
+                numbers = [str(-(-value // 1024)) for value in (size, used, avail)]
+            if used + avail:
+                percent = f"{-(-used * 100 // (used + avail))}%"
+            else:
+                percent = "-"
+            rows.append([source] + numbers + [percent, point])
+        minimums = [14, 5, 5, 5, 4, 0]
+        widths = [max([minimums[i], len(header[i])] + [len(row[i]) for row in rows]) for i in range(6)]
+
+        def line(cells: List[str]) -> str:
+            out = [cells[0].ljust(widths[0])] + [cells[i].rjust(widths[i]) for i in range(1, 5)] + [cells[5]]
+            return " ".join(out)
+
+        return "\n".join(line(cells) for cells in [header] + rows) + "\n"
+
+    @staticmethod
+    def _tty_name(tty_nr: int) -> str:
+        if tty_nr == 0:
+            return "?"
+        major, minor = (tty_nr >> 8) & 0xFFF, (tty_nr & 0xFF) | ((tty_nr >> 12) & 0xFFF00)
+        if 136 <= major <= 143:
+            return f"pts/{minor + (major - 136) * 256}"
+        if major == 4:
+            return f"tty{minor}" if minor < 64 else f"ttyS{minor - 64}"
+        return "?"
+
+    @classmethod
+    def _ps(cls, args: List[str]) -> Optional[str]:
+        if args not in (["aux"], ["-aux"]):
+            return None
+        import pwd
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        with open("/proc/stat", "r") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime "))
+        mem_total = cls._meminfo()["MemTotal"]
+        now = time.time()
+        users: Dict[int, str] = {}
+        with open("/proc/sys/kernel/pid_max", "r") as f:
+            pid_width = max(5, len(f.read().strip()))
+        lines = [f"USER     {'PID':>{pid_width}} %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND"]
+        for entry in sorted((int(name) for name in os.listdir("/proc") if name.isdigit())):
+            try:
+                with open(f"/proc/{entry}/stat", "rb") as f:
+                    stat = f.read().decode("utf-8", errors="replace")
+                with open(f"/proc/{entry}/cmdline", "rb") as f:
+                    cmdline = f.read()
+                uid = os.stat(f"/proc/{entry}").st_uid
+                locked = False
+                with open(f"/proc/{entry}/status", "r") as f:
+                    for status_line in f:
+                        if status_line.startswith("VmLck:"):
+                            locked = int(status_line.split()[1]) > 0
+                            break
+            except (OSError, ValueError):
+                continue  # Exited while we were reading it
+            comm = stat[stat.index("(") + 1:stat.rindex(")")]
+            fields = stat[stat.rindex(")") + 2:].split()
+            state, pgrp, session, tty_nr, tpgid = fields[0], int(fields[2]), int(fields[3]), int(fields[4]), int(fields[5])
+            utime, stime, nice, threads = int(fields[11]), int(fields[12]), int(fields[16]), int(fields[17])
+            start_ticks, vsize, rss = int(fields[19]), int(fields[20]), int(fields[21])
+
+            total_ticks = utime + stime
+            elapsed = int(uptime - start_ticks / cls.CLOCK_TICKS)
+            pcpu = min(999, (total_ticks * 1000 // cls.CLOCK_TICKS) // elapsed) if elapsed > 0 else 0
+            rss_kb = rss * cls.PAGE_KB
+            pmem = rss_kb * 1000 // mem_total
+            flags = state
+            flags += "<" if nice < 0 else "N" if nice > 0 else ""
+            flags += "L" if locked else ""
+            flags += "s" if session == entry else ""
+            flags += "l" if threads > 1 else ""
+            flags += "+" if tpgid == pgrp and tty_nr else ""
+            started = boot_time + start_ticks / cls.CLOCK_TICKS
+            if now - started > 365 * 86400:
+                start = time.strftime(" %Y", time.localtime(started))
+            elif now - started > 86400:
+                start = time.strftime("%b%d", time.localtime(started))
+            else:
+                start = time.strftime("%H:%M", time.localtime(started))
+            cpu_seconds = total_ticks // cls.CLOCK_TICKS
+            if uid not in users:
+                try:
+                    name = pwd.getpwuid(uid).pw_name
+                except KeyError:
+                    name = str(uid)
+                users[uid] = name if len(name) <= 8 else name[:7] + "+"
+            command = cmdline.replace(b"\0", b" ").decode("utf-8", errors="replace").strip() or f"[{comm}]"
+            command = re.sub(r"[\x00-\x1f\x7f]", "?", command)  # ps shows control characters as '?'
+            lines.append(
+                f"{users[uid]:<8} {entry:>{pid_width}} {pcpu // 10:2d}.{pcpu % 10} {pmem // 10:2d}.{pmem % 10} "
+                f"{vsize // 1024:>6} {rss_kb:>5} {cls._tty_name(tty_nr):<8} {flags:<4} {start:>5} "
+                f"{cpu_seconds // 60:>3}:{cpu_seconds % 60:02d} {command}"
+            )
+        return "\n".join(lines) + "\n"
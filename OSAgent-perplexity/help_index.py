@@ -0,0 +1,304 @@
+"""
+Option lists of installed commands, parsed from their man pages (or --help), for [[HELP: ...]] lookups.
+"""
+
+import json
+import os
+import re
+import shlex
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+from command_policy import is_command_safe
+from config import HELP_INDEX_FILE, HELP_MAN_PATH, HELP_MAX_DESCRIPTION, HELP_MAX_MATCHES, HELP_RUN_COMMANDS
+from preflight import PreflightCheck
+from running_command import CommandCancelled, RunningCommand
+
+
+class HelpIndex:
+    """
+    Synopsis and option list of installed commands, for [[HELP: ...]] queries that return
+    only the relevant option lines instead of a whole man page.
+
+    Man pages are parsed in-process (man(7) and the common mdoc(7) list macros), so nothing
+    is executed. Without a man page, '<command> --help' is run under the usual resource limits
+    only for commands listed in HELP_RUN_COMMANDS, since lookups skip approval. Entries are
+    built on first query and saved to HELP_INDEX_FILE, which is discarded when dpkg's status
+    file changes (a package was installed or removed).
+    """
+    DPKG_STATUS = "/var/lib/dpkg/status"
+    _FONT_MACROS = {"B": " ", "I": " ", "SM": " ", "SB": " ", "BR": "", "RB": "", "IR": "", "RI": "", "BI": "", "IB": ""}
+    _BREAKS = frozenset({"PP", "P", "LP", "Pp", "sp", "br", "SS", "Ss", "RE", "El"})
+    _SPECIAL = {"aq": "'", "lq": '"', "rq": '"', "dq": '"', "oq": "'", "cq": "'", "em": "--", "en": "-",
+                "hy": "-", "mi": "-", "bu": "*", "ti": "~", "ha": "^", "co": "(c)", "rg": "(R)"}
+    _ESCAPE = re.compile(r"\\(f(?:\[[^\]]*\]|\(..|.)|s[+-]?\d+|\*(?:\[[^\]]*\]|\(..|.)|\(..|\[[^\]]*\]|.)")
+    _FLAG = re.compile(r"(?<![\w-])([-+]{1,2}[A-Za-z0-9?#@][\w-]*)")
+    _entries: Dict[str, Dict] = {}
+    _stamp = None  # dpkg status mtime the entries belong to
+    _loaded = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def _roff_text(cls, text: str) -> str:
+        def replace(match):
+            escape = match.group(1)
+            if escape[0] in "fs*":
+                return ""  # Font, size and string changes
+            if escape[0] == "(":
+                return cls._SPECIAL.get(escape[1:], "")
+            if escape[0] == "[":
+                return cls._SPECIAL.get(escape[1:-1], "")
+            return {"-": "-", "e": "\\", " ": " ", "~": " ", "0": " ", "t": " "}.get(escape, "" if escape in "&|^,/c%:)" else escape)
+
+        text = re.sub(r"(?<!\\)\\$", "", text.split('\\"')[0])  # Trailing '\': continued on the next line
+        return cls._ESCAPE.sub(replace, text)
+
+    @staticmethod
+    def _mdoc_text(args: List[str]) -> str:
+        """Text of mdoc inline macros such as 'Fl a Ar file' -> '-a file'."""
+        words, flag = [], False
+        for arg in args:
+            if arg == "Fl":
+                flag = True
+            elif re.fullmatch(r"[A-Z][a-z]{1,2}", arg):
+                continue  # Ar, Op, Oo, Oc, Ns, Cm, Pa, Li, Xo, ...
+            else:
+                words.append(("-" if flag else "") + arg)
+                flag = False
+        return " ".join(words + (["-"] if flag else []))
+
+    @classmethod
+    def parse_man(cls, source: str) -> Dict:
+        section, synopsis, options = "", [""], []
+        current = None  # [tag, description lines] of the option being read
+        tag_next = False
+        for raw in source.splitlines():
+            if raw.startswith((".\\\"", "'\\\"")):
+                continue
+            if raw.startswith((".", "'")):
+                name, _, rest = raw[1:].strip().partition(" ")
+                args = [quoted or plain for quoted, plain in re.findall(r'"((?:[^"]|"")*)"|(\S+)', rest)]
+                if name in ("SH", "Sh"):
+                    section, current = " ".join(args).upper(), None
+                    continue
+                if name in ("TP", "HP"):  # The tag is on the next line (HP: help2man pages)
+                    tag_next, current = True, None
+                    continue
+                if name == "IP" and not args:
+                    continue  # Indented paragraph continuing the current option
+                if name in ("IP", "It"):
+                    tag = cls._roff_text(args[0]) if name == "IP" and args else cls._mdoc_text(args)
+                    current = cls._start_option(options, tag.strip())
+                    continue
+                if name in cls._BREAKS:
+                    current = None if name not in ("br", "sp") else current
+                    if section == "SYNOPSIS" and synopsis[-1]:
+                        synopsis.append("")
+                    continue
+                if name in cls._FONT_MACROS:
+                    text = cls._FONT_MACROS[name].join(args)
+                elif name in ("Nm", "Fl", "Ar", "Op", "Cm", "Pa"):
+                    text = cls._mdoc_text([name] + args)
+                else:
+                    continue  # Layout requests (.RS, .nf, .in, .TH, ...) carry no text
+            else:
+                text = raw
+            text = cls._roff_text(text).strip()
+            if not text:
+                continue
+            if tag_next:
+                tag_next = False
+                current = cls._start_option(options, text)
+            elif section == "SYNOPSIS":
+                synopsis[-1] = (synopsis[-1] + " " + text).strip()
+            elif current is not None:
+                current[1].append(text)
+        return {
+            "source": "man page",
+            "synopsis": [line for line in synopsis if line][:8],
+            "options": [[tag, " ".join(lines)[:HELP_MAX_DESCRIPTION]] for tag, lines in options],
+        }
+
+    @staticmethod
+    def _start_option(options: List, tag: str) -> Optional[List]:
+        if not tag.startswith(("-", "+")):
+            return None  # A tagged paragraph that is not an option (a file, a command, ...)
+        option = [tag, []]
+        options.append(option)
+        return option
+
+    @staticmethod
+    def parse_help(text: str) -> Dict:
+        synopsis, options = [], []
+        current, indent = None, 0
+        for line in text.expandtabs().splitlines():
+            stripped = line.strip()
+            lead = len(line) - len(line.lstrip())
+            if not stripped:
+                current = None
+            elif re.match(r"^usage:", stripped, re.IGNORECASE) and len(synopsis) < 8:
+                synopsis.append(stripped)
+                current = None
+            elif lead <= 12 and re.match(r"^(-{1,2}|\+)[A-Za-z0-9?#@]", stripped):
+                parts = re.split(r"\s{2,}", stripped, 1)
+                current = [parts[0], parts[1:]]
+                indent = lead
+                options.append(current)
+            elif current is not None and lead > indent:
+                current[1].append(stripped)
+            else:
+                current = None
+        return {
+            "source": "--help",
+            "synopsis": synopsis,
+            "options": [[tag, " ".join(lines)[:HELP_MAX_DESCRIPTION]] for tag, lines in options],
+        }
+
+    @staticmethod
+    def _man_page(command: str) -> Optional[str]:
+        for root in HELP_MAN_PATH:
+            for section in ("1", "8", "6"):
+                for name in (f"{command}.{section}", f"{command}.{section}.gz"):
+                    path = os.path.join(root, f"man{section}", name)
+                    if not os.path.isfile(path):
+                        continue
+                    for _ in range(3):  # Follow '.so man1/other.1' redirections
+                        if path.endswith(".gz"):
+                            import gzip
+                            with gzip.open(path, "rb") as f:
+                                source = f.read().decode("utf-8", errors="replace")
+                        else:
+                            with open(path, "rb") as f:
+                                source = f.read().decode("utf-8", errors="replace")
+                        target = re.match(r"^\.so\s+(\S+)", source)
+                        if not target:
+                            return source
+                        path = os.path.join(root, target.group(1))
+                        if not os.path.isfile(path) and os.path.isfile(path + ".gz"):
+                            path += ".gz"
+                    return None
+        return None
+
+    @classmethod
+    def _help_output(cls, command: str) -> Optional[str]:
+        program = PreflightCheck.path_index().get(command)
+        if program is None or command not in HELP_RUN_COMMANDS:
+            return None
+        line = f"{shlex.quote(program)} --help"
+        if not is_command_safe(line)[0]:
+            return None
+        try:
+            _, stdout, stderr = RunningCommand(line, 5).start().wait()
+        except (subprocess.TimeoutExpired, CommandCancelled, OSError):
+            return None
+        text = stdout.complete_text(1024 * 1024) or ""
+        if "-" not in text:
+            text = stderr.complete_text(1024 * 1024) or ""  # Some tools print usage to stderr
+        stdout.discard(force=True)
+        stderr.discard(force=True)
+        return text or None
+
+    @classmethod
+    def _build(cls, command: str) -> Optional[Dict]:
+        source = cls._man_page(command)
+        if source is not None:
+            entry = cls.parse_man(source)
+            if entry["options"]:
+                return entry
+        text = cls._help_output(command)
+        if text is not None:
+            entry = cls.parse_help(text)
+            if entry["options"] or entry["synopsis"]:
+                return entry
+        return None
+
+    @classmethod
+    def _sync(cls):
+        """Load the on-disk index once, and drop everything when the package database changed."""
+        try:
+            stamp = os.stat(cls.DPKG_STATUS).st_mtime_ns
+        except OSError:
+            stamp = None
+        if not cls._loaded:
+            cls._loaded = True
+            cls._stamp = stamp
+            if HELP_INDEX_FILE and os.path.exists(HELP_INDEX_FILE):
+                try:
+                    with open(HELP_INDEX_FILE, "r", encoding="utf-8") as f:
+                        saved = json.load(f)
+                    if saved.get("dpkg_status") == stamp:
+                        cls._entries = saved.get("entries", {})
+                except (OSError, ValueError, AttributeError):
+                    pass
+        if stamp != cls._stamp:
+            cls._entries, cls._stamp = {}, stamp
+
+    @classmethod
+    def _save(cls):
+        if not HELP_INDEX_FILE:
+            return
+        try:
+            temporary = HELP_INDEX_FILE + ".tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump({"dpkg_status": cls._stamp, "entries": cls._entries}, f)
+            os.replace(temporary, HELP_INDEX_FILE)
+        except OSError:
+            pass
+
+    @classmethod
+    def entry(cls, command: str) -> Optional[Dict]:
+        with cls._lock:
+            cls._sync()
+            if command in cls._entries:
+                return cls._entries[command]
+        entry = cls._build(command)
+        with cls._lock:
+            cls._entries[command] = entry  # None too: no help is worth remembering
+            cls._save()
+        return entry
+
+    @classmethod
+    def _matches(cls, options: List, topic: str) -> List:
+        if not topic.startswith(("-", "+")):
+            topic = topic.lower()  # A keyword: search tags and descriptions
+            return [option for option in options if topic in option[0].lower() or topic in option[1].lower()]
+        name = topic.split("=")[0]
+        exact = [option for option in options if name in cls._FLAG.findall(option[0])]
+        if exact or name.startswith("--"):
+            return exact or [option for option in options if any(f.startswith(name) for f in cls._FLAG.findall(option[0]))]
+        # Bundled short options such as -xzf
+        letters = [f"-{letter}" for letter in name[1:]]
+        return [option for option in options if set(letters) & set(cls._FLAG.findall(option[0]))]
+
+    @classmethod
+    def lookup(cls, request: str) -> str:
+        """Handle '[[HELP: <command> [flag|keyword]]]'."""
+        command, _, topic = request.strip().partition(" ")
+        command, topic = os.path.basename(command), topic.strip()
+        if not re.fullmatch(r"[\w.+-]+", command or "-"):
+            return "Error: Usage: [[HELP: <command> [flag|keyword]]]"
+        entry = cls.entry(command)
+        if entry is None:
+            if command not in PreflightCheck.path_index():
+                return "Error: " + PreflightCheck._missing(command, PreflightCheck.path_index()) + "."
+            if command not in HELP_RUN_COMMANDS:
+                return f"No man page found for '{command}'. Run '{command} --help' as a command to read its usage."
+            return f"No man page or --help output found for '{command}'."
+        lines = [f"{command} (from {entry['source']}):"] + [f"  {line}" for line in entry["synopsis"][:4]]
+        options = entry["options"]
+        if not topic:
+            tags = [tag for tag, _ in options]
+            lines.append(f"Options ({len(tags)}): " + "; ".join(tags[:80]) + ("; ..." if len(tags) > 80 else ""))
+            lines.append(f"[Ask for details with [[HELP: {command} <flag or keyword>]]]")
+            return "\n".join(lines)
+        matches = cls._matches(options, topic)
+        if not matches:
+            flags = dict.fromkeys(flag for tag, _ in options for flag in cls._FLAG.findall(tag))
+            lines.append(f"No option of '{command}' matches '{topic}'." + (" Options: " + ", ".join(flags) if flags else ""))
+            return "\n".join(lines)
+        for tag, description in matches[:HELP_MAX_MATCHES]:
+            lines.append(f"  {tag}" + (f"  {description}" if description else ""))
+        if len(matches) > HELP_MAX_MATCHES:
+            lines.append(f"[{len(matches) - HELP_MAX_MATCHES} more matches; narrow the flag or keyword]")
+        return "\n".join(lines)
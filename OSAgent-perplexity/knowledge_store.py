@@ -0,0 +1,222 @@
+"""
+Knowledge packs: the embedded knowledge base plus pack files from KNOWLEDGE_DIR, reloaded while the agent runs.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import sys
+import threading
+import types
+from typing import Dict, List, NamedTuple, Optional
+
+import yaml
+
+from config import KNOWLEDGE_POLL_INTERVAL, KNOWLEDGE_RELOAD_DEBOUNCE
+
+
+class KnowledgeIndex(NamedTuple):
+    """Immutable snapshot of the knowledge base used for a whole turn."""
+    generation: int
+    entries: types.MappingProxyType
+    sources: tuple
+
+
+class KnowledgeStore:
+    """
+    Serves the knowledge base and hot-reloads packs from KNOWLEDGE_DIR.
+
+    A background watcher (inotify, or directory polling when inotify is not
+    available) rebuilds a complete index off to the side. The rebuilt index is
+    only published by snapshot(), which the orchestrator calls at the start of a
+    turn, so a turn in flight never blocks on a reload and never sees a partial one.
+    """
+    PACK_EXTENSIONS = (".yaml", ".yml", ".json")
+
+    # inotify(7) constants
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_IGNORED = 0x00008000
+
+    def __init__(self, directory: str, embedded: Dict = None, poll_interval: float = KNOWLEDGE_POLL_INTERVAL):
+        self.directory = directory
+        self.embedded = {} if embedded is None else embedded
+        self.poll_interval = poll_interval
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._pending = None
+        self._signature = self._scan_signature()
+        self._current = self._build_index(0) or KnowledgeIndex(0, types.MappingProxyType(dict(self.embedded)), ())
+
+    def start(self):
+        """Start watching the knowledge directory (idempotent)."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="knowledge-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=2)
+            self._watcher = None
+
+    def snapshot(self) -> KnowledgeIndex:
+        """Publish a pending rebuild, if any, and return the index for this turn."""
+        with self._lock:
+            if self._pending is not None:
+                self._current = self._pending
+                self._pending = None
+            return self._current
+
+    def reload(self) -> bool:
+        """Rebuild the index now; it becomes visible at the next snapshot()."""
+        self._signature = self._scan_signature()
+        with self._lock:
+            generation = max(self._current.generation, self._pending.generation if self._pending else 0) + 1
+        index = self._build_index(generation)
+        if index is None:
+            return False
+        with self._lock:
+            self._pending = index
+        return True
+
+    def _pack_files(self) -> List[str]:
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError:
+            return []
+        return [
+            os.path.join(self.directory, name)
+            for name in names
+            if name.endswith(self.PACK_EXTENSIONS) and not name.startswith(".")
+        ]
+
+    def _scan_signature(self) -> tuple:
+        signature = []
+        for path in self._pack_files():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    @staticmethod
+    def _normalize_pack(name: str, data: Dict) -> Dict:
+        if not isinstance(data, dict) or not isinstance(data.get("content"), str):
+            raise ValueError(f"knowledge pack '{name}' needs a 'content' string")
+        triggers = data.get("triggers", [])
+        if isinstance(triggers, str):
+            triggers = [triggers]
+        return {
+            "description": str(data.get("description", "")),
+            "triggers": tuple(str(t).lower() for t in triggers),
+            "content": data["content"],
+        }
+
+    def _load_pack_file(self, path: str) -> Dict[str, Dict]:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                data = json.load(f)
+            else:
+                data = yaml.safe_load(f)
+        if data is None:
+            return {}
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected a mapping")
+        # A file holds either a single pack or a mapping of pack name -> pack.
+        if "content" in data:
+            name = data.get("name") or os.path.splitext(os.path.basename(path))[0]
+            return {name: self._normalize_pack(name, data)}
+        return {name: self._normalize_pack(name, pack) for name, pack in data.items()}
+
+    def _build_index(self, generation: int) -> Optional[KnowledgeIndex]:
+        """Build a full index, or return None so the previous index stays active."""
+        entries = {name: self._normalize_pack(name, data) for name, data in self.embedded.items()}
+        sources = []
+        try:
+            for path in self._pack_files():
+                entries.update(self._load_pack_file(path))
+                sources.append(path)
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            self.last_error = f"Knowledge reload failed: {e}"
+            return None
+        self.last_error = None
+        return KnowledgeIndex(generation, types.MappingProxyType(entries), tuple(sources))
+
+    def _watch(self):
+        fd = self._inotify_open()
+        # Catch changes made between the initial build and the watch being set up.
+        if self._scan_signature() != self._signature:
+            self.reload()
+        try:
+            if fd is None:
+                self._poll_loop()
+            else:
+                self._inotify_loop(fd)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _inotify_open(self) -> Optional[int]:
+        if not os.path.isdir(self.directory):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = (
+                self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE
+                | self.IN_DELETE | self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_MODIFY
+            )
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _inotify_loop(self, fd: int):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([fd], [], [], 1.0)
+            if not ready:
+                continue
+            # Let editors finish their write/rename burst, then drain and rebuild once.
+            self._stop.wait(KNOWLEDGE_RELOAD_DEBOUNCE)
+            directory_gone = False
+            try:
+                while True:
+                    events = os.read(fd, 65536)
+                    offset = 0
+                    while offset + 16 <= len(events):
+                        mask = int.from_bytes(events[offset + 4:offset + 8], sys.byteorder)
+                        name_len = int.from_bytes(events[offset + 12:offset + 16], sys.byteorder)
+                        if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED):
+                            directory_gone = True
+                        offset += 16 + name_len
+            except BlockingIOError:
+                pass
+            if self._scan_signature() != self._signature:
+                self.reload()
+            if directory_gone:
+                # The watch is gone with the directory; keep going by polling.
+                self._poll_loop()
+                return
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            if self._scan_signature() != self._signature:
+                self.reload()
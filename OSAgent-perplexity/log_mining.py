@@ -0,0 +1,173 @@
+"""
+Log output summarised as templates with counts, after the Drain log parser.
+"""
+
+import os
+import re
+import shlex
+from typing import Dict, List, Optional
+
+from config import (LOG_MINING, LOG_MINING_DEPTH, LOG_MINING_MAX_CHILDREN, LOG_MINING_MAX_TEMPLATES,
+                    LOG_MINING_MIN_LINES, LOG_MINING_SHOW_TEMPLATES, LOG_MINING_SIMILARITY,
+                    READ_MAX_LINE_CHARS)
+from osagent_common.safety_policy import command_segments
+from output_buffer import BoundedOutput
+from output_compactor import CompactResult, OutputCompactor
+
+
+class LogCluster:
+    """One mined log template and what was seen of it."""
+    __slots__ = ("template", "count", "first", "last", "example")
+
+    def __init__(self, template: List[str], timestamp: str, example: str):
+        self.template = template
+        self.count = 0
+        self.first = timestamp
+        self.last = timestamp
+        self.example = example
+
+
+class LogTemplateMiner:
+    """
+    Single-pass log template mining after Drain (He et al., ICWS 2017).
+
+    Each line loses its timestamp, has numbers, hex strings and UUIDs masked as <*> and
+    is routed through a fixed-depth tree (token count, then the first LOG_MINING_DEPTH
+    tokens) to a short list of templates. It joins the most similar one, turning the
+    tokens that differ into <*>, or starts a new template. Memory is bounded by
+    LOG_MINING_MAX_TEMPLATES whatever the length of the log.
+    """
+    WILDCARD = "<*>"
+    TIMESTAMP = re.compile(
+        r"^(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"  # ISO 8601
+        r"|[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}"  # syslog, journalctl's default format
+        r"|\[\s*\d+\.\d+\]"  # dmesg
+        r"|\[[A-Z][a-z]{2} [A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2} \d{4}\])\s*"  # dmesg -T
+    )
+    VARIABLE = re.compile(
+        r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"
+        r"|0x[0-9a-fA-F]+|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b|\d+(?:\.\d+)*"
+    )
+    # Log readers, and the filters that may follow them in a pipeline
+    READERS = frozenset({"cat", "zcat", "head", "tail", "grep", "egrep", "fgrep", "zgrep"})
+    FILTERS = frozenset({"grep", "egrep", "fgrep", "head", "tail"})
+    # Redirections that do not write anywhere meaningful
+    HARMLESS_REDIRECT = re.compile(r"\d?>\s*/dev/null|\d?>&\d")
+
+    def __init__(self):
+        self.clusters: List[LogCluster] = []
+        self.tree: Dict[tuple, List[LogCluster]] = {}
+        self.children: Dict[tuple, set] = {}
+        self.other: Optional[LogCluster] = None  # Lines that fit no template once the limit is reached
+        self.lines = 0
+
+    @classmethod
+    def applies_to(cls, command: str) -> bool:
+        stripped = cls.HARMLESS_REDIRECT.sub(" ", command)
+        if any(c in stripped for c in ";&<>$`\n"):
+            return False
+        segments = command_segments(stripped)
+        try:
+            parts = [shlex.split(segment) for segment in segments]
+        except ValueError:
+            return False
+        if not parts or not all(parts):
+            return False
+        base, args = os.path.basename(parts[0][0]), parts[0][1:]
+        if base in ("journalctl", "dmesg"):
+            # Structured formats are not lines of text, and a follow never ends
+            if any("json" in arg or "export" in arg or arg in ("verbose", "-f", "--follow", "-w") for arg in args):
+                return False
+        elif base not in cls.READERS or not any(arg.startswith("/var/log/") for arg in args):
+            return False
+        return all(os.path.basename(segment[0]) in cls.FILTERS for segment in parts[1:])
+
+    def _route(self, tokens: List[str]) -> tuple:
+        path = (len(tokens),)
+        for token in tokens[:LOG_MINING_DEPTH]:
+            key = self.WILDCARD if self.WILDCARD in token else token
+            branches = self.children.setdefault(path, set())
+            if key not in branches:
+                if len(branches) >= LOG_MINING_MAX_CHILDREN:
+                    key = self.WILDCARD
+                branches.add(key)
+            path += (key,)
+        return path
+
+    def add(self, line: str):
+        match = self.TIMESTAMP.match(line)
+        timestamp, message = (match.group(1), line[match.end():]) if match else ("", line)
+        tokens = self.VARIABLE.sub(self.WILDCARD, message).split()
+        if not tokens:
+            return
+        self.lines += 1
+        leaf = self.tree.setdefault(self._route(tokens), [])
+        best, best_score = None, (LOG_MINING_SIMILARITY, -1)
+        for cluster in leaf:
+            same = sum(1 for a, b in zip(cluster.template, tokens) if a == b and a != self.WILDCARD)
+            # Most shared tokens wins; ties go to the more general template
+            score = (same / len(tokens), cluster.template.count(self.WILDCARD))
+            if score >= best_score:
+                best, best_score = cluster, score
+        if best is not None:
+            best.template = [a if a == b else self.WILDCARD for a, b in zip(best.template, tokens)]
+        elif len(self.clusters) < LOG_MINING_MAX_TEMPLATES:
+            best = LogCluster(tokens, timestamp, message)
+            self.clusters.append(best)
+            leaf.append(best)
+        else:
+            if self.other is None:
+                self.other = LogCluster([f"<lines unlike the first {LOG_MINING_MAX_TEMPLATES} templates>"], timestamp, message)
+            best = self.other
+        best.count += 1
+        best.last = timestamp or best.last
+
+    @staticmethod
+    def _clip(text: str) -> str:
+        return text if len(text) <= READ_MAX_LINE_CHARS else text[:READ_MAX_LINE_CHARS - 3] + "..."
+
+    def render(self) -> str:
+        shown = sorted(self.clusters, key=lambda cluster: cluster.count, reverse=True)[:LOG_MINING_SHOW_TEMPLATES]
+        visible = {id(cluster) for cluster in shown}
+        lines = []
+        for cluster in [c for c in self.clusters if id(c) in visible] + ([self.other] if self.other else []):
+            span = cluster.first if cluster.first == cluster.last else f"{cluster.first} .. {cluster.last}"
+            prefix = f"{cluster.count}x " + (f"{span}  " if span else "")
+            if cluster.count == 1 and cluster is not self.other:
+                lines.append(prefix + self._clip(cluster.example))  # Nothing to generalise
+                continue
+            lines.append(prefix + self._clip(" ".join(cluster.template)))
+            lines.append("    e.g. " + self._clip(cluster.example))
+        hidden = [cluster for cluster in self.clusters if id(cluster) not in visible]
+        if hidden:
+            lines.append(f"[... {len(hidden)} rarer templates ({sum(c.count for c in hidden)} lines) not shown]")
+        return "\n".join(lines)
+
+    @classmethod
+    def compact(cls, command: str, stdout: BoundedOutput, handle: str) -> Optional[CompactResult]:
+        """Templated stdout of a log-reading command, or None if it is not one or too short to bother."""
+        if not LOG_MINING or not cls.applies_to(command):
+            return None
+        lines = stdout.complete_lines()
+        if lines is None:
+            return None
+        miner = cls()
+        tokens_before = 0
+        try:
+            for line in lines:
+                miner.add(line)
+                tokens_before += OutputCompactor.estimate_tokens(line) + 1
+        except OSError:
+            return None
+        if miner.lines < LOG_MINING_MIN_LINES or len(miner.clusters) * 2 > miner.lines:
+            return None  # Too short, or mostly distinct lines that templates would not summarise
+        text = miner.render()
+        tokens_after = OutputCompactor.estimate_tokens(text)
+        if tokens_after >= tokens_before:
+            return None
+        templates = len(miner.clusters) + (1 if miner.other else 0)
+        summary = (
+            f"log templates: {miner.lines} lines -> {templates} templates with counts and first/last timestamps, "
+            f"{stdout.total} -> {len(text.encode())} bytes, ~{tokens_before} -> ~{tokens_after} tokens"
+        )
+        return OutputCompactor.finish(stdout, handle, text, summary)
@@ -4,17 +4,38 @@ import json
 import requests
 import subprocess
 import sys
+import threading
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
-
-# --- CONFIGURATION ---
-API_URL = "http://10.167.32.1:1234/v1/chat/completions"
-MODEL_TEMPERATURE = 0.1
-MODEL_AUTOMATION = False  # Default to ask-first mode for safety
-LOG_DIR = "logs"
-# Automation mode restrictions
-AUTOMATION_MAX_COMMANDS_PER_MINUTE = 10  # Rate limiting
-AUTOMATION_REQUIRED_CONFIRMATION_INTERVAL = 5  # Require reconfirmation after N commands in automation mode
+from typing import List, Dict, Optional, NamedTuple
+# The safety policy engine and the read-only classifier are shared by every variant
+# (osagent_common/, beside this directory); the modules next to this file import them too
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osagent_common.read_only import is_read_only
+# Settings, and the subsystems split out into the modules next to this file
+from config import (API_URL, AUTOMATION_MAX_COMMANDS_PER_MINUTE, AUTOMATION_REQUIRED_CONFIRMATION_INTERVAL,
+                    BATCH_APPROVAL, COMMAND_CACHE, COMMAND_TIMEOUT, KNOWLEDGE_DIR, LOG_DIR,
+                    MAX_PARALLEL_COMMANDS, MAX_TOOL_REQUESTS_PER_RESPONSE, MODEL_AUTOMATION,
+                    MODEL_TEMPERATURE, NATIVE_TOOL_CALLS, PERSISTENT_SHELL, PREFLIGHT_CHECKS,
+                    PREFLIGHT_TOOLS_IN_PROMPT, READ_DEFAULT_LINES, SPECULATIVE_COMMANDS, SPECULATIVE_EXECUTION)
+from output_buffer import BoundedOutput, SpillRegistry
+from admission import AdmissionController
+from timeout_policy import TimeoutPolicy
+from running_command import CommandCancelled, RunningCommand
+from persistent_shell import PersistentShell
+from command_cache import CACHE
+from output_delta import OutputDelta
+from fast_path import FastPath
+from output_compactor import OutputCompactor
+from log_mining import LogTemplateMiner
+from preflight import PreflightCheck
+from command_policy import is_command_safe
+from output_reader import OutputReader
+from background_jobs import JobManager
+from help_index import HelpIndex
+from knowledge_store import KnowledgeIndex, KnowledgeStore
 
 # Track automation mode usage for safety
 automation_command_count = 0
@@ -69,96 +90,132 @@ class SessionLogger:
 
 # --- TOOLS ---
 
+
+class SpeculativeRun:
+    """
+    A command of a known read-only shape (SPECULATIVE_COMMANDS) started in ask-first mode
+    before the operator approved it.
+
+    It is an ordinary RunningCommand (same resource limits and timeout policy), drained by
+    a background thread so it never stalls on a full pipe. Once the command is approved,
+    TerminalTool.execute() adopts the outcome; otherwise discard() stops it and deletes its
+    output, so nothing of a denied command reaches the model, the cache or the delta history.
+    """
+
+    def __init__(self, command: str):
+        self.command = command
+        self.running = RunningCommand(command, TimeoutPolicy.for_command(command))
+        self.settled = False
+        self._outcome = None  # (returncode, stdout, stderr), or the exception wait() raised
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+
+    @staticmethod
+    def eligible(command: str, use_cache: bool = True) -> bool:
+        if not SPECULATIVE_EXECUTION or MODEL_AUTOMATION or PERSISTENT_SHELL:
+            return False
+        if not SpeculativeRun.allowed_shape(command) or not TerminalTool._is_command_safe(command)[0]:
+            return False
+        if AdmissionController.classify(command) != "light":
+            return False  # Costly commands wait for approval and admission as usual
+        if use_cache and COMMAND_CACHE and TerminalTool.cache.contains(command):
+            return False
+        return FastPath.run(command) is None and not PreflightCheck.check(command)
+
+    @staticmethod
+    def allowed_shape(command: str) -> bool:
+        """Whether the command is exactly one of the SPECULATIVE_COMMANDS shapes (no guessing)."""
+        if not re.fullmatch(r"[\w./=,:@%-]+(?: +[\w./=,:@%-]+)*", command.strip()):
+            return False
+        program, *args = command.split()
+        if program not in SPECULATIVE_COMMANDS:
+            return False
+        flags, long_options, valued, max_operands = SPECULATIVE_COMMANDS[program]
+        operands, expect_value = 0, False
+        for arg in args:
+            if expect_value:
+                expect_value = False
+            elif arg.startswith("--"):
+                if arg.partition("=")[0] not in long_options:
+                    return False
+            elif arg.startswith("-"):
+                if arg == "-":
+                    return False  # Standard input
+                for position, letter in enumerate(arg[1:], 2):
+                    if letter in valued:
+                        expect_value = position == len(arg)  # Otherwise the value is attached ('-n5')
+                        break
+                    if letter not in flags:
+                        return False
+            else:
+                operands += 1
+        return operands <= max_operands and not expect_value
+
+    @classmethod
+    def start(cls, command: str, use_cache: bool = True) -> Optional["SpeculativeRun"]:
+        if not cls.eligible(command, use_cache):
+            return None
+        speculation = cls(command)
+        try:
+            speculation.running.start()
+        except OSError:
+            return None
+        speculation._thread.start()
+        return speculation
+
+    def _drain(self):
+        try:
+            self._outcome = self.running.wait()
+        except BaseException as e:
+            self._outcome = e
+
+    def adopt(self) -> tuple[int, BoundedOutput, BoundedOutput]:
+        """Wait for the run to finish and take over its result. Raises what wait() raised."""
+        self.settled = True
+        try:
+            while self._thread.is_alive():
+                self._thread.join(0.1)
+        except KeyboardInterrupt:
+            self.running.cancel()
+            self._thread.join()
+            raise
+        if isinstance(self._outcome, BaseException):
+            raise self._outcome
+        return self._outcome
+
+    def discard(self):
+        """Stop the run (if still going) and delete its output. No-op once adopted."""
+        if self.settled:
+            return
+        self.settled = True
+        self.running.cancel()
+        self._thread.join()
+        if isinstance(self._outcome, tuple):
+            for stream in self._outcome[1:]:
+                stream.discard(force=True)
+
+
 class TerminalTool:
-    # Comprehensive blacklist of dangerous commands and patterns
-    DANGEROUS_PATTERNS = [
-        # Destructive file operations
-        r"rm\s+-[rf]",  # rm with -r or -f flags
-        r">\s*/dev/",   # Writing to device files
-        r"dd\s+if=",    # Direct disk operations
-        r">\s*/",       # Writing to root directory
-        
-        # Privilege escalation
-        r"sudo\s+",     # sudo commands (could be restricted further)
-        r"su\s+",       # switch user
-        r"chmod\s+[0-9]*\s+.*\/", # chmod on system paths
-        
-        # System modification
-        r"mkfs\s+",     # filesystem formatting
-        r"fdisk\s+",    # disk partitioning
-        r"parted\s+",   # partition editing
-        r">\s*/etc/",   # writing to config files
-        r">\s*/boot/",  # writing to boot directory
-        
-        # Dangerous shell constructs
-        r":(){.*};:",   # fork bomb
-        r"\|.*\||.*&&.*\||.*\||.*;", # Complex chaining that could hide malicious intent
-        
-        # Network dangers (in automated mode)
-        r"wget\s+.*http", # downloading from internet
-        r"curl\s+.*http", # transferring data from internet
-        r"nc\s+",       # netcat
-        r"telnet\s+",   # telnet
-        
-        # Information gathering that could be malicious
-        r"cat\s+/etc/passwd", # reading password file
-        r"cat\s+/etc/shadow", # reading shadow file
-        r"iptables\s+",   # firewall modification
-        r"firewall-cmd\s+", # firewall modification
-    ]
-    
-    # Whitelist of safe commands (only used in strict mode)
-    SAFE_COMMANDS = [
-        "ls", "pwd", "cat", "grep", "echo", "ps", "df", "du", "free", 
-        "uname", "whoami", "date", "timeout", "head", "tail", "wc",
-        "find", "which", "whereis", "man", "info", "touch", "mkdir",
-        "cp", "mv", "chmod", "chown", "tar", "zip", "unzip", "gzip", "gunzip"
-    ]
+    # Shared worker used when PERSISTENT_SHELL is enabled (created on first use)
+    shell: Optional[PersistentShell] = None
+    # Results of read-only commands, shared by every caller (see COMMAND_CACHE)
+    cache = CACHE
+
+    @staticmethod
+    def is_read_only(command: str) -> bool:
+        """True if the command line only inspects the system (see osagent_common/read_only.py).
+        Batches of these may run concurrently."""
+        return is_read_only(command)
     
     @staticmethod
     def _is_command_safe(command: str, automation_mode: bool = False) -> tuple[bool, str]:
         """
-        Check if a command is safe to execute.
+        Check if a command is safe to execute (see command_policy.py).
         Returns (is_safe, reason_if_unsafe)
         """
-        command_lower = command.lower().strip()
-        
-        # Empty command check
-        if not command_lower:
-            return False, "Empty command"
-            
-        # Check against dangerous patterns
-        import re
-        for pattern in TerminalTool.DANGEROUS_PATTERNS:
-            if re.search(pattern, command_lower, re.IGNORECASE):
-                return False, f"Command matches dangerous pattern: {pattern}"
-        
-        # In automation mode, only allow whitelisted commands
-        if automation_mode:
-            # Extract the base command (first word)
-            parts = command_lower.split()
-            if not parts:
-                return False, "Cannot determine base command"
-                
-            base_cmd = parts[0]
-            # Check if base command is in whitelist
-            if base_cmd not in TerminalTool.SAFE_COMMANDS:
-                return False, f"Command '{base_cmd}' not in automation mode whitelist"
-                
-            # Additional checks for specific commands with arguments
-            if base_cmd in ["chmod", "chown"] and len(parts) > 2:
-                # Prevent changing permissions/ownership of system directories
-                system_paths = ["/etc", "/bin", "/sbin", "/usr", "/var", "/root", "/boot", "/lib", "/lib64"]
-                for arg in parts[2:]:  # Skip command and first argument (mode/user)
-                    if arg.startswith("/"):
-                        for sys_path in system_paths:
-                            if arg.startswith(sys_path):
-                                return False, f"Modifying system path {arg} not allowed in automation mode"
-        
-        return True, "Command deemed safe"
+        return is_command_safe(command, automation_mode)
     
     @staticmethod
-    def execute(command: str, automation_mode: bool = False) -> str:
+    def execute(command: str, automation_mode: bool = False, use_cache: bool = True, speculation: Optional["SpeculativeRun"] = None) -> str:
         # Check if we're in automation mode (would be passed from orchestrator)
         # For now, we'll check a global or could pass it as parameter
         # We'll enhance this in the orchestrator to pass automation mode info
@@ -171,42 +228,253 @@ class TerminalTool:
                 return "Error: Command blocked by security policy."
             else:
                 return f"Error: Command blocked by safety filter. Reason: {reason}"
-            
+
+        # Answered in-process, so always current and not worth caching
+        fast = FastPath.run(command)
+        read_only = fast is not None or TerminalTool.is_read_only(command)
+        cacheable = COMMAND_CACHE and read_only and fast is None
+        if cacheable:
+            if not use_cache:
+                TerminalTool.cache.record_bypass()
+            else:
+                cached = TerminalTool.cache.lookup(command)
+                if cached is not None:
+                    note, _, body = cached.partition("\n")
+                    return f"{note}\n{OutputDelta.apply(command, body)}"
+        if fast is None:
+            problem = PreflightCheck.check(command)
+            if problem:
+                return problem
+
+        ticket = AdmissionController.admit(command)
+        if not ticket.admitted:
+            return ticket.note
+        if COMMAND_CACHE and not read_only:
+            # It may have changed what earlier commands reported
+            TerminalTool.cache.invalidate()
+
+        running = None
+        policy = TimeoutPolicy.for_command(command)
         try:
-            result = subprocess.run(
-                command, shell=True, capture_output=True, text=True, timeout=30
-            )
-            output = result.stdout if result.stdout else ""
-            errors = result.stderr if result.stderr else ""
-            if result.returncode != 0:
-                # In automation mode, provide less detailed error information
-                if automation_mode:
-                    return f"Error: Command failed with exit code {result.returncode}."
-                else:
-                    return f"Execution Error (Exit Code {result.returncode}):\n{errors}"
-            return output if output.strip() else f"Success (no output). Stderr: {errors}"
+            if fast is not None:
+                returncode, stdout, stderr = 0, BoundedOutput(), BoundedOutput()
+                stdout.write(fast.encode())
+                stdout.close()
+                stderr.close()
+            elif speculation is not None and speculation.command == command:
+                # Started while the operator was deciding; usually finished by now
+                running = speculation.running
+                policy = running.policy
+                returncode, stdout, stderr = speculation.adopt()
+            elif PERSISTENT_SHELL:
+                if TerminalTool.shell is None:
+                    TerminalTool.shell = PersistentShell()
+                    atexit.register(TerminalTool.shell.close)
+                returncode, stdout, stderr = TerminalTool.shell.run(command, policy)
+            else:
+                running = RunningCommand(command, policy).start()
+                returncode, stdout, stderr = running.wait()
         except subprocess.TimeoutExpired:
-            return "Error: Command timed out after 30 seconds."
+            if PERSISTENT_SHELL:
+                return (
+                    f"{policy.describe()} "
+                    "The shell was restarted; working directory and variables were reset."
+                )
+            return policy.describe()
+        except CommandCancelled:
+            return "Error: Command cancelled by user."
         except Exception as e:
             # In automation mode, provide less detailed error information
             if automation_mode:
                 return "Error: Command execution failed."
             else:
                 return f"Error executing command: {str(e)}"
+        finally:
+            AdmissionController.release(ticket)
+
+        command_id = SpillRegistry.next_command_id()
+        compacted = None
+        if returncode == 0:
+            handle = f"cmd{command_id}.stdout"
+            compacted = OutputCompactor.compact(command, stdout, handle) or LogTemplateMiner.compact(command, stdout, handle)
+        output = stdout.text() if compacted is None else compacted.text
+        errors = stderr.text()
+        # A compacted table is complete even when the raw stream was truncated
+        complete = not stderr.truncated and (not compacted.truncated if compacted else not stdout.truncated)
+        notes = "\n".join(
+            note
+            for note in (
+                stdout.spill_note(f"cmd{command_id}.stdout") if compacted is None else compacted.note,
+                stderr.spill_note(f"cmd{command_id}.stderr"),
+            )
+            if note
+        )
+        usage = running.usage_note() if running is not None else ""
+        stdout.discard()
+        stderr.discard()
+        if returncode != 0:
+            # In automation mode, provide less detailed error information
+            if automation_mode:
+                return f"Error: Command failed with exit code {returncode}."
+            result = f"Execution Error (Exit Code {returncode}):\n{errors}"
+        else:
+            result = output if output.strip() else f"Success (no output). Stderr: {errors}"
+            if cacheable and complete:
+                TerminalTool.cache.store(command, result)
+            result = OutputDelta.apply(command, result)
+        return "\n".join(part for part in (ticket.note, result.rstrip("\n"), notes, policy.note(), usage) if part)
+
+    @staticmethod
+    def _run_captured(command: str, timeout: float) -> tuple[int, BoundedOutput, BoundedOutput]:
+        """
+        Run a shell command, streaming stdout/stderr into bounded buffers as it runs.
+
+        Raises subprocess.TimeoutExpired (after stopping the command and its children)
+        when timeout elapses, and CommandCancelled if RunningCommand.cancel_all() is called.
+        """
+        return RunningCommand(command, timeout).start().wait()
+
 
 # --- AGENT CORE ---
 
+KNOWLEDGE_STORE = KnowledgeStore(KNOWLEDGE_DIR, KNOWLEDGE_BASE)
+
+
 class ContextManager:
     @staticmethod
-    def get_relevant_context(user_input: str) -> str:
+    def get_relevant_context(user_input: str, knowledge: Optional[KnowledgeIndex] = None) -> str:
+        if knowledge is None:
+            knowledge = KNOWLEDGE_STORE.snapshot()
         disclosed_text = ""
         input_lower = user_input.lower()
-        for name, data in KNOWLEDGE_BASE.items():
+        for name, data in knowledge.entries.items():
             if any(trigger in input_lower for trigger in data.get('triggers', [])):
                 disclosed_text += f"\n{data['content']}\n"
         return disclosed_text
 
 class AgentLLM:
+    # OpenAI-style function definitions offered to the model when NATIVE_TOOL_CALLS is on
+    TOOLS = [
+        {
+            "type": "function",
+            "function": {
+                "name": "execute_command",
+                "description": "Run a shell command on the local Linux host and return its output.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "command": {"type": "string", "description": "The shell command line to run."},
+                        "fresh": {
+                            "type": "boolean",
+                            "description": "Re-run even if a cached result of this read-only command is available.",
+                        },
+                    },
+                    "required": ["command"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "read_output",
+                "description": "Page through truncated command output (by handle, e.g. cmd3.stdout) or a file.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "target": {"type": "string", "description": "Output handle or file path."},
+                        "start_line": {"type": "integer", "description": "First line to show (0-based).", "default": 0},
+                        "line_count": {"type": "integer", "description": "Number of lines to show.", "default": READ_DEFAULT_LINES},
+                    },
+                    "required": ["target"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "search_output",
+                "description": "Return the lines of an output handle or file that match a regular expression.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "target": {"type": "string", "description": "Output handle or file path."},
+                        "pattern": {"type": "string", "description": "Python regular expression."},
+                    },
+                    "required": ["target", "pattern"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "start_job",
+                "description": "Start a long-running shell command in the background and return its job id.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {"command": {"type": "string", "description": "The shell command line to run."}},
+                    "required": ["command"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "job_status",
+                "description": "State, runtime and exit code of a background job (or of all jobs if job_id is 'all').",
+                "parameters": {
+                    "type": "object",
+                    "properties": {"job_id": {"type": "string", "description": "Job id such as job1, or 'all'."}},
+                    "required": ["job_id"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "job_output",
+                "description": "Output of a background job from a byte offset on; the reply gives the offset to poll next.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "job_id": {"type": "string", "description": "Job id such as job1."},
+                        "since": {"type": "integer", "description": "Byte offset to start from (default 0)."},
+                    },
+                    "required": ["job_id"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "cancel_job",
+                "description": "Stop a background job and everything it started.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {"job_id": {"type": "string", "description": "Job id such as job1."}},
+                    "required": ["job_id"],
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "command_help",
+                "description": "Look up an installed command's options (from its man page) "
+                               "instead of guessing flags. Returns only the matching option lines.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "command": {"type": "string", "description": "Command name, e.g. tar."},
+                        "topic": {"type": "string", "description": "A flag (-x, --exclude) or a keyword; omit to list all options."},
+                    },
+                    "required": ["command"],
+                },
+            },
+        },
+    ]
+    # Cleared when the server rejects the tools parameter; the text protocol is used from then on
+    tools_supported = True
+
     @staticmethod
     def chat(messages: List[Dict]) -> str:
         payload = {"messages": messages, "temperature": MODEL_TEMPERATURE, "stream": False, "stop": ["User>", "System:"]}
@@ -218,17 +486,504 @@ class AgentLLM:
             # Return generic error message to prevent information leakage
             return "Error: Unable to connect to language model service."
 
+    @staticmethod
+    def chat_with_tools(messages: List[Dict]) -> Dict:
+        """
+        Chat with the tool definitions attached and return the assistant message dict,
+        which may carry 'tool_calls'. Falls back to chat() if the server does not accept tools.
+        """
+        if not AgentLLM.tools_supported:
+            return {"role": "assistant", "content": AgentLLM.chat(messages)}
+        payload = {
+            "messages": messages,
+            "temperature": MODEL_TEMPERATURE,
+            "stream": False,
+            "stop": ["User>", "System:"],
+            "tools": AgentLLM.TOOLS,
+            "tool_choice": "auto",
+        }
+        try:
+            response = requests.post(API_URL, json=payload, timeout=120)
+            if response.status_code in (400, 404, 422, 501):
+                AgentLLM.tools_supported = False
+                return {"role": "assistant", "content": AgentLLM.chat(messages)}
+            response.raise_for_status()
+            message = response.json()['choices'][0]['message']
+        except Exception as e:
+            # Return generic error message to prevent information leakage
+            return {"role": "assistant", "content": "Error: Unable to connect to language model service."}
+        reply = {"role": "assistant", "content": message.get("content")}
+        if message.get("tool_calls"):
+            reply["tool_calls"] = message["tool_calls"]
+        return reply
+
+
 # --- ORCHESTRATOR ---
 
-def run_agentic_session(initial_prompt=None, single_interaction=False):
+def take_knowledge_snapshot(logger: SessionLogger, seen: Dict) -> KnowledgeIndex:
+    """Pin the knowledge index for the turn that is starting and log any reload."""
+    knowledge = KNOWLEDGE_STORE.snapshot()
+    if seen.get("generation") not in (None, knowledge.generation):
+        sources = ", ".join(knowledge.sources) or "embedded only"
+        logger.log("SYSTEM", f"Knowledge reloaded (generation {knowledge.generation}): {sources}")
+    if KNOWLEDGE_STORE.last_error and seen.get("error") != KNOWLEDGE_STORE.last_error:
+        logger.log("SYSTEM", f"{KNOWLEDGE_STORE.last_error}. Keeping generation {knowledge.generation}.")
+    seen["generation"] = knowledge.generation
+    seen["error"] = KNOWLEDGE_STORE.last_error
+    return knowledge
+
+TOOL_TAG_PATTERN = re.compile(
+    r"\[\[(EXEC|FRESH|READ|SEARCH|JOB|JOB_STATUS|JOB_OUTPUT|JOB_CANCEL|HELP):\s*(.*?)\s*\]\]", re.DOTALL
+)
+COMMAND_KINDS = ("EXEC", "FRESH", "JOB")  # FRESH skips the result cache; JOB runs in the background
+JOB_KINDS = ("JOB_STATUS", "JOB_OUTPUT", "JOB_CANCEL")  # Act on the agent's own jobs: no approval needed
+
+
+class ToolRequest(NamedTuple):
+    kind: str  # EXEC, FRESH, READ, SEARCH, JOB, JOB_STATUS, JOB_OUTPUT, JOB_CANCEL or HELP
+    args: str
+
+
+def parse_tool_requests(response: str) -> List[ToolRequest]:
+    """Every tool tag in an agent response, in order."""
+    return [ToolRequest(m.group(1), m.group(2).strip()) for m in TOOL_TAG_PATTERN.finditer(response)]
+
+
+def confirm_execution(cmd: str, logger: SessionLogger, automation_state: Dict) -> Optional[str]:
+    """
+    Apply ask-first confirmation or the automation-mode safeguards to one command.
+
+    Returns None when the command may run, otherwise the result to report instead.
+    In automation mode an approved command takes its slot in the rate limit right away,
+    so a batch of commands cannot overshoot it.
+    """
+    if not MODEL_AUTOMATION:
+        if input("[y/n] > ").lower() == 'y':
+            return None
+        logger.log("SYSTEM", "User denied command execution.")
+        logger.log_security("USER_DENIED", f"User denied command: {cmd}")
+        print("[!] Execution denied.")
+        return "User denied execution."
+
+    # Rate limiting for automation mode: reset the counter if a minute has passed
+    current_time = time.time()
+    if automation_state["reset_time"] is None or (current_time - automation_state["reset_time"]) > 60:
+        automation_state["count"] = 0
+        automation_state["reset_time"] = current_time
+
+    count = automation_state["count"]
+    if count >= AUTOMATION_MAX_COMMANDS_PER_MINUTE:
+        print(f"[!] Automation mode rate limit exceeded ({AUTOMATION_MAX_COMMANDS_PER_MINUTE} commands/minute).")
+        logger.log("SYSTEM", "Automation mode rate limit exceeded.")
+        logger.log_security("RATE_LIMIT_EXCEEDED", f"Automation mode rate limit exceeded. Count: {count}")
+        return "Error: Automation mode rate limit exceeded."
+
+    # Require periodic reconfirmation in automation mode
+    if count > 0 and count % AUTOMATION_REQUIRED_CONFIRMATION_INTERVAL == 0:
+        print(f"\n[!!] Automation mode reconfirmation required after {count} commands.")
+        if input("[y/n] > ").lower() != 'y':
+            logger.log("SYSTEM", "User denied execution during automation mode reconfirmation.")
+            logger.log_security("USER_DENIED_RECONFIRMATION", f"User denied execution during automation mode reconfirmation after {count} commands.")
+            print("[!] Execution denied.")
+            return "User denied execution during reconfirmation."
+    automation_state["count"] += 1
+    return None
+
+
+def approve_tool_request(request: ToolRequest, logger: SessionLogger, automation_state: Dict) -> Optional[str]:
+    """Show a tool request and get it approved. Returns None if approved, else the result to report."""
+    if request.kind in COMMAND_KINDS:
+        where = " in the background" if request.kind == "JOB" else ""
+        print(f"\n[?] Agent requests execution{where}: \033[93m{request.args}\033[0m")
+        return confirm_execution(request.args, logger, automation_state)
+    if request.kind in JOB_KINDS or request.kind == "HELP":
+        return None  # HELP only reads man pages (or '--help' of HELP_RUN_COMMANDS)
+
+    # Paging through our own spill files needs no approval; other files do, like EXEC
+    target = request.args.partition(" ")[0]
+    print(f"\n[?] Agent requests {request.kind.lower()}: \033[93m{request.args}\033[0m")
+    if SpillRegistry.resolve(target) is None and not MODEL_AUTOMATION:
+        if input("[y/n] > ").lower() != 'y':
+            logger.log("SYSTEM", f"User denied {request.kind} of {target}.")
+            print("[!] Read denied.")
+            return "User denied read."
+    return None
+
+
+def needs_prompt(request: ToolRequest) -> bool:
+    """True if approve_tool_request() would ask the operator (ask-first mode)."""
+    if request.kind in COMMAND_KINDS:
+        return True
+    if request.kind in JOB_KINDS or request.kind == "HELP":
+        return False
+    return SpillRegistry.resolve(request.args.partition(" ")[0]) is None
+
+
+def parse_step_selection(answer: str, count: int) -> Optional[set]:
+    """Steps (1-based) chosen by an answer such as "y", "n", "2" or "1,3-4"; None if unreadable."""
+    answer = answer.strip().lower()
+    if answer in ("y", "yes", "a", "all"):
+        return set(range(1, count + 1))
+    if answer in ("n", "no", "none", ""):
+        return set()
+    steps = set()
+    for part in re.split(r"[,\s]+", answer):
+        match = re.fullmatch(r"(\d+)(?:-(\d+))?", part)
+        if not match:
+            return None
+        first, last = int(match.group(1)), int(match.group(2) or match.group(1))
+        if not 1 <= first <= last <= count:
+            return None
+        steps.update(range(first, last + 1))
+    return steps
+
+
+def approve_tool_requests(requests: List[ToolRequest], logger: SessionLogger, automation_state: Dict) -> List[Optional[str]]:
+    """
+    Get a batch of tool requests approved. Returns, per request, None if approved, else the result to report.
+
+    In ask-first mode with BATCH_APPROVAL, two or more requests that need a prompt are shown
+    as one numbered plan and approved (all, none or a subset) with a single answer.
+    """
+    prompted = [index for index, request in enumerate(requests) if needs_prompt(request)]
+    if MODEL_AUTOMATION or not BATCH_APPROVAL or len(prompted) < 2:
+        return [approve_tool_request(request, logger, automation_state) for request in requests]
+
+    denials: List[Optional[str]] = [None] * len(requests)
+    for index, request in enumerate(requests):
+        if index not in prompted:
+            denials[index] = approve_tool_request(request, logger, automation_state)
+    print(f"\n[?] Agent requests a plan of {len(prompted)} steps:")
+    for step, index in enumerate(prompted, start=1):
+        request = requests[index]
+        what = {"EXEC": "execute", "FRESH": "execute", "JOB": "execute in the background"}.get(request.kind, request.kind.lower())
+        print(f"  {step}. {what}: \033[93m{request.args}\033[0m")
+    while True:
+        selected = parse_step_selection(input("[y/n/steps, e.g. 1,3-4] > "), len(prompted))
+        if selected is not None:
+            break
+        print(f"[!] Answer y, n, or step numbers between 1 and {len(prompted)}.")
+    logger.log("SYSTEM", f"User approved {len(selected)} of {len(prompted)} planned steps: {sorted(selected) or 'none'}.")
+    for step, index in enumerate(prompted, start=1):
+        request = requests[index]
+        if step in selected:
+            continue
+        if request.kind in COMMAND_KINDS:
+            logger.log_security("USER_DENIED", f"User denied command: {request.args}")
+            denials[index] = "User denied execution."
+        else:
+            logger.log("SYSTEM", f"User denied {request.kind} of {request.args.partition(' ')[0]}.")
+            denials[index] = "User denied read."
+    if len(selected) < len(prompted):
+        print(f"[!] {len(prompted) - len(selected)} step(s) denied.")
+    return denials
+
+
+def perform_tool_request(request: ToolRequest, terminal: TerminalTool, speculation: Optional[SpeculativeRun] = None) -> str:
+    """
+    Run an approved tool request. Thread-safe: does no logging or printing.
+
+    speculation is the request's command if it was already started while awaiting approval.
+    """
+    if request.kind == "JOB":
+        return JobManager.start(request.args, automation_mode=MODEL_AUTOMATION)
+    if request.kind == "JOB_STATUS":
+        return JobManager.status(request.args)
+    if request.kind == "JOB_OUTPUT":
+        return JobManager.output(request.args)
+    if request.kind == "JOB_CANCEL":
+        return JobManager.cancel(request.args)
+    if request.kind == "HELP":
+        return HelpIndex.lookup(request.args)
+    if request.kind in COMMAND_KINDS:
+        return terminal.execute(
+            request.args, automation_mode=MODEL_AUTOMATION, use_cache=request.kind == "EXEC", speculation=speculation
+        )
+    target, _, rest = request.args.partition(" ")
+    if request.kind == "READ":
+        return OutputReader.read_request(target, rest, automation_mode=MODEL_AUTOMATION)
+    return OutputReader.search_request(target, rest, automation_mode=MODEL_AUTOMATION)
+
+
+def can_run_in_parallel(request: ToolRequest) -> bool:
+    if request.kind == "JOB":
+        return False
+    if request.kind not in COMMAND_KINDS:
+        return True
+    # The persistent worker is a single shell, so its commands are serialised anyway
+    return not PERSISTENT_SHELL and TerminalTool.is_read_only(request.args)
+
+
+def report_tool_result(request: ToolRequest, result: str, logger: SessionLogger):
+    logger.log("TERMINAL_OUTPUT", result)
+    print(f"[*] Output ({request.kind}: {request.args}):\n{result}")
+    # Log if the request was blocked by safety filters
+    if result.startswith("Error: Command blocked by safety filter"):
+        logger.log_security("COMMAND_BLOCKED", f"Blocked command: {request.args}. Reason: {result}")
+    elif result.startswith("Error: Read blocked by safety filter"):
+        logger.log_security("READ_BLOCKED", f"Blocked {request.kind} of {request.args}. Reason: {result}")
+
+
+def run_tool_requests(requests: List[ToolRequest], terminal: TerminalTool, logger: SessionLogger, automation_state: Dict) -> List[str]:
+    """
+    Approve and run a batch of tool requests, returning their results in request order.
+
+    All requests are approved first (see approve_tool_requests). Approved requests then run in waves:
+    consecutive read-only requests run together on a bounded thread pool, and any
+    command that may change the system runs alone, after everything before it.
+
+    In ask-first mode, the light read-only commands ahead of the first request that may
+    change something are started speculatively before the prompts (see SpeculativeRun).
+    """
+    results: List[Optional[str]] = [None] * len(requests)
+    speculations: Dict[int, SpeculativeRun] = {}
+    try:
+        if SPECULATIVE_EXECUTION and not MODEL_AUTOMATION:
+            for index, request in enumerate(requests):
+                if not can_run_in_parallel(request):
+                    break  # Later requests may depend on what this one changes
+                if request.kind in ("EXEC", "FRESH") and len(speculations) < MAX_PARALLEL_COMMANDS:
+                    speculation = SpeculativeRun.start(request.args, use_cache=request.kind == "EXEC")
+                    if speculation is not None:
+                        speculations[index] = speculation
+                        logger.log("SYSTEM", f"Started speculatively while awaiting approval: {request.args}")
+        approved = []
+        for index, denied in enumerate(approve_tool_requests(requests, logger, automation_state)):
+            request = requests[index]
+            if denied is None:
+                approved.append(index)
+                continue
+            results[index] = denied
+            if index in speculations:
+                speculations.pop(index).discard()
+                logger.log("SYSTEM", f"Discarded the speculative run of a denied command: {request.args}")
+        return _run_approved(requests, approved, results, speculations, terminal, logger)
+    finally:
+        for speculation in speculations.values():
+            speculation.discard()  # Denied, cancelled or answered from the cache after all
+
+
+def _run_approved(
+    requests: List[ToolRequest],
+    approved: List[int],
+    results: List[Optional[str]],
+    speculations: Dict[int, SpeculativeRun],
+    terminal: TerminalTool,
+    logger: SessionLogger,
+) -> List[str]:
+    """The waves of run_tool_requests()."""
+
+    cancelled = False
+
+    def run_wave(wave: List[int]):
+        nonlocal cancelled
+        if not wave:
+            return
+        if cancelled:
+            for index in wave:
+                results[index] = "Error: Not run; the batch was cancelled by user."
+                report_tool_result(requests[index], results[index], logger)
+            return
+        for index in wave:
+            logger.log("SYSTEM", f"Executing {requests[index].kind}: {requests[index].args}")
+        if len(wave) == 1:
+            try:
+                results[wave[0]] = perform_tool_request(requests[wave[0]], terminal, speculations.get(wave[0]))
+            except KeyboardInterrupt:
+                # The command's process tree is already stopped; the session carries on
+                cancelled = True
+                results[wave[0]] = "Error: Command cancelled by user."
+        else:
+            logger.log("SYSTEM", f"Running {len(wave)} read-only requests in parallel.")
+            pool = ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_COMMANDS, len(wave)))
+            futures = {
+                index: pool.submit(perform_tool_request, requests[index], terminal, speculations.get(index))
+                for index in wave
+            }
+            try:
+                for index, future in futures.items():
+                    results[index] = future.result()
+            except KeyboardInterrupt:
+                cancelled = True
+                pool.shutdown(wait=False, cancel_futures=True)
+                RunningCommand.cancel_all()
+                AdmissionController.cancel_waits()
+                for index, future in futures.items():
+                    if future.cancelled():
+                        results[index] = "Error: Not run; the batch was cancelled by user."
+                    else:
+                        results[index] = future.result()
+            finally:
+                pool.shutdown()
+        if cancelled:
+            print("\n[!] Cancelled. Remaining requests in this response are skipped.")
+            logger.log("SYSTEM", "User cancelled the running command(s).")
+        for index in wave:
+            report_tool_result(requests[index], results[index], logger)
+
+    wave = []
+    for index in approved:
+        if can_run_in_parallel(requests[index]):
+            wave.append(index)
+            continue
+        run_wave(wave)
+        wave = []
+        run_wave([index])
+    run_wave(wave)
+    return results
+
+
+def format_tool_results(requests: List[ToolRequest], results: List[str]) -> str:
+    """One COMMAND OUTPUT message for the whole batch, in request order."""
+    if len(requests) == 1:
+        return f"COMMAND OUTPUT:\n{results[0]}"
+    sections = [
+        f"[{number}/{len(requests)}] {request.kind}: {request.args}\n{result.rstrip()}"
+        for number, (request, result) in enumerate(zip(requests, results), start=1)
+    ]
+    return "COMMAND OUTPUT:\n" + "\n\n".join(sections)
+
+
+def run_tool_request(response: str, terminal: TerminalTool, logger: SessionLogger, automation_state: Dict) -> Optional[str]:
+    """Act on the tool tags in an agent response and return the message to send back, or None."""
+    requests = parse_tool_requests(response)
+    if not requests:
+        return None
+    if len(requests) > MAX_TOOL_REQUESTS_PER_RESPONSE:
+        logger.log("SYSTEM", f"Agent requested {len(requests)} tools; only the first {MAX_TOOL_REQUESTS_PER_RESPONSE} are run.")
+        requests = requests[:MAX_TOOL_REQUESTS_PER_RESPONSE]
+    results = run_tool_requests(requests, terminal, logger, automation_state)
+    return format_tool_results(requests, results)
+
+
+def tool_call_to_request(call: Dict) -> tuple[Optional[ToolRequest], str]:
+    """Translate a native tool call into a ToolRequest. Returns (request, error)."""
+    function = call.get("function") or {}
+    name = function.get("name", "")
+    try:
+        arguments = json.loads(function.get("arguments") or "{}")
+        if not isinstance(arguments, dict):
+            raise ValueError("arguments must be a JSON object")
+        if name == "execute_command":
+            kind = "FRESH" if arguments.get("fresh") else "EXEC"
+            return ToolRequest(kind, str(arguments["command"]).strip()), ""
+        if name == "read_output":
+            start = int(arguments.get("start_line", 0))
+            count = int(arguments.get("line_count", READ_DEFAULT_LINES))
+            return ToolRequest("READ", f"{arguments['target']} {start} {count}"), ""
+        if name == "search_output":
+            return ToolRequest("SEARCH", f"{arguments['target']} {arguments['pattern']}"), ""
+        if name == "start_job":
+            return ToolRequest("JOB", str(arguments["command"]).strip()), ""
+        if name == "job_status":
+            return ToolRequest("JOB_STATUS", str(arguments["job_id"]).strip()), ""
+        if name == "job_output":
+            return ToolRequest("JOB_OUTPUT", f"{arguments['job_id']} {int(arguments.get('since', 0))}"), ""
+        if name == "cancel_job":
+            return ToolRequest("JOB_CANCEL", str(arguments["job_id"]).strip()), ""
+        if name == "command_help":
+            return ToolRequest("HELP", f"{arguments['command']} {arguments.get('topic') or ''}".strip()), ""
+    except (ValueError, KeyError, TypeError) as e:
+        return None, f"Error: Invalid arguments for {name}: {e}"
+    return None, f"Error: Unknown tool '{name}'."
+
+
+def describe_tool_calls(tool_calls: List[Dict]) -> str:
+    """Text rendering of native tool calls, for the console, the log and the session history."""
+    lines = []
+    for call in tool_calls:
+        request, _ = tool_call_to_request(call)
+        if request is None:
+            function = call.get("function") or {}
+            lines.append(f"[[{function.get('name', '?')}: {function.get('arguments', '')}]]")
+        else:
+            lines.append(f"[[{request.kind}: {request.args}]]")
+    return "\n".join(lines)
+
+
+def run_tool_calls(tool_calls: List[Dict], terminal: TerminalTool, logger: SessionLogger, automation_state: Dict) -> List[Dict]:
+    """Run native tool calls (possibly several in parallel) and build the 'tool' role replies."""
+    calls = tool_calls[:MAX_TOOL_REQUESTS_PER_RESPONSE]
+    replies: List[Optional[str]] = [None] * len(calls)
+    requests, positions = [], []
+    for position, call in enumerate(calls):
+        request, error = tool_call_to_request(call)
+        if request is None:
+            replies[position] = error
+        else:
+            requests.append(request)
+            positions.append(position)
+    for position, result in zip(positions, run_tool_requests(requests, terminal, logger, automation_state)):
+        replies[position] = result
+    # Every call gets a reply, including ones dropped over the per-response limit
+    skipped = [{"role": "tool", "tool_call_id": call.get("id", ""), "content": "Error: Too many tool calls in one response; not run."}
+               for call in tool_calls[MAX_TOOL_REQUESTS_PER_RESPONSE:]]
+    return [
+        {"role": "tool", "tool_call_id": call.get("id", ""), "content": reply}
+        for call, reply in zip(calls, replies)
+    ] + skipped
+
+
+def run_agent_turn(messages: List[Dict], history: List[Dict], terminal: TerminalTool, logger: SessionLogger, automation_state: Dict):
+    """Call the model until it answers without requesting a tool."""
+    while True:
+        print("Agent thinking...", end="\r")
+        if NATIVE_TOOL_CALLS:
+            message = AgentLLM.chat_with_tools(messages)
+        else:
+            message = {"role": "assistant", "content": AgentLLM.chat(messages)}
+        response = message.get("content") or ""
+        tool_calls = message.get("tool_calls") or []
+        if tool_calls:
+            response = f"{response}\n{describe_tool_calls(tool_calls)}".strip()
+        print(f"\rAgent: {response}\n")
+
+        logger.log("AGENT", response)
+        # History keeps the text rendering; tool replies are not carried over to later turns
+        history.append({"role": "assistant", "content": response})
+        messages.append(message)
+
+        if tool_calls:
+            messages.extend(run_tool_calls(tool_calls, terminal, logger, automation_state))
+            continue
+        tool_output = run_tool_request(response, terminal, logger, automation_state)
+        if tool_output is None:
+            break
+        messages.append({"role": "user", "content": tool_output})
+
+
+def run_agentic_session(initial_prompt=None, single_interaction=False, carry_outputs=False):
+    """
+    carry_outputs (--loop-prompt): keep the command outputs of the previous call as diff baselines
+    and show them to the model, instead of starting over with full outputs.
+    """
     terminal = TerminalTool()
     logger = SessionLogger(LOG_DIR)
+    KNOWLEDGE_STORE.start()
+    knowledge_seen = {}
     
     base_system_prompt = (
         "You are an Advanced Linux Automation Agent. You have access to a local terminal.\n\n"
-        "**TOOL USE:** To execute a command, use: [[EXEC: <command>]]\n\n"
-        "**RULES:** Stop after calling EXEC. Analyze output before final response."
+        "**TOOL USE:** To execute a command, use: [[EXEC: <command>]]\n"
+        "Long output is truncated and saved under a handle such as cmd3.stdout. "
+        "To page through a handle or a file, use: [[READ: <handle|path> <start_line> <line_count>]]\n"
+        "To find lines matching a regular expression in it, use: [[SEARCH: <handle|path> <regex>]]\n"
+        "Results of read-only commands may come from a cache and are marked as cached; "
+        "to force a re-run, use: [[FRESH: <command>]]\n"
+        "A command you ran before may return only a unified diff against its previous run, or a note that "
+        "its output is unchanged; the note names a handle holding the full output.\n"
+        "For commands that take longer than a few seconds (upgrades, large copies), start a background job "
+        "with [[JOB: <command>]], then poll it with [[JOB_STATUS: <id>]] and [[JOB_OUTPUT: <id> <byte_offset>]]; "
+        "stop it with [[JOB_CANCEL: <id>]].\n"
+        "To check which options a command supports instead of guessing, use: [[HELP: <command> [flag or keyword]]]\n"
+        "You may request several independent read-only commands in one response; they run in "
+        "parallel and all results come back in one COMMAND OUTPUT message, numbered in order.\n"
+        "For a multi-step task, propose the whole plan as tool tags in one response, in the order they should run; "
+        "the operator approves all or some of the steps at once, and denied steps are reported as such.\n\n"
+        "**RULES:** Stop after calling a tool. Analyze output before final response."
     )
+    if PREFLIGHT_CHECKS and PREFLIGHT_TOOLS_IN_PROMPT:
+        base_system_prompt += "\n\n**HOST TOOLS:** " + PreflightCheck.installed_summary()
 
     if initial_prompt is not None and not single_interaction:
         print(f"\n--- AGENTIC TERMINAL READY with initial prompt (Logging to {LOG_DIR}/) ---")
@@ -239,9 +994,8 @@ def run_agentic_session(initial_prompt=None, single_interaction=False):
     
     history = []
     
-    # Automation mode tracking variables
-    automation_command_count = 0
-    last_automation_reset_time = None
+    # Automation mode tracking (commands run in the current minute)
+    automation_state = {"count": 0, "reset_time": None}
 
     # If we have an initial prompt, process it first
     if initial_prompt is not None:
@@ -254,89 +1008,25 @@ def run_agentic_session(initial_prompt=None, single_interaction=False):
         
         logger.log("USER", user_input)
         
-        specialized_context = ContextManager.get_relevant_context(user_input)
+        knowledge = take_knowledge_snapshot(logger, knowledge_seen)
+        specialized_context = ContextManager.get_relevant_context(user_input, knowledge)
         current_system_message = base_system_prompt
         if specialized_context:
             current_system_message += f"\n\n--- ACTIVE KNOWLEDGE ---\n{specialized_context}"
+        if carry_outputs:
+            previous_output = OutputDelta.carry_over()
+            if previous_output:
+                current_system_message += f"\n\n--- COMMAND OUTPUT FROM THE PREVIOUS RUN ---\n{previous_output}"
+        else:
+            OutputDelta.new_conversation()
         
         messages = [{"role": "system", "content": current_system_message}]
         messages.extend(history)
         messages.append({"role": "user", "content": user_input})
         history.append({"role": "user", "content": user_input})
         
-        while True:
-               print("Agent thinking...", end="\r")
-               response = AgentLLM.chat(messages)
-               print(f"\rAgent: {response}\n")
-               
-               logger.log("AGENT", response)
-               history.append({"role": "assistant", "content": response})
-               messages.append({"role": "assistant", "content": response})
-   
-               match = re.search(r'\[\[EXEC:\s*(.*?)\s*\]\]', response, re.DOTALL)
-               if match:
-                   cmd = match.group(1).strip()
-                   print(f"\n[?] Agent requests execution: \033[93m{cmd}\033[0m")
-                   
-                   # Automation mode safeguards
-                   if MODEL_AUTOMATION:
-                       # Rate limiting for automation mode
-                       import time
-                       current_time = time.time()
-                       
-                       # Reset counter if a minute has passed
-                       if last_automation_reset_time is None or (current_time - last_automation_reset_time) > 60:
-                           automation_command_count = 0
-                           last_automation_reset_time = current_time
-                       
-                       # Check if we've exceeded the rate limit
-                       if automation_command_count >= AUTOMATION_MAX_COMMANDS_PER_MINUTE:
-                           print(f"[!] Automation mode rate limit exceeded ({AUTOMATION_MAX_COMMANDS_PER_MINUTE} commands/minute).")
-                           execution_result = "Error: Automation mode rate limit exceeded."
-                           logger.log("SYSTEM", "Automation mode rate limit exceeded.")
-                           logger.log_security("RATE_LIMIT_EXCEEDED", f"Automation mode rate limit exceeded. Count: {automation_command_count}")
-                           confirm = 'n'  # Set confirm to 'n' to skip execution
-                       else:
-                           # Require periodic reconfirmation in automation mode
-                           if automation_command_count > 0 and automation_command_count % AUTOMATION_REQUIRED_CONFIRMATION_INTERVAL == 0:
-                               print(f"\n[!!] Automation mode reconfirmation required after {automation_command_count} commands.")
-                               confirm = input("[y/n] > ").lower()
-                               if confirm != 'y':
-                                   execution_result = "User denied execution during reconfirmation."
-                                   logger.log("SYSTEM", "User denied execution during automation mode reconfirmation.")
-                                   logger.log_security("USER_DENIED_RECONFIRMATION", f"User denied execution during automation mode reconfirmation after {automation_command_count} commands.")
-                                   print("[!] Execution denied.")
-                               else:
-                                   confirm = 'y'  # Proceed with execution
-                           else:
-                               confirm = 'y'  # Automatic confirmation in automation mode
-                   else:
-                       confirm = input("[y/n] > ").lower()
-                   
-                   if confirm == 'y':
-                       logger.log("SYSTEM", f"Executing Command: {cmd}")
-                       execution_result = terminal.execute(cmd, automation_mode=MODEL_AUTOMATION)
-                       logger.log("TERMINAL_OUTPUT", execution_result)
-                       print(f"[*] Output:\n{execution_result}")
-                       
-                       # Increment automation command counter if in automation mode
-                       if MODEL_AUTOMATION and execution_result and not execution_result.startswith("Error:"):
-                           automation_command_count += 1
-                       
-                       # Log if command was blocked by safety filters
-                       if execution_result.startswith("Error: Command blocked by safety filter"):
-                           logger.log_security("COMMAND_BLOCKED", f"Blocked command: {cmd}. Reason: {execution_result}")
-                   else:
-                       execution_result = "User denied execution."
-                       logger.log("SYSTEM", "User denied command execution.")
-                       logger.log_security("USER_DENIED", f"User denied command: {cmd}")
-                       print("[!] Execution denied.")
- 
-                   messages.append({"role": "user", "content": f"COMMAND OUTPUT:\n{execution_result}"})
-                   continue 
-               else:
-                   break
-                   
+        run_agent_turn(messages, history, terminal, logger, automation_state)
+
         # If single_interaction is True, we're done after processing the initial prompt
         if single_interaction:
             return
@@ -377,7 +1067,8 @@ def run_agentic_session(initial_prompt=None, single_interaction=False):
             
             logger.log("USER", user_input)
             
-            specialized_context = ContextManager.get_relevant_context(user_input)
+            knowledge = take_knowledge_snapshot(logger, knowledge_seen)
+            specialized_context = ContextManager.get_relevant_context(user_input, knowledge)
             current_system_message = base_system_prompt
             if specialized_context:
                 current_system_message += f"\n\n--- ACTIVE KNOWLEDGE ---\n{specialized_context}"
@@ -387,78 +1078,65 @@ def run_agentic_session(initial_prompt=None, single_interaction=False):
             messages.append({"role": "user", "content": user_input})
             history.append({"role": "user", "content": user_input})
             
-            while True:
-                   print("Agent thinking...", end="\r")
-                   response = AgentLLM.chat(messages)
-                   print(f"\rAgent: {response}\n")
-                   
-                   logger.log("AGENT", response)
-                   history.append({"role": "assistant", "content": response})
-                   messages.append({"role": "assistant", "content": response})
-       
-                   match = re.search(r'\[\[EXEC:\s*(.*?)\s*\]\]', response, re.DOTALL)
-                   if match:
-                       cmd = match.group(1).strip()
-                       print(f"\n[?] Agent requests execution: \033[93m{cmd}\033[0m")
-                       
-                       # Automation mode safeguards
-                       if MODEL_AUTOMATION:
-                           # Rate limiting for automation mode
-                           import time
-                           current_time = time.time()
-                           
-                           # Reset counter if a minute has passed
-                           if last_automation_reset_time is None or (current_time - last_automation_reset_time) > 60:
-                               automation_command_count = 0
-                               last_automation_reset_time = current_time
-                           
-                           # Check if we've exceeded the rate limit
-                           if automation_command_count >= AUTOMATION_MAX_COMMANDS_PER_MINUTE:
-                               print(f"[!] Automation mode rate limit exceeded ({AUTOMATION_MAX_COMMANDS_PER_MINUTE} commands/minute).")
-                               execution_result = "Error: Automation mode rate limit exceeded."
-                               logger.log("SYSTEM", "Automation mode rate limit exceeded.")
-                               logger.log_security("RATE_LIMIT_EXCEEDED", f"Automation mode rate limit exceeded. Count: {automation_command_count}")
-                               confirm = 'n'  # Set confirm to 'n' to skip execution
-                           else:
-                               # Require periodic reconfirmation in automation mode
-                               if automation_command_count > 0 and automation_command_count % AUTOMATION_REQUIRED_CONFIRMATION_INTERVAL == 0:
-                                   print(f"\n[!!] Automation mode reconfirmation required after {automation_command_count} commands.")
-                                   confirm = input("[y/n] > ").lower()
-                                   if confirm != 'y':
-                                       execution_result = "User denied execution during reconfirmation."
-                                       logger.log("SYSTEM", "User denied execution during automation mode reconfirmation.")
-                                       logger.log_security("USER_DENIED_RECONFIRMATION", f"User denied execution during automation mode reconfirmation after {automation_command_count} commands.")
-                                       print("[!] Execution denied.")
-                                   else:
-                                       confirm = 'y'  # Proceed with execution
-                               else:
-                                   confirm = 'y'  # Automatic confirmation in automation mode
-                       else:
-                           confirm = input("[y/n] > ").lower()
-                       
-                       if confirm == 'y':
-                           logger.log("SYSTEM", f"Executing Command: {cmd}")
-                           execution_result = terminal.execute(cmd, automation_mode=MODEL_AUTOMATION)
-                           logger.log("TERMINAL_OUTPUT", execution_result)
-                           print(f"[*] Output:\n{execution_result}")
-                           
-                           # Increment automation command counter if in automation mode
-                           if MODEL_AUTOMATION and execution_result and not execution_result.startswith("Error:"):
-                               automation_command_count += 1
-                           
-                           # Log if command was blocked by safety filters
-                           if execution_result.startswith("Error: Command blocked by safety filter"):
-                               logger.log_security("COMMAND_BLOCKED", f"Blocked command: {cmd}. Reason: {execution_result}")
-                       else:
-                           execution_result = "User denied execution."
-                           logger.log("SYSTEM", "User denied command execution.")
-                           logger.log_security("USER_DENIED", f"User denied command: {cmd}")
-                           print("[!] Execution denied.")
-   
-                       messages.append({"role": "user", "content": f"COMMAND OUTPUT:\n{execution_result}"}")
-                       continue 
-                   else:
-                       break
+            OutputDelta.new_conversation()
+            run_agent_turn(messages, history, terminal, logger, automation_state)
+
+
+# --- BENCHMARKS ---
+
+def _timing_summary(samples: List[float]) -> str:
+    samples = sorted(samples)
+    mean = sum(samples) / len(samples)
+    p50 = samples[len(samples) // 2]
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return f"mean {mean * 1000:7.2f} ms  p50 {p50 * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms"
+
+
+def benchmark_shell(iterations: int) -> None:
+    """Compare per-command overhead of a fresh shell per command with the persistent worker."""
+    commands = ["true", "echo benchmark", "pwd"]
+    shell = PersistentShell()
+    shell.run("true", COMMAND_TIMEOUT)  # spawn outside the measurement
+    print(f"--- Shell overhead benchmark ({iterations} runs per command) ---")
+    try:
+        for cmd in commands:
+            spawn, persistent = [], []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                TerminalTool._run_captured(cmd, COMMAND_TIMEOUT)
+                spawn.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                shell.run(cmd, COMMAND_TIMEOUT)
+                persistent.append(time.perf_counter() - start)
+            speedup = sum(spawn) / max(sum(persistent), 1e-9)
+            print(f"{cmd!r}")
+            print(f"  spawn per command : {_timing_summary(spawn)}")
+            print(f"  persistent worker : {_timing_summary(persistent)}  ({speedup:.1f}x)")
+    finally:
+        shell.close()
+
+
+def benchmark_fastpath(iterations: int) -> None:
+    """Compare forking the real binary with answering the same command in-process."""
+    commands = ["free -h", "uptime", "cat /proc/loadavg", "nproc", "df -h", "ps aux"]
+    print(f"--- Fast path benchmark ({iterations} runs per command) ---")
+    for cmd in commands:
+        if FastPath.run(cmd) is None:
+            print(f"{cmd!r}: no fast path on this host, skipped")
+            continue
+        spawn, fast = [], []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            TerminalTool._run_captured(cmd, COMMAND_TIMEOUT)
+            spawn.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            FastPath.run(cmd)
+            fast.append(time.perf_counter() - start)
+        speedup = sum(spawn) / max(sum(fast), 1e-9)
+        print(f"{cmd!r}")
+        print(f"  shell + binary : {_timing_summary(spawn)}")
+        print(f"  in-process     : {_timing_summary(fast)}  ({speedup:.1f}x)")
+
 
 if __name__ == "__main__":
     import argparse
@@ -467,10 +1145,16 @@ if __name__ == "__main__":
     parser.add_argument("--prompt", "-p", type=str, help="Initial prompt to send to the agent")
     parser.add_argument("--loop-prompt", "-l", type=str, help="Prompt to run repeatedly in a loop")
     parser.add_argument("--interval", "-i", type=int, default=60, help="Interval in seconds between loop prompt executions (default: 60)")
+    parser.add_argument("--benchmark", choices=["shell", "fastpath"], help="Run a micro-benchmark instead of the agent")
+    parser.add_argument("--iterations", type=int, default=200, help="Runs per benchmark case (default: 200)")
     
     args = parser.parse_args()
     
-    if args.loop_prompt:
+    if args.benchmark == "shell":
+        benchmark_shell(args.iterations)
+    elif args.benchmark == "fastpath":
+        benchmark_fastpath(args.iterations)
+    elif args.loop_prompt:
         # Loop mode: run the prompt repeatedly
         import time
         print(f"--- OSAgent Loop Mode: Repeating prompt every {args.interval} seconds ---")
@@ -481,7 +1165,7 @@ if __name__ == "__main__":
             while True:
                 print(f"\n[Loop Iteration] Sending prompt: {args.loop_prompt}")
                 # Run a single interaction with the loop prompt
-                run_agentic_session(args.loop_prompt, single_interaction=True)
+                run_agentic_session(args.loop_prompt, single_interaction=True, carry_outputs=True)
                 
                 print(f"--- Sleeping for {args.interval} seconds ---")
                 time.sleep(args.interval)
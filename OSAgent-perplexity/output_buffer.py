@@ -0,0 +1,284 @@
+"""
+Bounded capture of command output: the head and tail stay in memory, the rest is spilled to
+a temp file that the model can page through by handle.
+"""
+
+import atexit
+import codecs
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+from config import OUTPUT_HEAD_BYTES, OUTPUT_SPILL_DIR, OUTPUT_SPILL_MAX_BYTES, OUTPUT_TAIL_BYTES
+
+
+class SpillRegistry:
+    """
+    Maps short handles (e.g. 'cmd3.stdout') to spill files holding complete command output.
+
+    Handles are what the model and the session log see; spill files are removed on exit.
+    """
+    _handles: Dict[str, str] = {}
+    _counter = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def next_command_id(cls) -> int:
+        with cls._lock:
+            cls._counter += 1
+            return cls._counter
+
+    @classmethod
+    def register(cls, handle: str, path: str) -> str:
+        with cls._lock:
+            cls._handles[handle] = path
+        return handle
+
+    @classmethod
+    def resolve(cls, handle: str) -> Optional[str]:
+        with cls._lock:
+            return cls._handles.get(handle)
+
+    @classmethod
+    def cleanup(cls):
+        with cls._lock:
+            paths = list(cls._handles.values())
+            cls._handles.clear()
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+atexit.register(SpillRegistry.cleanup)
+
+
+class BinaryContent:
+    """
+    Recognises binary data (an accidental cat of a .gz, an ELF file, ...) from a sample of its
+    first bytes, so it can be summarised instead of decoded into pages of replacement characters.
+    """
+    SAMPLE_BYTES = 8192
+    # (offset, magic, description, what to do instead)
+    SIGNATURES = [
+        (0, b"\x1f\x8b", "gzip compressed data", "zcat, or tar -tzf for an archive"),
+        (0, b"BZh", "bzip2 compressed data", "bzcat"),
+        (0, b"\xfd7zXZ\x00", "xz compressed data", "xzcat"),
+        (0, b"\x28\xb5\x2f\xfd", "zstd compressed data", "zstdcat"),
+        (0, b"PK\x03\x04", "zip archive", "unzip -l"),
+        (257, b"ustar", "tar archive", "tar -tf"),
+        (0, b"\x7fELF", "ELF executable or library", "file, or strings | head"),
+        (0, b"%PDF", "PDF document", "pdftotext"),
+        (0, b"\x89PNG", "PNG image", "file"),
+        (0, b"\xff\xd8\xff", "JPEG image", "file"),
+        (0, b"GIF8", "GIF image", "file"),
+        (0, b"SQLite format 3\x00", "SQLite database", "sqlite3 <file> .tables"),
+        (0, b"!<arch>", "ar archive (.deb, .a)", "dpkg -c or ar t"),
+    ]
+    # Control characters that do not occur in text (tab, newlines, form feed, backspace and ESC do)
+    _CONTROL = bytes(set(range(32)) - {8, 9, 10, 12, 13, 27}) + b"\x7f"
+
+    @classmethod
+    def looks_binary(cls, sample) -> bool:
+        sample = bytes(sample[:cls.SAMPLE_BYTES])
+        if not sample:
+            return False
+        if b"\x00" in sample:
+            return True
+        if len(sample) - len(sample.translate(None, cls._CONTROL)) > len(sample) // 10:
+            return True
+        try:
+            sample.decode("utf-8")
+        except UnicodeDecodeError as e:
+            if e.start < len(sample) - 3:  # Not just a character cut off by the sample's end
+                # Legacy 8-bit text is mostly ASCII; binary data is not
+                return sum(1 for byte in sample if byte >= 0x80) > len(sample) * 3 // 10
+        return False
+
+    @classmethod
+    def describe(cls, sample) -> tuple:
+        """(description, hint) for a binary sample."""
+        for offset, magic, description, hint in cls.SIGNATURES:
+            if bytes(sample[offset:offset + len(magic)]) == magic:
+                return description, hint
+        return "unrecognised binary data", "file, or xxd | head"
+
+
+class BoundedOutput:
+    """
+    Incremental capture of one output stream with bounded memory.
+
+    Keeps the first head_bytes and a ring of the last tail_bytes in memory. Once the
+    stream outgrows the head, everything seen so far and all further data is written
+    to a spill file (up to OUTPUT_SPILL_MAX_BYTES) so the full output can be paged later.
+    """
+
+    def __init__(self, head_bytes: int = OUTPUT_HEAD_BYTES, tail_bytes: int = OUTPUT_TAIL_BYTES):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.spill_path = None
+        self.spilled = 0
+        self._spill = None
+
+    def write(self, data: bytes):
+        data = memoryview(data)  # Slice without copying
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+            if not data:
+                return
+        if self._spill is None and self.spill_path is None:
+            self._open_spill()
+        self._write_spill(data)
+        self.tail += data
+        # Trim lazily so the ring costs amortised O(1) per byte.
+        if len(self.tail) > 2 * self.tail_bytes:
+            del self.tail[: len(self.tail) - self.tail_bytes]
+
+    def _open_spill(self):
+        try:
+            fd, self.spill_path = tempfile.mkstemp(prefix="osagent-", suffix=".out", dir=OUTPUT_SPILL_DIR)
+            self._spill = os.fdopen(fd, "wb")
+            self._write_spill(self.head)
+        except OSError:
+            self._spill = None
+
+    def _write_spill(self, data):
+        if self._spill is None:
+            return
+        room = OUTPUT_SPILL_MAX_BYTES - self.spilled
+        if room <= 0:
+            return
+        chunk = data[:room]
+        self._spill.write(chunk)
+        self.spilled += len(chunk)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.head_bytes + self.tail_bytes
+
+    @property
+    def binary(self) -> bool:
+        return BinaryContent.looks_binary(memoryview(self.head))
+
+    def sha256(self) -> Optional[str]:
+        """Digest of the complete stream, or None if part of it was dropped."""
+        digest = hashlib.sha256()
+        if not self.truncated:
+            digest.update(self.head)
+            digest.update(self.tail)
+            return digest.hexdigest()
+        if self.spill_path is None or self.spilled < self.total:
+            return None
+        self.close()
+        try:
+            with open(self.spill_path, "rb") as f:
+                buffer = bytearray(65536)
+                view = memoryview(buffer)
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    digest.update(view[:n])
+        except OSError:
+            return None
+        return digest.hexdigest()
+
+    def _decode(self, *chunks) -> str:
+        # One incremental decoder, so a character split between head and tail survives
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        return "".join(decoder.decode(chunk) for chunk in chunks) + decoder.decode(b"", final=True)
+
+    def text(self) -> str:
+        """
+        Bounded view of the stream: head, an omission marker, then the tail. Only that view
+        is decoded; binary data is summarised instead.
+        """
+        if self.binary:
+            description, hint = BinaryContent.describe(memoryview(self.head))
+            digest = self.sha256()
+            return (
+                f"[binary output: {self.total} bytes of {description}, not shown"
+                + (f"; sha256 {digest}" if digest else "")
+                + f". To inspect it, try: {hint}]"
+            )
+        if not self.truncated:
+            return self._decode(memoryview(self.head), memoryview(self.tail))
+        omitted = self.total - len(self.head) - min(len(self.tail), self.tail_bytes)
+        return (
+            self._decode(memoryview(self.head))
+            + f"\n[... {omitted} bytes omitted ...]\n"
+            + self._decode(memoryview(self.tail)[-self.tail_bytes:])
+        )
+
+    def complete_text(self, limit: int) -> Optional[str]:
+        """The whole stream if it is text of at most limit bytes and nothing was dropped, else None."""
+        if self.total > limit or self.binary:
+            return None
+        if not self.truncated:
+            return self._decode(memoryview(self.head), memoryview(self.tail))
+        if self.spill_path is None or self.spilled < self.total:
+            return None
+        self.close()
+        try:
+            with open(self.spill_path, "rb") as f:
+                return f.read().decode("utf-8", errors="replace")
+        except OSError:
+            return None
+
+    def complete_lines(self):
+        """
+        Iterator over every line of the stream, read from the spill file when the stream
+        was truncated, or None if part of it was dropped. Memory stays at one line.
+        """
+        if self.binary:
+            return None
+        if not self.truncated:
+            return iter(self._decode(memoryview(self.head), memoryview(self.tail)).splitlines())
+        if self.spill_path is None or self.spilled < self.total:
+            return None
+        self.close()
+
+        def read():
+            with open(self.spill_path, "rb") as f:
+                for line in f:
+                    yield line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+        return read()
+
+    def spill_note(self, handle: str) -> str:
+        """Describe where the complete stream can be read, or '' if nothing was omitted."""
+        if not self.truncated:
+            return ""
+        if self.spill_path is None:
+            return f"[{handle}: {self.total} bytes total, output truncated; spill file unavailable]"
+        SpillRegistry.register(handle, self.spill_path)
+        if self.spilled < self.total:
+            return (
+                f"[{handle}: {self.total} bytes total; first {self.spilled} bytes saved to handle "
+                f"'{handle}' ({self.spill_path}), remainder dropped]"
+            )
+        return f"[{handle}: {self.total} bytes total; full output saved to handle '{handle}' ({self.spill_path})]"
+
+    def discard(self, force: bool = False):
+        """Drop the spill file if nothing was omitted from the view (or unconditionally with force)."""
+        self.close()
+        if self.spill_path is not None and (force or not self.truncated):
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
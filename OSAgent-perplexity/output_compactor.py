@@ -0,0 +1,244 @@
+"""
+Compact tables for the padded output of a few verbose commands (df, free, ps, ss, systemctl, dpkg -l).
+"""
+
+import json
+import os
+import re
+import tempfile
+from typing import List, NamedTuple, Optional
+
+from config import (COMPACT_MAX_CELL_CHARS, COMPACT_MAX_INPUT_BYTES, COMPACT_OUTPUT, COMPACT_OUTPUT_FORMAT,
+                    OUTPUT_SPILL_DIR)
+from osagent_common.safety_policy import command_segments
+from output_buffer import BoundedOutput, SpillRegistry
+
+
+class CompactResult(NamedTuple):
+    text: str
+    note: str  # Sizes before/after and the handle of the original output
+    truncated: bool  # The compacted table itself had to be cut (see its .compact handle)
+
+
+class OutputCompactor:
+    """
+    Turns the human-formatted tables of a few well-known commands into compact ones.
+
+    Parsers work from the printed header, not from the command line, so option
+    variants (df -h / -T / -i, ps aux / -ef, ss -tulpn / -ltn, ...) are handled as long as
+    the layout is recognised. Columns that rarely matter (ps VSZ/TTY/START/TIME, ss queues,
+    dpkg architecture and description, ...) are dropped, padding and legends go, and long
+    cells are cut. Anything unexpected makes the parser give up and the output is passed
+    through unchanged.
+    """
+    # Kernel threads in ps output: no memory of their own and a [bracketed] name
+    _KERNEL_THREAD = re.compile(r"^\[.*\]$")
+    _SS_PROCESS = re.compile(r'\("([^"]*)",pid=(\d+)')
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Rough token count: words, punctuation and runs of whitespace are pieces, and long
+        pieces cost one token per 4 characters. Close enough to compare before and after.
+        """
+        return sum(-(-len(piece) // 4) for piece in re.findall(r"\w+|[^\w\s]|\s+", text))
+
+    @classmethod
+    def parser_for(cls, command: str):
+        if any(c in command for c in "|;&<>$`\n"):
+            return None  # Filtered or redirected output is no longer the plain table
+        segments = command_segments(command)
+        if len(segments) != 1:
+            return None
+        parts = segments[0].split()
+        base = os.path.basename(parts[0])
+        args = parts[1:]
+        if base == "systemctl":
+            if any(not arg.startswith("-") for arg in args) and (not args or args[0] != "list-units"):
+                return None
+            return cls._systemctl
+        if base == "dpkg":
+            return cls._dpkg if args and args[0] in ("-l", "--list") else None
+        return {"df": cls._df, "free": cls._free, "ps": cls._ps, "ss": cls._ss}.get(base)
+
+    @classmethod
+    def compact(cls, command: str, stdout: BoundedOutput, handle: str) -> Optional[CompactResult]:
+        """Compacted stdout of command, or None when it is not a known table or nothing is gained."""
+        if not COMPACT_OUTPUT:
+            return None
+        parser = cls.parser_for(command)
+        if parser is None:
+            return None
+        raw = stdout.complete_text(COMPACT_MAX_INPUT_BYTES)
+        if raw is None:
+            return None
+        try:
+            parsed = parser(raw.splitlines())
+        except (ValueError, IndexError):
+            parsed = None
+        if parsed is None:
+            return None
+        columns, rows, omitted = parsed
+        rows = [[cls._cell(value) for value in row] for row in rows]
+        if COMPACT_OUTPUT_FORMAT == "json":
+            text = json.dumps({"columns": columns, "rows": rows}, separators=(",", ":"))
+        else:
+            text = "\n".join("\t".join(row) for row in [columns] + rows)
+        tokens_before, tokens_after = cls.estimate_tokens(raw), cls.estimate_tokens(text)
+        if tokens_after >= tokens_before:
+            return None
+        summary = (
+            f"compacted {parser.__name__.lstrip('_')} output: {len(raw.encode())} -> {len(text.encode())} bytes, "
+            f"~{tokens_before} -> ~{tokens_after} tokens"
+        )
+        if omitted:
+            summary += f"; {omitted} omitted"
+        return cls.finish(stdout, handle, text, summary)
+
+    @staticmethod
+    def finish(stdout: BoundedOutput, handle: str, text: str, summary: str) -> CompactResult:
+        """
+        Package a rewritten stdout: keep the original readable under handle and bound the
+        rewritten text itself (a very long table, e.g. dpkg -l on a full system, may still
+        be too big), spilling it under a '.compact' handle.
+        """
+        table = BoundedOutput(stdout.head_bytes, stdout.tail_bytes)
+        table.write(text.encode())
+        table.close()
+        compact_handle = re.sub(r"\.stdout$", ".compact", handle)
+
+        # Keep the original readable: the spill file if it was truncated, otherwise a copy
+        if stdout.truncated:
+            stdout.spill_note(handle)
+        else:
+            try:
+                fd, path = tempfile.mkstemp(prefix="osagent-", suffix=".out", dir=OUTPUT_SPILL_DIR)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(stdout.head + stdout.tail)
+                SpillRegistry.register(handle, path)
+            except OSError:
+                handle = None
+        note = f"[{summary}; original output: handle '{handle}']" if handle else f"[{summary}]"
+        if table.truncated:
+            note += "\n" + table.spill_note(compact_handle)
+        else:
+            table.discard()
+        return CompactResult(table.text(), note, table.truncated)
+
+    @staticmethod
+    def _cell(value: str) -> str:
+        value = re.sub(r"\s+", " ", value)
+        if len(value) > COMPACT_MAX_CELL_CHARS:
+            value = value[:COMPACT_MAX_CELL_CHARS - 3] + "..."
+        return value
+
+    @staticmethod
+    def _split_rows(lines: List[str], header: List[str]) -> List[List[str]]:
+        """Whitespace-split rows; the last column takes the rest of the line (spaces and all)."""
+        rows = []
+        for line in lines:
+            if not line.strip():
+                continue
+            cells = line.split(None, len(header) - 1)
+            if len(cells) < len(header) - 1:
+                raise ValueError(f"unexpected row: {line!r}")
+            rows.append(cells + [""] * (len(header) - len(cells)))
+        return rows
+
+    @staticmethod
+    def _select(header: List[str], rows: List[List[str]], keep: List[str]) -> tuple:
+        indexes = [header.index(name) for name in keep if name in header]
+        return [header[i] for i in indexes], [[row[i] for i in indexes] for row in rows]
+
+    @classmethod
+    def _df(cls, lines: List[str]):
+        if not lines or not lines[0].startswith("Filesystem"):
+            return None
+        header = lines[0].replace("Mounted on", "Mounted_on").split()
+        if header[-1] != "Mounted_on":
+            return None
+        return header, cls._split_rows(lines[1:], header), ""
+
+    @staticmethod
+    def _free(lines: List[str]):
+        if not lines or not lines[0].split() or lines[0].split()[0] != "total":
+            return None
+        header = [""] + lines[0].split()
+        rows = []
+        for line in lines[1:]:
+            cells = line.split()
+            if not cells:
+                continue
+            if not cells[0].endswith(":"):
+                return None
+            rows.append([cells[0].rstrip(":")] + cells[1:] + [""] * (len(header) - len(cells)))
+        return header, rows, ""
+
+    @classmethod
+    def _ps(cls, lines: List[str]):
+        if not lines:
+            return None
+        header = lines[0].split()
+        rows = cls._split_rows(lines[1:], header)
+        if header[:3] == ["USER", "PID", "%CPU"] and header[-1] == "COMMAND":  # ps aux
+            keep = ["USER", "PID", "%CPU", "%MEM", "RSS", "STAT", "COMMAND"]
+            threads = [row for row in rows if row[header.index("VSZ")] == "0" and cls._KERNEL_THREAD.match(row[-1])]
+        elif header[:4] == ["UID", "PID", "PPID", "C"] and header[-1] == "CMD":  # ps -ef
+            keep = ["UID", "PID", "PPID", "STIME", "CMD"]
+            threads = [row for row in rows if "2" in (row[1], row[2]) and cls._KERNEL_THREAD.match(row[-1])]
+        else:
+            return header, rows, ""  # Columns the caller picked (ps -eo ...): only strip padding
+        skipped = {id(row) for row in threads}
+        rows = [row for row in rows if id(row) not in skipped]
+        columns, rows = cls._select(header, rows, keep)
+        return columns, rows, f"{len(threads)} kernel threads" if threads else ""
+
+    @classmethod
+    def _ss(cls, lines: List[str]):
+        if not lines or "Local Address:Port" not in lines[0]:
+            return None
+        # ss may run the last two headings together ("Peer Address:PortProcess")
+        header = re.sub(r"(Local|Peer) Address:Port", r"\1 ", lines[0]).split()
+        if header[-1] != "Process":
+            header.append("Process")
+        rows = cls._split_rows(lines[1:], header)
+        peer = header.index("Peer")
+        for row in rows:
+            # users:(("sshd",pid=612,fd=3),("sshd",pid=613,fd=3)) -> sshd/612,sshd/613
+            row[-1] = ",".join(f"{name}/{pid}" for name, pid in cls._SS_PROCESS.findall(row[-1])) or row[-1]
+        keep = ["Netid", "State", "Local"]
+        if any(not re.match(r"^(\*|0\.0\.0\.0|\[::\]|\[::ffff:0\.0\.0\.0\]):\*$|^\*$", row[peer]) for row in rows):
+            keep.append("Peer")  # Only listening sockets: the peer is always a wildcard
+        if any(row[-1] for row in rows):
+            keep.append("Process")
+        columns, rows = cls._select(header, rows, keep)
+        return columns, rows, ""
+
+    @classmethod
+    def _systemctl(cls, lines: List[str]):
+        start = next((i for i, line in enumerate(lines) if line.split()[:3] == ["UNIT", "LOAD", "ACTIVE"]), None)
+        if start is None:
+            return None
+        header = lines[start].split()
+        body = []
+        for line in lines[start + 1:]:
+            if not line.strip():
+                break  # The legend and unit count follow a blank line
+            body.append(line.lstrip("●* "))
+        rows = cls._split_rows(body, header)
+        keep = ["UNIT", "ACTIVE", "SUB", "DESCRIPTION"]
+        if any(row[header.index("LOAD")] != "loaded" for row in rows):
+            keep.insert(1, "LOAD")
+        columns, rows = cls._select(header, rows, keep)
+        return columns, rows, "legend"
+
+    @classmethod
+    def _dpkg(cls, lines: List[str]):
+        start = next((i for i, line in enumerate(lines) if line.startswith("||/ Name")), None)
+        if start is None:
+            return None
+        header = ["Status"] + lines[start][3:].split()
+        body = [line for line in lines[start + 1:] if not line.startswith("+++-")]
+        rows = cls._split_rows(body, header)
+        columns, rows = cls._select(header, rows, ["Status", "Name", "Version"])
+        return columns, rows, "architecture and description columns"
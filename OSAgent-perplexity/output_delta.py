@@ -0,0 +1,110 @@
+"""
+Repeated command output sent as a diff against the previous run, or as a note when it did not change.
+"""
+
+import difflib
+import os
+import tempfile
+import threading
+import time
+from typing import Dict
+
+from config import (DELTA_CARRY_MAX_BYTES, DELTA_CONTEXT_LINES, DELTA_MAX_CHANGED_RATIO, DELTA_MAX_COMMANDS,
+                    DELTA_OUTPUT, OUTPUT_SPILL_DIR)
+from osagent_common.safety_policy import command_key
+from output_buffer import SpillRegistry
+
+
+class OutputDelta:
+    """
+    Remembers the last output of each command within the current conversation and replaces a
+    repeat that barely changed with a unified diff against it, or a one-line note when nothing
+    changed. An interactive turn is a new conversation (command output is not carried over to later
+    turns), so there every command starts again with its full output. --loop-prompt iterations keep
+    the outputs instead and pass them on (carry_over), so a repeat is diffed against output the
+    model has been shown.
+
+    The current output is always written to a stable per-command handle, so the model can
+    [[READ: ...]] it in full whatever it was sent.
+    """
+    _last: Dict[str, tuple] = {}  # command -> (output, changed_at, seen_at, handle)
+    _handles = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _clock(at: float) -> str:
+        return time.strftime("%H:%M", time.localtime(at))
+
+    @classmethod
+    def new_conversation(cls):
+        """Forget every baseline: the model has seen none of the earlier output."""
+        with cls._lock:
+            cls._last.clear()
+
+    @classmethod
+    def carry_over(cls) -> str:
+        """
+        The latest output of each remembered command, newest first, for the next conversation.
+        Outputs beyond DELTA_CARRY_MAX_BYTES are forgotten: the model will not see them.
+        """
+        with cls._lock:
+            kept, sections, size = [], [], 0
+            for key, entry in reversed(list(cls._last.items())):  # Newest first
+                output, _, seen_at, handle = entry
+                section = f"$ {key}\n[run at {cls._clock(seen_at)}; handle '{handle}']\n{output.rstrip()}"
+                if size + len(section.encode()) > DELTA_CARRY_MAX_BYTES:
+                    continue
+                size += len(section.encode())
+                kept.append((key, entry))
+                sections.append(section)
+            cls._last = dict(reversed(kept))  # Oldest first again, as apply() evicts
+        return "\n\n".join(sections)
+
+    @classmethod
+    def _save(cls, handle: str, output: str):
+        path = SpillRegistry.resolve(handle)
+        try:
+            if path is None:
+                fd, path = tempfile.mkstemp(prefix="osagent-", suffix=".out", dir=OUTPUT_SPILL_DIR)
+                os.close(fd)
+                SpillRegistry.register(handle, path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(output)
+        except OSError:
+            pass
+
+    @classmethod
+    def apply(cls, command: str, output: str) -> str:
+        """What to send for this run of command: output itself, a diff or an 'unchanged' note."""
+        if not DELTA_OUTPUT:
+            return output
+        key = command_key(command)
+        now = time.time()
+        with cls._lock:
+            previous = cls._last.pop(key, None)
+            if previous is None:
+                if len(cls._last) >= DELTA_MAX_COMMANDS:
+                    del cls._last[next(iter(cls._last))]
+                cls._handles += 1
+                handle = f"last{cls._handles}.out"
+                cls._save(handle, output)
+                cls._last[key] = (output, now, now, handle)
+                return output
+            old, changed_at, seen_at, handle = previous
+            if old == output:
+                cls._last[key] = (output, changed_at, now, handle)
+                note = f"[output unchanged since {cls._clock(changed_at)}; full output: handle '{handle}']"
+                return note if len(note) < len(output) else output
+            cls._save(handle, output)
+            cls._last[key] = (output, now, now, handle)
+        old_lines, new_lines = old.splitlines(), output.splitlines()
+        # Drop the ---/+++ file header: the note says what is compared
+        diff = list(difflib.unified_diff(old_lines, new_lines, n=DELTA_CONTEXT_LINES, lineterm=""))[2:]
+        changed = sum(1 for line in diff if line[:1] in "+-")
+        if changed > DELTA_MAX_CHANGED_RATIO * max(len(old_lines), len(new_lines)):
+            return output
+        delta = (
+            f"[output changed since the run at {cls._clock(seen_at)}: {changed} lines differ, unified diff "
+            f"below; full output: handle '{handle}']\n" + "\n".join(diff)
+        )
+        return delta if len(delta) < len(output) else output
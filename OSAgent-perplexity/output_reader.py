@@ -0,0 +1,170 @@
+"""
+Paging through and searching spilled command output or files, without loading them whole.
+"""
+
+import array
+import mmap
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+from command_policy import is_command_safe
+from config import (READ_DEFAULT_LINES, READ_INDEX_STRIDE, READ_MAX_LINES, READ_MAX_LINE_CHARS,
+                    SEARCH_MAX_MATCHES)
+from output_buffer import BinaryContent, SpillRegistry
+
+
+class OutputReader:
+    """
+    Pages through spilled command output (by handle) or any readable file without loading it.
+
+    The file is accessed through mmap. Line offsets come from a sparse newline index
+    (one entry every READ_INDEX_STRIDE lines) that is only extended as far as a
+    request needs, and is kept per file version so later pages reuse it.
+    """
+    _indexes: Dict[tuple, array.array] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def resolve_target(target: str, automation_mode: bool = False) -> tuple[Optional[str], str]:
+        """Map a handle or path to a readable regular file. Returns (path, error)."""
+        path = SpillRegistry.resolve(target)
+        if path is None:
+            # Plain files go through the same policy as reading them with cat would
+            is_safe, reason = is_command_safe(f"cat {target}", automation_mode)
+            if not is_safe:
+                if automation_mode:
+                    return None, "Error: Read blocked by security policy."
+                return None, f"Error: Read blocked by safety filter. Reason: {reason}"
+            path = os.path.expanduser(target)
+        if not os.path.isfile(path):
+            return None, f"Error: '{target}' is not a known output handle or readable file."
+        if not os.access(path, os.R_OK):
+            return None, f"Error: Permission denied reading '{target}'."
+        return path, ""
+
+    @classmethod
+    def _line_index(cls, path: str, st: os.stat_result) -> array.array:
+        key = (path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with cls._lock:
+            index = cls._indexes.get(key)
+            if index is None:
+                # Entry i is the byte offset of line i * READ_INDEX_STRIDE
+                index = array.array("Q", [0])
+                cls._indexes = {k: v for k, v in cls._indexes.items() if k[0] != path}
+                cls._indexes[key] = index
+            return index
+
+    @staticmethod
+    def _seek_line(mm: mmap.mmap, index: array.array, line: int) -> int:
+        """Byte offset of the start of line (0-based), or -1 past the end of the file."""
+        checkpoint = line // READ_INDEX_STRIDE
+        size = len(mm)
+        while len(index) <= checkpoint:
+            pos = index[-1]
+            for _ in range(READ_INDEX_STRIDE):
+                pos = mm.find(b"\n", pos) + 1
+                if pos == 0 or pos >= size:
+                    return -1
+            index.append(pos)
+        pos = index[checkpoint]
+        for _ in range(line % READ_INDEX_STRIDE):
+            pos = mm.find(b"\n", pos) + 1
+            if pos == 0 or pos >= size:
+                return -1
+        return pos
+
+    @staticmethod
+    def _clip(mm: mmap.mmap, start: int, stop: int) -> str:
+        """Line mm[start:stop] (newline excluded) for display, decoding no more of it than is shown."""
+        line = mm[start:min(stop, start + READ_MAX_LINE_CHARS * 4)]  # At most 4 bytes per character
+        text = line.decode("utf-8", errors="replace").rstrip("\r")
+        if len(text) > READ_MAX_LINE_CHARS or len(line) < stop - start:
+            shown = text[:READ_MAX_LINE_CHARS]
+            text = shown + f" [... {stop - start - len(shown.encode())} bytes]"
+        return text
+
+    @classmethod
+    def read_lines(cls, path: str, start: int, count: int) -> str:
+        count = max(1, min(count, READ_MAX_LINES))
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return "(empty file)"
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                sample = mm[:BinaryContent.SAMPLE_BYTES]
+                if BinaryContent.looks_binary(sample):
+                    description, hint = BinaryContent.describe(sample)
+                    return f"(binary file: {st.st_size} bytes of {description}; to inspect it, try: {hint})"
+                pos = cls._seek_line(mm, cls._line_index(path, st), start)
+                if pos < 0:
+                    return f"(no line {start}: end of file)"
+                lines = []
+                while len(lines) < count and pos < st.st_size:
+                    stop = mm.find(b"\n", pos)
+                    stop = st.st_size if stop < 0 else stop
+                    lines.append(f"{start + len(lines)}: {cls._clip(mm, pos, stop)}")
+                    pos = stop + 1
+                more = "" if pos >= st.st_size else f"\n[more: continue with start_line {start + len(lines)}]"
+                return "\n".join(lines) + more
+
+    @classmethod
+    def search(cls, path: str, pattern: str) -> str:
+        try:
+            regex = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+        except re.error as e:
+            return f"Error: Invalid regular expression: {e}"
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return "(empty file)"
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                results = []
+                line_no, counted_to, next_start = 0, 0, 0
+                for match in regex.finditer(mm):
+                    if match.start() < next_start:
+                        continue  # already reported this line
+                    # Count newlines incrementally so line numbers cost one pass overall
+                    pos = mm.find(b"\n", counted_to, match.start())
+                    while pos >= 0:
+                        line_no += 1
+                        counted_to = pos + 1
+                        pos = mm.find(b"\n", counted_to, match.start())
+                    end = mm.find(b"\n", match.start())
+                    next_start = size if end < 0 else end + 1
+                    results.append(f"{line_no}: {cls._clip(mm, counted_to, size if end < 0 else end)}")
+                    if len(results) >= SEARCH_MAX_MATCHES:
+                        results.append(f"[stopped after {SEARCH_MAX_MATCHES} matching lines]")
+                        break
+        return "\n".join(results) if results else "(no matches)"
+
+    @classmethod
+    def read_request(cls, target: str, args: str, automation_mode: bool = False) -> str:
+        """Handle '[[READ: <handle|path> [start_line] [line_count]]]'."""
+        path, error = cls.resolve_target(target, automation_mode)
+        if path is None:
+            return error
+        try:
+            numbers = [int(n) for n in args.split()]
+        except ValueError:
+            return "Error: READ expects: <handle|path> [start_line] [line_count]"
+        start = max(0, numbers[0]) if numbers else 0
+        count = numbers[1] if len(numbers) > 1 else READ_DEFAULT_LINES
+        try:
+            return cls.read_lines(path, start, count)
+        except (OSError, ValueError) as e:
+            return f"Error reading '{target}': {e}"
+
+    @classmethod
+    def search_request(cls, target: str, pattern: str, automation_mode: bool = False) -> str:
+        """Handle '[[SEARCH: <handle|path> <regex>]]'."""
+        if not pattern:
+            return "Error: SEARCH expects: <handle|path> <regex>"
+        path, error = cls.resolve_target(target, automation_mode)
+        if path is None:
+            return error
+        try:
+            return cls.search(path, pattern)
+        except (OSError, ValueError) as e:
+            return f"Error searching '{target}': {e}"
@@ -0,0 +1,138 @@
+"""
+A long-lived bash worker that runs the agent's commands, so cd and exports carry over between them.
+"""
+
+import os
+import selectors
+import shlex
+import subprocess
+import threading
+import uuid
+
+from config import PERSISTENT_SHELL_PATH, RESOURCE_LIMITS
+from output_buffer import BoundedOutput
+from resource_limits import ResourceLimiter
+from running_command import ProcessTree
+from timeout_policy import TimeoutPolicy
+
+
+class PersistentShell:
+    """
+    A long-lived bash worker that keeps cwd, exported variables and functions between commands.
+
+    Commands are written to the worker's stdin wrapped in eval and followed by a random
+    sentinel on both stdout and stderr, which frames the output and carries the exit
+    code. A command that exceeds its timeout (or kills the shell) takes the worker down
+    with it; a fresh worker is spawned for the next command.
+    """
+
+    def __init__(self, shell: str = PERSISTENT_SHELL_PATH):
+        self.shell = shell
+        self.process = None
+        self.spawn_count = 0
+        self._lock = threading.Lock()
+
+    def _spawn(self):
+        argv = [self.shell, "--noprofile", "--norc"]
+        self.process = subprocess.Popen(
+            # The limits apply to the worker and all of its commands together, with RESOURCE_LIMITS = "all" only
+            ResourceLimiter.wrap(argv) if RESOURCE_LIMITS == "all" else argv,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,  # own process group, so a hung command can be killed with its children
+        )
+        self.spawn_count += 1
+
+    def close(self):
+        if self.process is None:
+            return
+        ProcessTree.terminate(self.process)
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+        self.process = None
+
+    def run(self, command: str, timeout) -> tuple[int, BoundedOutput, BoundedOutput]:
+        """
+        Run one command in the worker. Same contract as TerminalTool._run_captured.
+
+        timeout is a TimeoutPolicy or a number of seconds. Raises subprocess.TimeoutExpired
+        after killing the worker when it expires.
+        Ctrl-C also takes the worker (and the command) down before KeyboardInterrupt propagates.
+        """
+        with self._lock:
+            if self.process is None or self.process.poll() is not None:
+                self.close()
+                self._spawn()
+            marker = f"__OSAGENT_DONE_{uuid.uuid4().hex}__".encode()
+            script = (
+                f"eval {shlex.quote(command)} < /dev/null\n"
+                f"printf '%s %d\\n' '{marker.decode()}' \"$?\"\n"
+                f"printf '%s\\n' '{marker.decode()}' >&2\n"
+            )
+            try:
+                self.process.stdin.write(script.encode())
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                self.close()
+                raise
+
+            streams = {self.process.stdout: BoundedOutput(), self.process.stderr: BoundedOutput()}
+            carry = {pipe: b"" for pipe in streams}
+            trailer = {}
+            policy = TimeoutPolicy.coerce(command, timeout)
+            policy.start()
+            try:
+                with selectors.DefaultSelector() as selector:
+                    for pipe in streams:
+                        selector.register(pipe, selectors.EVENT_READ)
+                    while selector.get_map():
+                        if policy.expired():
+                            for buffer in streams.values():
+                                buffer.discard(force=True)
+                            self.close()
+                            policy.record()
+                            raise subprocess.TimeoutExpired(command, policy.elapsed())
+                        for key, _ in selector.select(policy.remaining()):
+                            pipe = key.fileobj
+                            chunk = os.read(key.fd, 65536)
+                            if not chunk:
+                                # The command ended the shell (e.g. 'exit'); report what it left behind.
+                                selector.unregister(pipe)
+                                streams[pipe].write(carry[pipe])
+                                carry[pipe] = b""
+                                continue
+                            policy.saw_output(len(chunk))
+                            if pipe in trailer:
+                                trailer[pipe] += chunk
+                            else:
+                                data = carry[pipe] + chunk
+                                index = data.find(marker)
+                                if index < 0:
+                                    # Hold back enough bytes to recognise a marker split across reads
+                                    keep = len(marker) - 1
+                                    streams[pipe].write(memoryview(data)[:-keep])
+                                    carry[pipe] = data[-keep:]
+                                    continue
+                                streams[pipe].write(data[:index])
+                                carry[pipe] = b""
+                                trailer[pipe] = data[index + len(marker):]
+                            if b"\n" in trailer[pipe]:
+                                selector.unregister(pipe)
+            except KeyboardInterrupt:
+                for buffer in streams.values():
+                    buffer.discard(force=True)
+                self.close()
+                policy.record("cancelled")
+                raise
+            policy.record("completed")
+
+            for buffer in streams.values():
+                buffer.close()
+            stdout, stderr = streams[self.process.stdout], streams[self.process.stderr]
+            if self.process.stdout in trailer:
+                returncode = int(trailer[self.process.stdout].split(b"\n", 1)[0].strip() or 0)
+            else:
+                returncode = self.process.wait()
+                self.close()
+            return returncode, stdout, stderr
@@ -0,0 +1,195 @@
+"""
+Checks run before a command starts: shell syntax and whether its programs are installed.
+"""
+
+import difflib
+import os
+import re
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+from config import PERSISTENT_SHELL, PERSISTENT_SHELL_PATH, PREFLIGHT_CHECKS
+from osagent_common.safety_policy import WRAPPERS, ShellSyntaxError, parse_shell, simple_commands, wrapped_command
+
+
+class PreflightCheck:
+    """
+    Cheap checks run before a command starts, so a typo, a missing program or a quoting
+    mistake costs an immediate, specific error rather than a run and a model round trip.
+    """
+    SHELL_BUILTINS = frozenset({
+        ".", ":", "[", "[[", "alias", "bg", "break", "builtin", "cd", "command", "continue", "declare",
+        "echo", "eval", "exec", "exit", "export", "false", "fg", "getopts", "hash", "help", "history",
+        "jobs", "kill", "let", "local", "printf", "pushd", "popd", "dirs", "pwd", "read", "readonly",
+        "return", "set", "shift", "shopt", "source", "test", "times", "trap", "true", "type",
+        "typeset", "ulimit", "umask", "unalias", "unset", "wait",
+    })
+    # Tools models often reach for that minimal installs lack, and what to use instead
+    ALTERNATIVES = {
+        "htop": ["top -b -n1", "ps aux --sort=-%cpu"],
+        "atop": ["top -b -n1", "vmstat 1 5"],
+        "iotop": ["iostat -x", "vmstat 1 5", "cat /proc/pressure/io"],
+        "iostat": ["vmstat 1 5", "cat /proc/diskstats"],
+        "netstat": ["ss"],
+        "ifconfig": ["ip addr"],
+        "route": ["ip route"],
+        "arp": ["ip neigh"],
+        "nslookup": ["dig", "host", "getent hosts"],
+        "dig": ["host", "nslookup", "getent hosts"],
+        "lsof": ["ss -p", "ls -l /proc/<pid>/fd"],
+        "service": ["systemctl"],
+        "traceroute": ["tracepath", "mtr"],
+        "vim": ["vi", "nano"],
+        "curl": ["wget"],
+        "wget": ["curl"],
+        "tree": ["find . -maxdepth 2"],
+        "locate": ["find / -name"],
+        "killall": ["pkill"],
+        "python": ["python3"],
+        "pip": ["pip3", "python3 -m pip"],
+    }
+    # Listed in the system prompt as installed or not
+    COMMON_TOOLS = [
+        "top", "htop", "atop", "iotop", "vmstat", "iostat", "mpstat", "sar", "pidstat", "lsof", "strace",
+        "ss", "netstat", "ip", "ifconfig", "ping", "traceroute", "tracepath", "dig", "nslookup", "host",
+        "curl", "wget", "nc", "systemctl", "journalctl", "service", "docker", "podman", "kubectl",
+        "apt", "dpkg", "snap", "dnf", "yum", "rpm", "git", "python3", "perl", "gcc", "make", "jq",
+        "rsync", "tar", "zip", "unzip", "vim", "nano", "less", "tree", "smartctl", "lsblk", "fdisk",
+        "ufw", "iptables", "nft", "sudo",
+    ]
+    _index: Dict[str, str] = {}
+    _index_key: tuple = ()
+    _lock = threading.Lock()
+
+    @classmethod
+    def path_index(cls) -> Dict[str, str]:
+        """Program name -> path for everything executable on PATH (first match wins, as in the shell)."""
+        key = []
+        for directory in os.environ.get("PATH", os.defpath).split(":"):
+            try:
+                key.append((directory, os.stat(directory).st_mtime_ns))
+            except OSError:
+                continue
+        key = tuple(key)
+        with cls._lock:
+            if key != cls._index_key:
+                index: Dict[str, str] = {}
+                for directory, _ in key:
+                    try:
+                        entries = list(os.scandir(directory))
+                    except OSError:
+                        continue
+                    for entry in entries:
+                        try:
+                            if entry.name not in index and entry.is_file() and os.access(entry.path, os.X_OK):
+                                index[entry.name] = entry.path
+                        except OSError:
+                            continue
+                cls._index, cls._index_key = index, key
+            return cls._index
+
+    @classmethod
+    def programs(cls, command: str) -> List[str]:
+        """
+        Names of the programs a command line starts, as far as they can be known before running
+        it: each simple command and the command behind a wrapper (sudo -u postgres psql -> sudo,
+        psql). A name is left out when it comes from an expansion, or follows a wrapper option
+        whose arity is unknown (sudo -i, xargs -0). Lines the shell parser cannot follow
+        (function definitions) are not checked.
+        """
+        try:
+            commands = list(simple_commands(parse_shell(command)))
+        except ShellSyntaxError:
+            return []
+        names = []
+        for simple in commands:
+            words = list(simple.words)
+            while words:
+                name = words[0]
+                if any(c in name for c in "$`*?[{"):
+                    break  # Only known once the shell expands it
+                names.append(name)
+                base = os.path.basename(name)
+                if base not in WRAPPERS:
+                    break
+                wrapped = wrapped_command(words)
+                if cls._unknown_option(base, words[1:len(words) - len(wrapped)]):
+                    break
+                words = wrapped
+        return names
+
+    @staticmethod
+    def _unknown_option(wrapper: str, arguments: List[str]) -> bool:
+        """True if the wrapper got an option that may or may not take the next word as its value."""
+        takes_value = WRAPPERS[wrapper][0]
+        index = 0
+        while index < len(arguments):
+            word = arguments[index]
+            if word in takes_value:
+                index += 2
+                continue
+            if word.startswith("-") and word != "--" and "=" not in word and not word[1:].isdigit():
+                return True
+            index += 1
+        return False
+
+    @staticmethod
+    def _syntax_error(command: str) -> Optional[str]:
+        shell = PERSISTENT_SHELL_PATH if PERSISTENT_SHELL else "/bin/sh"
+        try:
+            checked = subprocess.run([shell, "-n", "-c", command], capture_output=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            return None  # Cannot tell: let the real run decide
+        if checked.returncode == 0:
+            return None
+        message = checked.stderr.decode("utf-8", errors="replace").strip().splitlines()
+        # "sh: 1: Syntax error: ..." / "bash: -c: line 1: syntax error ..." -> the message itself
+        return re.sub(r"^\S+: (-c: )?(line )?\d+: ", "", message[-1]) if message else "rejected by the shell"
+
+    @classmethod
+    def _missing(cls, name: str, index: Dict[str, str]) -> str:
+        problem = f"'{name}' is not installed (not found in PATH)"
+        alternatives = [
+            alternative for alternative in cls.ALTERNATIVES.get(name, [])
+            if alternative.split()[0] in index or alternative.split()[0] in cls.SHELL_BUILTINS
+        ]
+        if alternatives:
+            problem += "; installed alternatives: " + ", ".join(alternatives)
+        else:
+            close = difflib.get_close_matches(name, list(index), n=3, cutoff=0.8)
+            if close:
+                problem += "; did you mean: " + ", ".join(close)
+        return problem
+
+    @classmethod
+    def check(cls, command: str) -> Optional[str]:
+        """An error describing why command cannot work, or None if it passes."""
+        if not PREFLIGHT_CHECKS:
+            return None
+        problems = []
+        # Plain words cannot be a syntax error; anything else is checked by the shell itself
+        if not re.fullmatch(r"[\w\s./:=,+@%^~-]*", command):
+            error = cls._syntax_error(command)
+            if error:
+                problems.append(f"shell syntax error: {error}")
+        # A persistent worker may hold functions and PATH changes from earlier steps
+        if not PERSISTENT_SHELL:
+            index = cls.path_index()
+            for name in dict.fromkeys(cls.programs(command)):
+                if "/" in name:
+                    if os.path.isabs(name) and not os.access(name, os.X_OK):
+                        problems.append(f"'{name}' does not exist or is not executable")
+                elif name not in index and name not in cls.SHELL_BUILTINS:
+                    problems.append(cls._missing(name, index))
+        if not problems:
+            return None
+        return "Error: Pre-flight check failed; the command was not run.\n" + "\n".join(f"- {p}" for p in problems)
+
+    @classmethod
+    def installed_summary(cls) -> str:
+        """Which commonly used tools this host has, for the system prompt."""
+        index = cls.path_index()
+        present = [tool for tool in cls.COMMON_TOOLS if tool in index]
+        missing = [tool for tool in cls.COMMON_TOOLS if tool not in index]
+        return f"Installed: {', '.join(present) or 'none of the usual tools'}.\nNot installed: {', '.join(missing) or 'none'}."
@@ -0,0 +1,134 @@
+"""
+Resource limits for agent-issued commands: a transient systemd scope (cgroup v2) or nice/ionice.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from typing import List, Optional
+
+from admission import AdmissionController
+from config import (LIMIT_CPU_PERCENT, LIMIT_FALLBACK_NICE, LIMIT_FALLBACK_PRLIMIT, LIMIT_IO_WEIGHT,
+                    LIMIT_MEMORY_BYTES, LIMIT_PIDS, RESOURCE_LIMITS)
+
+
+class ResourceLimiter:
+    """
+    Wraps commands so they run under the configured resource limits, and summarises what they used.
+    Which commands are limited is set by RESOURCE_LIMITS: by default only heavy ones and background
+    jobs, so everyday commands are not slowed down by the CPU quota.
+
+    Preferred: a transient systemd scope (cgroup v2) with CPUQuota, MemoryMax, IOWeight and
+    TasksMax. Where that is unavailable: nice, ionice (best-effort, lowest priority) and, only
+    with LIMIT_FALLBACK_PRLIMIT, prlimit. The mode is probed once, with a trivial command, on first use.
+    """
+    _mode: Optional[str] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def mode(cls) -> str:
+        """'cgroup', 'rlimit' or 'none'."""
+        with cls._lock:
+            if cls._mode is None:
+                cls._mode = cls._detect()
+            return cls._mode
+
+    @classmethod
+    def _detect(cls) -> str:
+        if not RESOURCE_LIMITS:
+            return "none"
+        if (
+            os.path.exists("/sys/fs/cgroup/cgroup.controllers")
+            and os.path.isdir("/run/systemd/system")
+            and shutil.which("systemd-run")
+        ):
+            try:
+                probe = subprocess.run(
+                    cls._cgroup_prefix() + ["true"], stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10,
+                )
+                if probe.returncode == 0:
+                    return "cgroup"
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        tools = ("nice", "ionice", "prlimit") if LIMIT_FALLBACK_PRLIMIT else ("nice", "ionice")
+        if any(shutil.which(tool) for tool in tools):
+            return "rlimit"
+        return "none"
+
+    @staticmethod
+    def _cgroup_prefix() -> List[str]:
+        prefix = ["systemd-run", "--scope", "--quiet", "--collect", f"--unit=osagent-{uuid.uuid4().hex[:12]}"]
+        if os.geteuid() != 0:
+            prefix.append("--user")
+        if LIMIT_CPU_PERCENT:
+            prefix.append(f"--property=CPUQuota={LIMIT_CPU_PERCENT}%")
+        if LIMIT_MEMORY_BYTES:
+            prefix += [f"--property=MemoryMax={LIMIT_MEMORY_BYTES}", "--property=MemorySwapMax=0"]
+        if LIMIT_IO_WEIGHT:
+            prefix.append(f"--property=IOWeight={LIMIT_IO_WEIGHT}")
+        if LIMIT_PIDS:
+            prefix.append(f"--property=TasksMax={LIMIT_PIDS}")
+        return prefix + ["--"]
+
+    @staticmethod
+    def _rlimit_prefix() -> List[str]:
+        prefix = []
+        if LIMIT_FALLBACK_NICE and shutil.which("nice"):
+            prefix += ["nice", "-n", str(LIMIT_FALLBACK_NICE)]
+        if LIMIT_IO_WEIGHT and shutil.which("ionice"):
+            prefix += ["ionice", "-c", "2", "-n", "7"]
+        limits = []
+        if LIMIT_MEMORY_BYTES:
+            limits.append(f"--as={LIMIT_MEMORY_BYTES}")
+        if LIMIT_PIDS:
+            limits.append(f"--nproc={LIMIT_PIDS}")
+        if LIMIT_FALLBACK_PRLIMIT and limits and shutil.which("prlimit"):
+            prefix += ["prlimit"] + limits + ["--"]
+        return prefix
+
+    @staticmethod
+    def applies(command: str, background: bool = False) -> bool:
+        """Whether command runs under the limits (see RESOURCE_LIMITS)."""
+        if RESOURCE_LIMITS == "all":
+            return True
+        return RESOURCE_LIMITS == "heavy" and (background or AdmissionController.classify(command) == "heavy")
+
+    @classmethod
+    def argv(cls, command: str, shell: str = "/bin/sh", background: bool = False) -> List[str]:
+        """argv that runs command (through shell -c), under the limits if they apply to it."""
+        argv = [shell, "-c", command]
+        return cls.wrap(argv) if cls.applies(command, background) else argv
+
+    @classmethod
+    def wrap(cls, argv: List[str]) -> List[str]:
+        mode = cls.mode()
+        if mode == "cgroup":
+            return cls._cgroup_prefix() + argv
+        if mode == "rlimit":
+            return cls._rlimit_prefix() + argv
+        return argv
+
+    @staticmethod
+    def describe_usage(usage, wall: float, baseline_rss: int = 0, limited: bool = True) -> str:
+        """
+        One line with what a finished command (and the children it waited for) consumed.
+
+        The forked child starts out with the agent's own memory, which ru_maxrss keeps
+        counting after exec; a peak at or below baseline_rss (KB) is therefore left out.
+        """
+        def size(count: float) -> str:
+            for unit in ("B", "KB", "MB", "GB"):
+                if count < 1024 or unit == "GB":
+                    return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+                count /= 1024
+
+        cpu = usage.ru_utime + usage.ru_stime
+        rss = f", peak RSS {size(usage.ru_maxrss * 1024)}" if usage.ru_maxrss > baseline_rss else ""
+        return (
+            f"[resources: {cpu:.2f}s CPU ({usage.ru_utime:.2f}s user, {usage.ru_stime:.2f}s sys) in "
+            f"{wall:.2f}s{rss}, disk read {size(usage.ru_inblock * 512)}, "
+            f"written {size(usage.ru_oublock * 512)}; limits: {ResourceLimiter.mode() if limited else 'none'}]"
+        )
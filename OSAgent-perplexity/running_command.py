@@ -0,0 +1,228 @@
+"""
+Running one shell command in its own process group: streaming its output, timing it out, cancelling it.
+"""
+
+import os
+import resource
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, List
+
+from config import CANCEL_GRACE_PERIOD
+from output_buffer import BoundedOutput
+from resource_limits import ResourceLimiter
+from timeout_policy import TimeoutPolicy
+
+
+class CommandCancelled(Exception):
+    """Raised by RunningCommand.wait when the command was cancelled from another thread."""
+
+
+class ProcessTree:
+    """Stop a command together with everything it started."""
+
+    @staticmethod
+    def descendants(pid: int) -> List[int]:
+        """All live descendants of pid, found by walking the parent links in /proc."""
+        children: Dict[int, List[int]] = {}
+        try:
+            entries = os.listdir("/proc")
+        except OSError:
+            return []
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "rb") as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # Fields after the parenthesised command name: state, ppid, ...
+            fields = stat[stat.rfind(b")") + 2:].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        found, pending = [], [pid]
+        while pending:
+            for child in children.get(pending.pop(), []):
+                found.append(child)
+                pending.append(child)
+        return found
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        """True unless pid is gone or a zombie waiting for its new parent to reap it."""
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            return False
+        return stat[stat.rfind(b")") + 2:][:1] not in (b"Z", b"X")
+
+    @staticmethod
+    def _signal(process: subprocess.Popen, pids: List[int], sig: int):
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        # Children that moved to their own process group or session escape killpg
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    @staticmethod
+    def terminate(process: subprocess.Popen, grace: float = CANCEL_GRACE_PERIOD) -> str:
+        """
+        SIGTERM the process group and every descendant, SIGKILL whatever is left after
+        grace seconds, then reap the leader. Returns the signal that finished the job.
+        """
+        # Snapshot the tree first: once the leader dies its children are reparented away
+        pids = ProcessTree.descendants(process.pid)
+        ProcessTree._signal(process, pids, signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        try:
+            process.wait(timeout=grace)
+            while time.monotonic() < deadline and any(ProcessTree._alive(pid) for pid in pids):
+                time.sleep(0.05)
+        except subprocess.TimeoutExpired:
+            pass
+        survivors = [pid for pid in pids if ProcessTree._alive(pid)]
+        if process.poll() is None or survivors:
+            ProcessTree._signal(process, survivors + ProcessTree.descendants(process.pid), signal.SIGKILL)
+            process.wait()
+            return "SIGKILL"
+        return "SIGTERM"
+
+
+class RunningCommand:
+    """
+    A shell command running in its own process group.
+
+    start() returns as soon as the process is spawned; wait() streams its output into
+    bounded buffers until it exits. cancel() (safe from any thread) wakes wait() up,
+    which then stops the whole process tree and raises CommandCancelled. Ctrl-C while
+    waiting in the main thread stops the tree the same way and re-raises
+    KeyboardInterrupt for the orchestrator to handle.
+    """
+    _active = set()
+    _lock = threading.Lock()
+
+    def __init__(self, command: str, timeout):
+        self.command = command
+        self.policy = TimeoutPolicy.coerce(command, timeout)
+        self.process = None
+        self.cancelled = False
+        self.stop_signal = None
+        self.usage = None  # resource.struct_rusage once the command has been reaped normally
+        self.started = None
+        self.finished = None
+        self._wake_read, self._wake_write = os.pipe()
+
+    def start(self) -> "RunningCommand":
+        self.started = time.monotonic()
+        self.policy.start()
+        self._baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.limited = ResourceLimiter.applies(self.command)
+        self.process = subprocess.Popen(
+            ResourceLimiter.argv(self.command),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,  # Ctrl-C reaches only the agent, which decides what to stop
+        )
+        with RunningCommand._lock:
+            RunningCommand._active.add(self)
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        with RunningCommand._lock:
+            if self not in RunningCommand._active:
+                return  # Not started, or finished and its wake-up pipe already closed
+            try:
+                os.write(self._wake_write, b"x")
+            except OSError:
+                pass
+
+    @classmethod
+    def cancel_all(cls) -> int:
+        with cls._lock:
+            active = list(cls._active)
+        for running in active:
+            running.cancel()
+        return len(active)
+
+    def wait(self) -> tuple[int, BoundedOutput, BoundedOutput]:
+        """
+        Same contract as TerminalTool._run_captured, plus CommandCancelled.
+        """
+        process = self.process
+        policy = self.policy
+        streams = {process.stdout: BoundedOutput(), process.stderr: BoundedOutput()}
+        try:
+            with selectors.DefaultSelector() as selector:
+                for pipe in streams:
+                    selector.register(pipe, selectors.EVENT_READ)
+                selector.register(self._wake_read, selectors.EVENT_READ)
+                while len(selector.get_map()) > 1 and not self.cancelled:
+                    if policy.expired():
+                        raise subprocess.TimeoutExpired(self.command, policy.elapsed())
+                    for key, _ in selector.select(policy.remaining()):
+                        if key.fileobj == self._wake_read:
+                            continue
+                        chunk = os.read(key.fd, 65536)
+                        if chunk:
+                            policy.saw_output(len(chunk))
+                            streams[key.fileobj].write(chunk)
+                        else:
+                            selector.unregister(key.fileobj)
+                if self.cancelled:
+                    raise CommandCancelled(self.command)
+                returncode = self._reap()
+            policy.record("completed")
+        except (subprocess.TimeoutExpired, CommandCancelled, KeyboardInterrupt) as e:
+            self.stop_signal = ProcessTree.terminate(process)
+            for buffer in streams.values():
+                buffer.discard(force=True)
+            policy.record(None if isinstance(e, subprocess.TimeoutExpired) else "cancelled")
+            raise
+        finally:
+            self._release()
+        for buffer in streams.values():
+            buffer.close()
+        return returncode, streams[process.stdout], streams[process.stderr]
+
+    def _reap(self) -> int:
+        """Wait for the command with wait4 so its resource usage is collected too."""
+        pid = self.process.pid
+        while True:
+            try:
+                reaped, status, usage = os.wait4(pid, os.WNOHANG)
+            except ChildProcessError:
+                return self.process.wait()
+            if reaped:
+                self.finished = time.monotonic()
+                self.usage = usage
+                self.process.returncode = os.waitstatus_to_exitcode(status)
+                return self.process.returncode
+            if self.policy.expired():
+                raise subprocess.TimeoutExpired(self.command, self.policy.elapsed())
+            time.sleep(0.005)
+
+    def usage_note(self) -> str:
+        if self.usage is None:
+            return ""
+        return ResourceLimiter.describe_usage(
+            self.usage, self.finished - self.started, self._baseline_rss, self.limited
+        )
+
+    def _release(self):
+        with RunningCommand._lock:
+            RunningCommand._active.discard(self)
+        self.process.stdout.close()
+        self.process.stderr.close()
+        os.close(self._wake_read)
+        os.close(self._wake_write)
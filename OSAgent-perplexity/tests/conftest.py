@@ -0,0 +1,8 @@
+import os
+import sys
+
+# main.py and its modules import each other as top-level modules, as when main.py is run,
+# and import osagent_common from the repository root, as main.py arranges
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
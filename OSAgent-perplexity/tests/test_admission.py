@@ -0,0 +1,26 @@
+import pytest
+
+from admission import AdmissionController
+
+
+@pytest.mark.parametrize("command, cost", [
+    ("ls -la", "light"),
+    ("du -sh /var", "heavy"),
+    ("sudo nice -n 5 find / -name core", "heavy"),
+    ("ps aux | grep -r foo /etc", "heavy"),
+    ("journalctl -u nginx | tail", "medium"),
+    ("apt list --installed && find /tmp", "heavy"),
+])
+def test_classify_takes_the_costliest_segment(command, cost):
+    assert AdmissionController.classify(command) == cost
+
+
+def test_violations_name_each_exceeded_threshold():
+    readings = {"cpu_pressure": 80.0, "io_pressure": 1.0, "memory_available": 3.0}
+    reasons = AdmissionController.violations("heavy", readings)
+    assert reasons == ["cpu pressure 80%, above 25%", "only 3% memory available, below 15%"]
+
+
+def test_light_commands_and_missing_readings_are_never_refused():
+    assert AdmissionController.violations("light", {"cpu_pressure": 100.0}) == []
+    assert AdmissionController.violations("heavy", {}) == []
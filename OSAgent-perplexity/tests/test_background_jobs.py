@@ -0,0 +1,82 @@
+import pytest
+
+import background_jobs
+import resource_limits
+from admission import AdmissionController
+from background_jobs import BackgroundJob, JobManager
+from output_buffer import SpillRegistry
+
+
+@pytest.fixture(autouse=True)
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(background_jobs, "OUTPUT_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(resource_limits, "RESOURCE_LIMITS", None)
+    monkeypatch.setattr(AdmissionController, "sample", staticmethod(lambda: {}))
+    monkeypatch.setattr(JobManager, "_jobs", {})
+    monkeypatch.setattr(JobManager, "_counter", 0)
+    monkeypatch.setattr(JobManager, "_cleanup_registered", True)
+    monkeypatch.setattr(SpillRegistry, "_handles", {})
+    yield
+    JobManager.cleanup()
+
+
+def finished(job: BackgroundJob) -> BackgroundJob:
+    job._reader.join(timeout=10)
+    return job
+
+
+def test_output_is_polled_with_a_byte_cursor():
+    job = finished(BackgroundJob("job1", "printf 'one\\ntwo\\n'; echo err >&2; exit 2"))
+    assert job.output(0) == "one\ntwo\nerr\n[job1 (exited, exit code 2): bytes 0-12, end of output]"
+    assert job.output(8) == "err\n[job1 (exited, exit code 2): bytes 8-12, end of output]"
+    assert job.status().startswith("job1: exited after 0s with exit code 2, 12 bytes of output.")
+    with open(SpillRegistry.resolve("job1.out"), encoding="utf-8") as f:
+        assert f.read() == "one\ntwo\nerr\n"
+
+
+def test_ring_buffer_points_at_the_log_for_dropped_bytes(monkeypatch):
+    monkeypatch.setattr(background_jobs, "JOB_BUFFER_BYTES", 1000)
+    monkeypatch.setattr(background_jobs, "JOB_OUTPUT_MAX_BYTES", 100)
+    job = finished(BackgroundJob("job1", "head -c 5000 /dev/zero | tr '\\0' x"))
+    assert job.base > 0 and job.total == 5000
+    text = job.output(0)
+    assert text.startswith(f"x" * 100 + f"\n[bytes 0-{job.base} are no longer buffered; use [[READ: job1.out]]")
+    assert text.endswith(f"more: [[JOB_OUTPUT: job1 {job.base + 100}]]]")
+
+
+def test_start_poll_and_cancel():
+    started = JobManager.start("sleep 30")
+    assert started.startswith("Started background job job1.")
+    assert JobManager.status("1").startswith("job1: running for ")
+    assert "no more output yet; poll later with [[JOB_OUTPUT: job1 0]]" in JobManager.output("job1")
+    assert JobManager.cancel("job1").startswith("job1: cancelled after ")
+    assert JobManager.status("job9") == "Error: Unknown job 'job9'."
+
+
+def test_running_jobs_are_limited(monkeypatch):
+    monkeypatch.setattr(background_jobs, "MAX_BACKGROUND_JOBS", 1)
+    JobManager.start("sleep 30")
+    assert JobManager.start("sleep 30").startswith("Error: 1 background jobs are already running (limit 1): job1.")
+
+
+def test_overdue_jobs_time_out(monkeypatch):
+    JobManager.start("sleep 30")
+    monkeypatch.setattr(background_jobs, "JOB_TIMEOUT", 0)
+    assert JobManager.status("job1").startswith("job1: timed out after ")
+
+
+def test_checks_before_starting(monkeypatch):
+    assert JobManager.start("rm -rf /").startswith("Error: Command blocked by safety filter.")
+    assert JobManager.start("rm -rf /", automation_mode=True) == "Error: Command blocked by security policy."
+    assert "the job was not started" in JobManager.start("no-such-program-here --now")
+    monkeypatch.setattr(AdmissionController, "violations", staticmethod(lambda cost, readings: ["load too high"]))
+    assert JobManager.start("sleep 1").startswith("Error: Job not started: the host is too busy")
+
+
+def test_changing_jobs_invalidate_the_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(background_jobs.CACHE, "invalidate", lambda: calls.append(1))
+    JobManager.start("uptime")
+    assert calls == []
+    JobManager.start("touch /dev/null")
+    assert calls == [1]
@@ -0,0 +1,61 @@
+import json
+import re
+
+import pytest
+
+import command_cache
+from command_cache import CommandCache, format_age
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(command_cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("seconds, text", [(5, "5s"), (59.9, "59s"), (125, "2m"), (3 * 3600 + 5 * 60, "3h05m")])
+def test_format_age(seconds, text):
+    assert format_age(seconds) == text
+
+
+def test_hit_until_ttl_runs_out(clock):
+    cache = CommandCache(path=None)
+    cache._ttls = []
+    cache.store("df  -h", "result")
+    clock[0] += command_cache.COMMAND_CACHE_DEFAULT_TTL - 1
+    hit = cache.lookup("df -h")
+    assert hit.endswith("\nresult") and "[[FRESH: df -h]]" in hit
+    clock[0] += 1
+    assert cache.lookup("df -h") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_zero_ttl_is_never_stored(clock):
+    cache = CommandCache(path=None)
+    cache._ttls = [(re.compile(r"^date\b"), 0)]
+    cache.store("date", "now")
+    assert not cache.contains("date")
+
+
+def test_eviction_drops_the_entry_closest_to_expiry(clock, monkeypatch):
+    monkeypatch.setattr(command_cache, "COMMAND_CACHE_MAX_ENTRIES", 2)
+    cache = CommandCache(path=None)
+    cache._ttls = [(re.compile(r"^short\b"), 1), (re.compile(r"^long\b"), 100)]
+    cache.store("long a", "a")
+    cache.store("short", "s")
+    cache.store("long b", "b")
+    assert cache.contains("long a") and cache.contains("long b") and not cache.contains("short")
+
+
+def test_saved_entries_survive_a_restart(clock, tmp_path):
+    path = tmp_path / "cache.json"
+    cache = CommandCache(path=str(path))
+    cache._ttls = []
+    cache.store("uname -r", "6.8.0")
+    cache.save()
+    assert json.loads(path.read_text())["uname -r"][2] == "6.8.0"
+    restarted = CommandCache(path=str(path))
+    assert restarted.contains("uname -r")
+    clock[0] += command_cache.COMMAND_CACHE_DEFAULT_TTL
+    assert not CommandCache(path=str(path)).contains("uname -r")
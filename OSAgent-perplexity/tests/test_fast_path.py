@@ -0,0 +1,77 @@
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+import fast_path
+from fast_path import FastPath
+
+
+def real(command: str) -> str:
+    binary = command.split()[0]
+    if not shutil.which(binary):
+        pytest.skip(f"{binary} is not installed")
+    # As the agent runs it: output to a pipe, with no terminal width to fit
+    env = {name: value for name, value in os.environ.items() if name not in ("COLUMNS", "LINES")}
+    return subprocess.run(command.split(), capture_output=True, text=True, check=True, env=env).stdout
+
+
+def columns(text: str, keep) -> list:
+    """The given columns of each line; the rest change from one moment to the next."""
+    return [[line.split()[i] for i in keep if i < len(line.split())] for line in text.splitlines()]
+
+
+@pytest.mark.parametrize("command", ["nproc", "nproc --all", "cat /proc/sys/kernel/ostype"])
+def test_matches_exactly(command):
+    assert FastPath.run(command) == real(command)
+
+
+@pytest.mark.parametrize("command", ["free", "free -h", "free -m", "free -b"])
+def test_free(command):
+    ours, theirs = FastPath.run(command), real(command)
+    assert ours.splitlines()[0] == theirs.splitlines()[0]
+    assert columns(ours, (0, 1))[1:] == columns(theirs, (0, 1))[1:]
+
+
+@pytest.mark.parametrize("command", ["df", "df -h", "df /", "df -h / /proc"])
+def test_df(command):
+    ours, theirs = FastPath.run(command), real(command)
+    assert ours.splitlines()[0] == theirs.splitlines()[0]
+    assert columns(ours, (0, 1, -1)) == columns(theirs, (0, 1, -1))
+
+
+def test_uptime():
+    def shape(text):
+        return re.sub(r"\d+", "N", text)
+    assert shape(FastPath.run("uptime")) == shape(real("uptime"))
+
+
+def test_ps_aux():
+    ours, theirs = FastPath.run("ps aux"), real("ps aux")
+    assert ours.splitlines()[0] == theirs.splitlines()[0]
+    init = [line for line in theirs.splitlines() if line.split()[1] == "1"]
+    assert columns(ours, (0, 1, 6, 8))[1] == columns("\n".join(init), (0, 1, 6, 8))[0]
+    assert ours.splitlines()[1].split(None, 10)[10] == init[0].split(None, 10)[10]
+
+
+@pytest.mark.parametrize("command", [
+    "free -s 1",
+    "free -h | head",
+    "uptime -p",
+    "df -i",
+    "df relative/path",
+    "ps -ef",
+    "cat /etc/passwd",
+    "cat /proc/self/status",
+    "top",
+    "",
+])
+def test_other_forms_fall_through(command):
+    assert FastPath.run(command) is None
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(fast_path, "FAST_PATHS", False)
+    assert FastPath.run("nproc") is None
@@ -0,0 +1,143 @@
+import os
+
+import pytest
+
+import help_index
+from help_index import HelpIndex
+
+MAN = r"""
+.\" Comment
+.TH TAR 1
+.SH NAME
+tar \- an archiving utility
+.SH SYNOPSIS
+.B tar
+\fB\-c\fR [\fIOPTION\fR...] [\fIFILE\fR]...
+.SH OPTIONS
+.TP
+\fB\-c\fR, \fB\-\-create\fR
+Create a new archive.
+.TP
+\fB\-f\fR, \fB\-\-file\fR=\fIARCHIVE\fR
+Use archive file
+or device \fIARCHIVE\fR.
+.TP
+\fB\-z\fR, \fB\-\-gzip\fR
+Filter the archive through \fBgzip\fR(1).
+.TP
+.B /etc/rmt
+Not an option.
+"""
+
+MDOC = """
+.Sh SYNOPSIS
+.Nm ls
+.Op Fl al
+.Sh DESCRIPTION
+.Bl -tag -width indent
+.It Fl a
+Include directory entries whose names begin with a dot.
+.It Fl l
+List in long format.
+.El
+"""
+
+HELP = """\
+Usage: grep [OPTION]... PATTERNS [FILE]...
+Search for PATTERNS in each FILE.
+
+  -i, --ignore-case         ignore case distinctions in patterns and data
+  -r, --recursive           like --directories=recurse
+      --include=GLOB        search only files that match GLOB
+                            (a file name pattern)
+"""
+
+
+def test_parse_man():
+    entry = HelpIndex.parse_man(MAN)
+    assert entry["synopsis"] == ["tar -c [OPTION...] [FILE]..."]
+    assert entry["options"] == [
+        ["-c, --create", "Create a new archive."],
+        ["-f, --file=ARCHIVE", "Use archive file or device ARCHIVE."],
+        ["-z, --gzip", "Filter the archive through gzip(1)."],
+    ]
+
+
+def test_parse_mdoc():
+    entry = HelpIndex.parse_man(MDOC)
+    assert entry["synopsis"] == ["ls -al"]
+    assert entry["options"] == [
+        ["-a", "Include directory entries whose names begin with a dot."],
+        ["-l", "List in long format."],
+    ]
+
+
+def test_parse_help():
+    entry = HelpIndex.parse_help(HELP)
+    assert entry["synopsis"] == ["Usage: grep [OPTION]... PATTERNS [FILE]..."]
+    assert entry["options"] == [
+        ["-i, --ignore-case", "ignore case distinctions in patterns and data"],
+        ["-r, --recursive", "like --directories=recurse"],
+        ["--include=GLOB", "search only files that match GLOB (a file name pattern)"],
+    ]
+
+
+@pytest.mark.parametrize("topic, tags", [
+    ("-f", ["-f, --file=ARCHIVE"]),
+    ("--gz", ["-z, --gzip"]),
+    ("--file=x.tar", ["-f, --file=ARCHIVE"]),
+    ("-czf", ["-c, --create", "-f, --file=ARCHIVE", "-z, --gzip"]),
+    ("ARCHIVE", ["-c, --create", "-f, --file=ARCHIVE", "-z, --gzip"]),
+    ("device", ["-f, --file=ARCHIVE"]),
+    ("-x", []),
+])
+def test_matches(topic, tags):
+    options = HelpIndex.parse_man(MAN)["options"]
+    assert [tag for tag, _ in HelpIndex._matches(options, topic)] == tags
+
+
+@pytest.fixture
+def indexed(monkeypatch):
+    monkeypatch.setattr(help_index, "HELP_INDEX_FILE", None)
+    monkeypatch.setattr(HelpIndex, "_entries", {"tar": HelpIndex.parse_man(MAN)})
+    monkeypatch.setattr(HelpIndex, "_loaded", True)
+    monkeypatch.setattr(HelpIndex, "_sync", classmethod(lambda cls: None))
+
+
+def test_lookup(indexed):
+    assert HelpIndex.lookup("tar -z") == (
+        "tar (from man page):\n  tar -c [OPTION...] [FILE]...\n  -z, --gzip  Filter the archive through gzip(1)."
+    )
+    assert HelpIndex.lookup("/bin/tar").endswith(
+        "Options (3): -c, --create; -f, --file=ARCHIVE; -z, --gzip\n[Ask for details with [[HELP: tar <flag or keyword>]]]"
+    )
+    assert HelpIndex.lookup("tar -x").endswith("No option of 'tar' matches '-x'. Options: -c, --create, -f, --file, -z, --gzip")
+    assert HelpIndex.lookup("tar;rm").startswith("Error: Usage:")
+
+
+def test_real_man_page():
+    source = HelpIndex._man_page("tar")
+    if source is None:
+        pytest.skip("tar man page is not installed")
+    entry = HelpIndex.parse_man(source)
+    assert any("--gzip" in tag for tag, _ in entry["options"])
+
+
+def test_index_file_is_dropped_when_packages_change(tmp_path, monkeypatch):
+    status = tmp_path / "status"
+    status.write_text("a")
+    index = tmp_path / "help_index.json"
+    monkeypatch.setattr(help_index, "HELP_INDEX_FILE", str(index))
+    monkeypatch.setattr(HelpIndex, "DPKG_STATUS", str(status))
+    monkeypatch.setattr(HelpIndex, "_entries", {})
+    monkeypatch.setattr(HelpIndex, "_loaded", False)
+    monkeypatch.setattr(HelpIndex, "_build", classmethod(lambda cls, command: {"source": "test", "synopsis": [], "options": []}))
+    HelpIndex.entry("tar")
+    monkeypatch.setattr(HelpIndex, "_loaded", False)
+    monkeypatch.setattr(HelpIndex, "_entries", {})
+    HelpIndex._sync()
+    assert "tar" in HelpIndex._entries
+    status.write_text("b")
+    os.utime(status, ns=(0, 0))
+    HelpIndex._sync()
+    assert HelpIndex._entries == {}
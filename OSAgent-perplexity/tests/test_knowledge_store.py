@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from knowledge_store import KnowledgeStore
+
+EMBEDDED = {"Base": {"description": "embedded", "triggers": ["bash"], "content": "base text"}}
+
+
+@pytest.fixture
+def packs(tmp_path):
+    (tmp_path / "nginx.yaml").write_text("description: web\ntriggers: NGINX\ncontent: nginx text\n")
+    (tmp_path / "many.json").write_text(json.dumps({
+        "Disk": {"triggers": ["df", "du"], "content": "disk text"},
+        "Base": {"content": "overridden"},
+    }))
+    (tmp_path / ".hidden.yaml").write_text("content: hidden\n")
+    (tmp_path / "notes.txt").write_text("ignored")
+    return tmp_path
+
+
+def test_index_combines_embedded_and_pack_files(packs):
+    index = KnowledgeStore(str(packs), EMBEDDED).snapshot()
+    assert index.generation == 0
+    assert sorted(index.entries) == ["Base", "Disk", "nginx"]
+    assert index.entries["nginx"] == {"description": "web", "triggers": ("nginx",), "content": "nginx text"}
+    assert index.entries["Base"]["content"] == "overridden"
+    assert [path.rsplit("/", 1)[-1] for path in index.sources] == ["many.json", "nginx.yaml"]
+    with pytest.raises(TypeError):
+        index.entries["new"] = {}
+
+
+def test_reload_is_published_at_the_next_snapshot(packs):
+    store = KnowledgeStore(str(packs), EMBEDDED)
+    first = store.snapshot()
+    (packs / "ssh.yml").write_text("content: ssh text\n")
+    assert store.reload()
+    assert store.snapshot() is not first and "ssh" in store.snapshot().entries
+    assert "ssh" not in first.entries and store.snapshot().generation == 1
+
+
+def test_broken_pack_keeps_the_previous_index(packs):
+    store = KnowledgeStore(str(packs), EMBEDDED)
+    (packs / "broken.yaml").write_text("triggers: [x]\n")
+    assert not store.reload()
+    assert "needs a 'content' string" in store.last_error
+    assert store.snapshot().generation == 0
+    (packs / "broken.yaml").unlink()
+    assert store.reload() and store.last_error is None
+
+
+def test_missing_directory_serves_the_embedded_packs(tmp_path):
+    index = KnowledgeStore(str(tmp_path / "absent"), EMBEDDED).snapshot()
+    assert list(index.entries) == ["Base"] and index.sources == ()
+
+
+def test_watcher_picks_up_new_packs(packs):
+    store = KnowledgeStore(str(packs), EMBEDDED, poll_interval=0.05)
+    store.start()
+    try:
+        (packs / "ssh.yaml").write_text("content: ssh text\n")
+        for _ in range(100):
+            if "ssh" in store.snapshot().entries:
+                break
+            store._stop.wait(0.05)
+        assert "ssh" in store.snapshot().entries
+    finally:
+        store.stop()
@@ -0,0 +1,70 @@
+import pytest
+
+import log_mining
+import output_compactor
+from log_mining import LogTemplateMiner
+from output_buffer import BoundedOutput, SpillRegistry
+
+
+def syslog(count: int) -> list:
+    lines = []
+    for i in range(count):
+        lines.append(f"Jan  5 10:{i % 60:02d}:00 host sshd[{1000 + i}]: Accepted publickey for user{i % 3} from 10.0.0.{i}")
+        lines.append(f"Jan  5 10:{i % 60:02d}:30 host CRON[{2000 + i}]: pam_unix(cron:session): session closed")
+    return lines
+
+
+@pytest.mark.parametrize("command", [
+    "cat /var/log/syslog",
+    "tail -n 500 /var/log/auth.log | grep sshd",
+    "grep -i error /var/log/syslog 2>/dev/null",
+    "journalctl -u nginx --no-pager",
+    "dmesg -T",
+])
+def test_applies_to_log_readers(command):
+    assert LogTemplateMiner.applies_to(command)
+
+
+@pytest.mark.parametrize("command", [
+    "cat /etc/passwd",
+    "journalctl -f",
+    "journalctl -o json",
+    "dmesg -w",
+    "cat /var/log/syslog | sort",
+    "cat /var/log/syslog > /tmp/copy",
+    "cat /var/log/syslog; ls",
+])
+def test_does_not_apply(command):
+    assert not LogTemplateMiner.applies_to(command)
+
+
+def test_templates_with_counts_and_time_span():
+    miner = LogTemplateMiner()
+    for line in syslog(30):
+        miner.add(line)
+    assert miner.lines == 60 and len(miner.clusters) == 2
+    text = miner.render().splitlines()
+    assert text[0] == "30x Jan  5 10:00:00 .. Jan  5 10:29:00  host sshd[<*>]: Accepted publickey for user<*> from <*>"
+    assert text[1].startswith("    e.g. host sshd[1000]: Accepted publickey for user0")
+    assert text[2].startswith("30x Jan  5 10:00:30 .. Jan  5 10:29:30  host CRON[<*>]:")
+
+
+def test_template_limit_counts_the_rest_as_other(monkeypatch):
+    monkeypatch.setattr(log_mining, "LOG_MINING_MAX_TEMPLATES", 1)
+    miner = LogTemplateMiner()
+    for line in syslog(3):
+        miner.add(line)
+    assert len(miner.clusters) == 1 and miner.other.count == 3
+    assert "3x " in miner.render().splitlines()[-2]
+
+
+def test_compact(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_compactor, "OUTPUT_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(SpillRegistry, "_handles", {})
+    stdout = BoundedOutput()
+    stdout.write("\n".join(syslog(30)).encode() + b"\n")
+    stdout.close()
+    result = LogTemplateMiner.compact("cat /var/log/syslog", stdout, "cmd1.stdout")
+    assert result.note.startswith("[log templates: 60 lines -> 2 templates")
+    assert len(result.text.splitlines()) == 4
+    assert LogTemplateMiner.compact("cat /etc/hosts", stdout, "cmd1.stdout") is None
@@ -0,0 +1,81 @@
+import hashlib
+import os
+
+import pytest
+
+import output_buffer
+from output_buffer import BoundedOutput, SpillRegistry
+
+
+@pytest.fixture(autouse=True)
+def spill_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_buffer, "OUTPUT_SPILL_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_short_output_stays_in_memory():
+    out = BoundedOutput(head_bytes=16, tail_bytes=16)
+    out.write(b"hello\n")
+    out.write(b"world\n")
+    assert out.text() == "hello\nworld\n"
+    assert not out.truncated
+    assert out.spill_path is None
+    assert out.spill_note("cmd1.stdout") == ""
+
+
+def test_long_output_keeps_head_and_tail_and_spills_everything():
+    data = b"".join(b"line %03d\n" % i for i in range(100))
+    out = BoundedOutput(head_bytes=18, tail_bytes=18)
+    for i in range(0, len(data), 7):
+        out.write(data[i:i + 7])
+    out.close()
+    assert out.truncated
+    text = out.text()
+    assert text.startswith("line 000\nline 001\n")
+    assert text.endswith("line 098\nline 099\n")
+    assert f"[... {len(data) - 36} bytes omitted ...]" in text
+    with open(out.spill_path, "rb") as f:
+        assert f.read() == data
+    assert out.sha256() == hashlib.sha256(data).hexdigest()
+    assert list(out.complete_lines()) == data.decode().splitlines()
+
+
+def test_spill_note_registers_the_handle():
+    out = BoundedOutput(head_bytes=4, tail_bytes=4)
+    out.write(b"0123456789abcdef")
+    note = out.spill_note("cmd7.stdout")
+    assert "16 bytes total; full output saved to handle 'cmd7.stdout'" in note
+    assert SpillRegistry.resolve("cmd7.stdout") == out.spill_path
+
+
+def test_spill_file_is_capped(monkeypatch):
+    monkeypatch.setattr(output_buffer, "OUTPUT_SPILL_MAX_BYTES", 10)
+    out = BoundedOutput(head_bytes=4, tail_bytes=4)
+    out.write(b"x" * 30)
+    assert out.spilled == 10
+    assert out.sha256() is None
+    assert out.complete_text(100) is None
+    assert "first 10 bytes saved" in out.spill_note("cmd8.stdout")
+
+
+def test_character_split_between_writes_is_decoded():
+    out = BoundedOutput(head_bytes=64, tail_bytes=64)
+    encoded = "größe".encode()
+    out.write(encoded[:3])
+    out.write(encoded[3:])
+    assert out.text() == "größe"
+
+
+def test_binary_output_is_summarised():
+    out = BoundedOutput()
+    out.write(b"\x1f\x8b\x08\x00" + bytes(100))
+    assert out.text().startswith("[binary output: 104 bytes of gzip compressed data, not shown; sha256 ")
+
+
+def test_discard_removes_an_unneeded_spill_file():
+    out = BoundedOutput(head_bytes=4, tail_bytes=4)
+    out.write(b"0123456789")
+    path = out.spill_path
+    out.discard(force=True)
+    assert not os.path.exists(path)
+    assert out.spill_path is None
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+import output_compactor
+from output_buffer import BoundedOutput, SpillRegistry
+from output_compactor import OutputCompactor
+
+PS_AUX = """\
+USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND
+root           1  0.0  0.3 167744 12980 ?        Ss   Jan01   0:09 /sbin/init splash
+root           2  0.0  0.0      0     0 ?        S    Jan01   0:00 [kthreadd]
+www-data     812  1.5  2.1 248312 86016 ?        S    09:14   1:02 nginx: worker process
+"""
+
+SS = """\
+Netid State  Recv-Q Send-Q Local Address:Port  Peer Address:PortProcess
+tcp   LISTEN 0      4096         0.0.0.0:22         0.0.0.0:*    users:(("sshd",pid=612,fd=3))
+tcp   LISTEN 0      511             [::]:80            [::]:*    users:(("nginx",pid=700,fd=6),("nginx",pid=701,fd=6))
+"""
+
+SYSTEMCTL = """\
+  UNIT                  LOAD   ACTIVE SUB     DESCRIPTION
+  cron.service          loaded active running Regular background program processing daemon
+● nginx.service         loaded failed failed  A high performance web server
+
+LOAD   = Reflects whether the unit definition was properly loaded.
+2 loaded units listed.
+"""
+
+DPKG = """\
+Desired=Unknown/Install/Remove/Purge/Hold
+| Status=Not/Inst/Conf-files/Unpacked/halF-conf/Half-inst/trig-aWait/Trig-pend
+|/ Err?=(none)/Reinst-required (Status,Err: uppercase=bad)
+||/ Name           Version         Architecture Description
++++-==============-===============-============-=================================
+ii  bash           5.2.21-2ubuntu4 amd64        GNU Bourne Again SHell
+ii  coreutils      9.4-3ubuntu6    amd64        GNU core utilities
+"""
+
+
+@pytest.fixture(autouse=True)
+def spill_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_compactor, "OUTPUT_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(SpillRegistry, "_handles", {})
+
+
+def compact(command: str, text: str):
+    stdout = BoundedOutput()
+    stdout.write(text.encode())
+    stdout.close()
+    return OutputCompactor.compact(command, stdout, "cmd1.stdout")
+
+
+def rows(result) -> list:
+    return [line.split("\t") for line in result.text.splitlines()]
+
+
+def test_ps_aux_drops_kernel_threads_and_rare_columns():
+    result = compact("ps aux", PS_AUX)
+    assert rows(result) == [
+        ["USER", "PID", "%CPU", "%MEM", "RSS", "STAT", "COMMAND"],
+        ["root", "1", "0.0", "0.3", "12980", "Ss", "/sbin/init splash"],
+        ["www-data", "812", "1.5", "2.1", "86016", "S", "nginx: worker process"],
+    ]
+    assert "1 kernel threads omitted" in result.note
+    with open(SpillRegistry.resolve("cmd1.stdout"), encoding="utf-8") as f:
+        assert f.read() == PS_AUX
+
+
+def test_ss_keeps_processes_and_drops_wildcard_peers():
+    assert rows(compact("ss -tlnp", SS)) == [
+        ["Netid", "State", "Local", "Process"],
+        ["tcp", "LISTEN", "0.0.0.0:22", "sshd/612"],
+        ["tcp", "LISTEN", "[::]:80", "nginx/700,nginx/701"],
+    ]
+
+
+def test_systemctl_list_units():
+    assert rows(compact("systemctl --failed", SYSTEMCTL)) == [
+        ["UNIT", "ACTIVE", "SUB", "DESCRIPTION"],
+        ["cron.service", "active", "running", "Regular background program processing daemon"],
+        ["nginx.service", "failed", "failed", "A high performance web server"],
+    ]
+
+
+def test_dpkg_list(monkeypatch):
+    monkeypatch.setattr(output_compactor, "COMPACT_OUTPUT_FORMAT", "json")
+    table = json.loads(compact("dpkg -l", DPKG).text)
+    assert table["columns"] == ["Status", "Name", "Version"]
+    assert table["rows"][1] == ["ii", "coreutils", "9.4-3ubuntu6"]
+
+
+def test_long_cells_are_cut(monkeypatch):
+    monkeypatch.setattr(output_compactor, "COMPACT_MAX_CELL_CHARS", 10)
+    assert rows(compact("ps aux", PS_AUX))[2][-1] == "nginx: ..."
+
+
+@pytest.mark.parametrize("command, text", [
+    ("ps aux | grep nginx", PS_AUX),
+    ("cd / && ps aux", PS_AUX),
+    ("ls -l", PS_AUX),
+    ("df -h", "df: /nope: No such file or directory\n"),
+    ("systemctl status nginx", SYSTEMCTL),
+])
+def test_passes_through(command, text):
+    assert compact(command, text) is None
+
+
+def test_estimate_tokens():
+    assert OutputCompactor.estimate_tokens("") == 0
+    assert OutputCompactor.estimate_tokens("a  b") == 3
+    assert OutputCompactor.estimate_tokens("abcdefgh.") == 3
@@ -0,0 +1,70 @@
+import pytest
+
+import output_delta
+from output_buffer import SpillRegistry
+from output_delta import OutputDelta
+
+LINES = "\n".join(f"line {i}" for i in range(40)) + "\n"
+
+
+@pytest.fixture(autouse=True)
+def fresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_delta, "OUTPUT_SPILL_DIR", str(tmp_path))
+    monkeypatch.setattr(SpillRegistry, "_handles", {})
+    OutputDelta.new_conversation()
+    yield
+    OutputDelta.new_conversation()
+
+
+def saved(text: str) -> str:
+    handle = text.split("handle '")[1].split("'")[0]
+    with open(SpillRegistry.resolve(handle), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_first_run_is_sent_in_full():
+    assert OutputDelta.apply("ps aux", LINES) == LINES
+
+
+def test_unchanged_repeat_becomes_a_note():
+    OutputDelta.apply("ps   aux", LINES)
+    note = OutputDelta.apply("ps aux", LINES)
+    assert note.startswith("[output unchanged since ") and saved(note) == LINES
+
+
+def test_small_change_becomes_a_diff():
+    OutputDelta.apply("ps aux", LINES)
+    changed = LINES.replace("line 20\n", "line twenty\n")
+    delta = OutputDelta.apply("ps aux", changed)
+    assert "2 lines differ" in delta
+    assert delta.splitlines()[1:] == ["@@ -20,3 +20,3 @@", " line 19", "-line 20", "+line twenty", " line 21"]
+    assert saved(delta) == changed
+
+
+def test_large_change_is_sent_in_full():
+    OutputDelta.apply("ps aux", LINES)
+    rewritten = LINES.replace("line", "row")
+    assert OutputDelta.apply("ps aux", rewritten) == rewritten
+
+
+def test_short_output_is_never_replaced_by_a_longer_note():
+    OutputDelta.apply("whoami", "root\n")
+    assert OutputDelta.apply("whoami", "root\n") == "root\n"
+
+
+def test_new_conversation_forgets_baselines():
+    OutputDelta.apply("ps aux", LINES)
+    OutputDelta.new_conversation()
+    assert OutputDelta.apply("ps aux", LINES) == LINES
+
+
+def test_carry_over_keeps_the_newest_outputs_that_fit(monkeypatch):
+    OutputDelta.apply("df -h", "old output\n")
+    OutputDelta.apply("free -m", LINES)
+    monkeypatch.setattr(output_delta, "DELTA_CARRY_MAX_BYTES", len(LINES) + 60)
+    carried = OutputDelta.carry_over()
+    assert carried.startswith("$ free -m\n") and carried.endswith(LINES.rstrip())
+    assert "df -h" not in carried
+    # What the model was shown stays the baseline; what it was not shown is forgotten
+    assert OutputDelta.apply("free -m", LINES).startswith("[output unchanged")
+    assert OutputDelta.apply("df -h", "old output\n") == "old output\n"
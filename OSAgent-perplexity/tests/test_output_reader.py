@@ -0,0 +1,99 @@
+import mmap
+import os
+
+import pytest
+
+import output_reader
+from output_buffer import SpillRegistry
+from output_reader import OutputReader
+
+
+@pytest.fixture
+def small_stride(monkeypatch):
+    monkeypatch.setattr(output_reader, "READ_INDEX_STRIDE", 4)
+    monkeypatch.setattr(OutputReader, "_indexes", {})
+
+
+@pytest.fixture
+def numbered(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(20)))
+    return str(path)
+
+
+def seek(path: str, line: int, index=None) -> int:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        index = index if index is not None else OutputReader._line_index(path, os.fstat(f.fileno()))
+        return OutputReader._seek_line(mm, index, line)
+
+
+@pytest.mark.parametrize("line", [0, 1, 3, 4, 5, 8, 13, 19])
+def test_seek_line(small_stride, numbered, line):
+    with open(numbered, "rb") as f:
+        expected = f.read().index(f"line {line}\n".encode())
+    assert seek(numbered, line) == expected
+
+
+def test_seek_past_the_end(small_stride, numbered):
+    assert seek(numbered, 20) == -1
+    assert seek(numbered, 500) == -1
+
+
+def test_index_is_extended_only_as_far_as_needed(small_stride, numbered):
+    seek(numbered, 9)
+    (index,) = OutputReader._indexes.values()
+    assert len(index) == 3  # Lines 0, 4 and 8
+    seek(numbered, 2)
+    assert len(index) == 3
+
+
+def test_read_lines_pages(small_stride, numbered):
+    assert OutputReader.read_lines(numbered, 5, 3) == (
+        "5: line 5\n6: line 6\n7: line 7\n[more: continue with start_line 8]"
+    )
+    assert OutputReader.read_lines(numbered, 18, 10) == "18: line 18\n19: line 19"
+    assert OutputReader.read_lines(numbered, 20, 10) == "(no line 20: end of file)"
+
+
+def test_read_lines_clips_long_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(output_reader, "READ_MAX_LINE_CHARS", 10)
+    path = tmp_path / "long.txt"
+    path.write_text("x" * 25 + "\nshort")
+    assert OutputReader.read_lines(str(path), 0, 5) == "0: xxxxxxxxxx [... 15 bytes]\n1: short"
+
+
+def test_read_lines_describes_binary_files(tmp_path):
+    path = tmp_path / "blob"
+    path.write_bytes(b"\x7fELF\x02\x01\x01\x00" + bytes(range(256)))
+    assert OutputReader.read_lines(str(path), 0, 5).startswith("(binary file: 264 bytes of ")
+
+
+def test_search_reports_each_matching_line_once(numbered):
+    assert OutputReader.search(numbered, r"line 1\d?$") == "1: line 1\n" + "\n".join(
+        f"{i}: line {i}" for i in range(10, 20)
+    )
+    assert OutputReader.search(numbered, "i") == OutputReader.search(numbered, "^line")
+
+
+def test_search_limits_matches(numbered, monkeypatch):
+    monkeypatch.setattr(output_reader, "SEARCH_MAX_MATCHES", 2)
+    assert OutputReader.search(numbered, "line") == "0: line 0\n1: line 1\n[stopped after 2 matching lines]"
+
+
+def test_search_errors(numbered):
+    assert OutputReader.search(numbered, "nothing") == "(no matches)"
+    assert OutputReader.search(numbered, "(").startswith("Error: Invalid regular expression")
+
+
+def test_resolve_target(numbered, monkeypatch):
+    monkeypatch.setattr(SpillRegistry, "_handles", {"cmd1.stdout": numbered})
+    assert OutputReader.resolve_target("cmd1.stdout") == (numbered, "")
+    assert OutputReader.resolve_target(numbered) == (numbered, "")
+    assert OutputReader.resolve_target("/etc/shadow")[1].startswith("Error: Read blocked by safety filter")
+    assert OutputReader.resolve_target("/etc/shadow", automation_mode=True)[1] == "Error: Read blocked by security policy."
+    assert "not a known output handle" in OutputReader.resolve_target("cmd9.stdout")[1]
+
+
+def test_read_request(numbered):
+    assert OutputReader.read_request(numbered, "19") == "19: line 19"
+    assert OutputReader.read_request(numbered, "x").startswith("Error: READ expects")
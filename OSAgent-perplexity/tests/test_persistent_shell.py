@@ -0,0 +1,43 @@
+import shutil
+import subprocess
+
+import pytest
+
+from persistent_shell import PersistentShell
+
+pytestmark = pytest.mark.skipif(not shutil.which("bash"), reason="needs bash")
+
+
+@pytest.fixture
+def shell():
+    shell = PersistentShell(shutil.which("bash"))
+    yield shell
+    shell.close()
+
+
+def test_state_carries_over_between_commands(shell, tmp_path):
+    assert shell.run(f"cd {tmp_path} && export GREETING=hi", 10)[0] == 0
+    returncode, stdout, stderr = shell.run('echo "$PWD $GREETING"; echo warn >&2; false', 10)
+    assert returncode == 1
+    assert stdout.text() == f"{tmp_path} hi\n" and stderr.text() == "warn\n"
+    assert shell.spawn_count == 1
+
+
+def test_output_without_trailing_newline_is_framed(shell):
+    returncode, stdout, _ = shell.run("printf abc", 10)
+    assert (returncode, stdout.text()) == (0, "abc")
+
+
+def test_timeout_replaces_the_worker(shell):
+    with pytest.raises(subprocess.TimeoutExpired):
+        shell.run("sleep 30", 0.3)
+    assert shell.process is None
+    assert shell.run("echo again", 10)[1].text() == "again\n"
+    assert shell.spawn_count == 2
+
+
+def test_exit_ends_the_worker(shell):
+    returncode, stdout, _ = shell.run("echo bye; exit 4", 10)
+    assert (returncode, stdout.text()) == (4, "bye\n")
+    assert shell.run("echo back", 10)[0] == 0
+    assert shell.spawn_count == 2
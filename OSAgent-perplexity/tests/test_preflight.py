@@ -0,0 +1,51 @@
+import pytest
+
+import preflight
+from preflight import PreflightCheck
+
+
+@pytest.fixture
+def installed(monkeypatch):
+    monkeypatch.setattr(preflight, "PREFLIGHT_CHECKS", True)
+    monkeypatch.setattr(preflight, "PERSISTENT_SHELL", False)
+    index = {name: f"/usr/bin/{name}" for name in ("ls", "sudo", "psql", "ss", "systemctl", "grep")}
+    monkeypatch.setattr(PreflightCheck, "path_index", classmethod(lambda cls: index))
+
+
+@pytest.mark.parametrize("command, programs", [
+    ("ls -la | grep foo", ["ls", "grep"]),
+    ("sudo -u postgres psql -c 'select 1'", ["sudo", "psql"]),
+    ("sudo -i ls", ["sudo"]),
+    ("$EDITOR file", []),
+    ("cd /tmp && ./run.sh", ["cd", "./run.sh"]),
+])
+def test_programs(command, programs):
+    assert PreflightCheck.programs(command) == programs
+
+
+def test_passes(installed):
+    assert PreflightCheck.check("sudo systemctl status nginx | grep Active") is None
+
+
+def test_missing_program_suggests_an_installed_alternative(installed):
+    problem = PreflightCheck.check("netstat -tlnp")
+    assert problem.startswith("Error: Pre-flight check failed")
+    assert "'netstat' is not installed (not found in PATH); installed alternatives: ss" in problem
+
+
+def test_missing_program_suggests_a_close_name(installed):
+    assert "did you mean: systemctl" in PreflightCheck.check("systemctll status")
+
+
+def test_syntax_error(installed):
+    assert "shell syntax error" in PreflightCheck.check("ls 'unterminated")
+
+
+def test_persistent_shell_skips_the_program_check(installed, monkeypatch):
+    monkeypatch.setattr(preflight, "PERSISTENT_SHELL", True)
+    assert PreflightCheck.check("my_shell_function arg") is None
+
+
+def test_installed_summary(installed):
+    summary = PreflightCheck.installed_summary()
+    assert "Installed: ss, systemctl, sudo." in summary and "htop" in summary.split("\n")[1]
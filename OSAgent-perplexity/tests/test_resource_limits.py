@@ -0,0 +1,30 @@
+import pytest
+
+import resource_limits
+from resource_limits import ResourceLimiter
+
+
+@pytest.fixture
+def rlimit_mode(monkeypatch):
+    monkeypatch.setattr(ResourceLimiter, "_mode", "rlimit")
+    monkeypatch.setattr(resource_limits, "LIMIT_FALLBACK_NICE", 10)
+    monkeypatch.setattr(resource_limits, "LIMIT_FALLBACK_PRLIMIT", False)
+    monkeypatch.setattr(resource_limits.shutil, "which", lambda tool: f"/usr/bin/{tool}")
+
+
+def test_by_default_only_heavy_commands_and_jobs_are_limited(rlimit_mode, monkeypatch):
+    monkeypatch.setattr(resource_limits, "RESOURCE_LIMITS", "heavy")
+    assert ResourceLimiter.argv("ls -la") == ["/bin/sh", "-c", "ls -la"]
+    assert ResourceLimiter.argv("du -sh /var")[:3] == ["nice", "-n", "10"]
+    assert ResourceLimiter.argv("ls -la", background=True)[:3] == ["nice", "-n", "10"]
+
+
+def test_all_limits_every_command(rlimit_mode, monkeypatch):
+    monkeypatch.setattr(resource_limits, "RESOURCE_LIMITS", "all")
+    assert ResourceLimiter.argv("ls")[-3:] == ["/bin/sh", "-c", "ls"]
+    assert ResourceLimiter.argv("ls")[:3] == ["nice", "-n", "10"]
+
+
+def test_limits_off(monkeypatch):
+    monkeypatch.setattr(resource_limits, "RESOURCE_LIMITS", None)
+    assert not ResourceLimiter.applies("du -sh /", background=True)
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+import resource_limits
+from running_command import CommandCancelled, ProcessTree, RunningCommand
+
+
+@pytest.fixture(autouse=True)
+def unlimited(monkeypatch):
+    monkeypatch.setattr(resource_limits, "RESOURCE_LIMITS", None)
+
+
+def test_captures_output_and_exit_code():
+    running = RunningCommand("echo out; echo err >&2; exit 3", 10).start()
+    returncode, stdout, stderr = running.wait()
+    assert returncode == 3
+    assert stdout.text() == "out\n" and stderr.text() == "err\n"
+    assert running.usage is not None and "limits: none" in running.usage_note()
+
+
+def test_wall_timeout_stops_the_command():
+    running = RunningCommand("sleep 30", 0.3).start()
+    with pytest.raises(subprocess.TimeoutExpired):
+        running.wait()
+    assert running.stop_signal == "SIGTERM"
+    assert running.process.poll() is not None
+
+
+def test_cancel_from_another_thread():
+    running = RunningCommand("sleep 30", 30).start()
+    threading.Timer(0.2, running.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(CommandCancelled):
+        running.wait()
+    assert time.monotonic() - started < 10
+    assert RunningCommand.cancel_all() == 0
+
+
+def test_terminate_reaches_children_in_their_own_session():
+    process = subprocess.Popen(
+        ["/bin/sh", "-c", "setsid sleep 30 & echo $!; wait"],
+        stdout=subprocess.PIPE, start_new_session=True, text=True,
+    )
+    child = int(process.stdout.readline())
+    assert child in ProcessTree.descendants(process.pid)
+    ProcessTree.terminate(process, grace=2)
+    process.stdout.close()
+    deadline = time.monotonic() + 2
+    while ProcessTree._alive(child) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not ProcessTree._alive(child)
@@ -0,0 +1,24 @@
+import pytest
+
+from main import parse_step_selection
+
+
+@pytest.mark.parametrize("answer, steps", [
+    ("y", {1, 2, 3, 4}),
+    (" YES ", {1, 2, 3, 4}),
+    ("all", {1, 2, 3, 4}),
+    ("n", set()),
+    ("", set()),
+    ("2", {2}),
+    ("1,3-4", {1, 3, 4}),
+    ("1 3", {1, 3}),
+    ("2-2, 4", {2, 4}),
+    ("1-4", {1, 2, 3, 4}),
+])
+def test_selection(answer, steps):
+    assert parse_step_selection(answer, 4) == steps
+
+
+@pytest.mark.parametrize("answer", ["0", "5", "3-1", "1-5", "1,,x", "maybe", "-1", "1-"])
+def test_unreadable(answer):
+    assert parse_step_selection(answer, 4) is None
@@ -0,0 +1,66 @@
+import json
+
+import timeout_policy
+from timeout_policy import TimeoutPolicy
+
+
+def test_profile_matches_any_simple_command():
+    policy = TimeoutPolicy.for_command("sudo apt-get install -y nginx")
+    assert (policy.wall, policy.idle, policy.max_extensions) == (120, 60, 6)
+    policy = TimeoutPolicy.for_command("cd /var && du -sh *")
+    assert (policy.wall, policy.idle) == (60, None)
+
+
+def test_default_profile(monkeypatch):
+    monkeypatch.setattr(timeout_policy, "COMMAND_TIMEOUT", 7)
+    policy = TimeoutPolicy.for_command("ls -la")
+    assert (policy.profile, policy.wall) == ("default", 7)
+
+
+def test_coerce_keeps_policies_and_wraps_numbers():
+    policy = TimeoutPolicy.for_command("ls")
+    assert TimeoutPolicy.coerce("ls", policy) is policy
+    fixed = TimeoutPolicy.coerce("ls", 5)
+    assert (fixed.profile, fixed.wall, fixed.idle) == ("fixed", 5, None)
+
+
+def test_idle_timeout(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(timeout_policy.time, "monotonic", lambda: now[0])
+    policy = TimeoutPolicy("cmd", wall=60, idle=10)
+    now[0] += 9
+    assert not policy.expired() and policy.remaining() == 1
+    now[0] += 1
+    assert policy.expired() and policy.outcome == "idle_timeout"
+
+
+def test_extends_while_output_flows(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(timeout_policy.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(timeout_policy, "TIMEOUT_EXTENSION", 30)
+    policy = TimeoutPolicy("cmd", wall=10, max_extensions=1)
+    now[0] += 10
+    policy.saw_output(5)
+    assert not policy.expired() and policy.extensions == 1
+    now[0] += 30
+    policy.saw_output(5)
+    assert policy.expired() and policy.outcome == "wall_timeout"
+    assert "1 extension(s)" in policy.describe()
+
+
+def test_wall_timeout_without_recent_output(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(timeout_policy.time, "monotonic", lambda: now[0])
+    policy = TimeoutPolicy("cmd", wall=10, max_extensions=3)
+    now[0] += 10
+    assert policy.expired() and policy.extensions == 0
+
+
+def test_record_skips_fixed_limits(tmp_path, monkeypatch):
+    log = tmp_path / "timeouts.jsonl"
+    monkeypatch.setattr(timeout_policy, "TIMEOUT_LOG", str(log))
+    TimeoutPolicy.coerce("ls", 5).record("completed")
+    assert not log.exists()
+    TimeoutPolicy.for_command("ls").record("completed")
+    entry = json.loads(log.read_text())
+    assert (entry["command"], entry["profile"], entry["outcome"]) == ("ls", "default", "completed")
@@ -0,0 +1,131 @@
+"""
+Per-command timeouts: wall-clock and idle limits chosen from TIMEOUT_PROFILES, with extensions while output flows.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from config import (COMMAND_IDLE_TIMEOUT, COMMAND_MAX_EXTENSIONS, COMMAND_TIMEOUT, TIMEOUT_EXTENSION,
+                    TIMEOUT_LOG, TIMEOUT_PROFILES, TIMEOUT_PROGRESS_WINDOW)
+from osagent_common.safety_policy import command_segments
+
+
+class TimeoutPolicy:
+    """
+    When to give up on one running command.
+
+    Built from the first TIMEOUT_PROFILES entry matching any simple command in the line.
+    The loop reading the command's output reports each chunk with saw_output(), sleeps at
+    most remaining() seconds and asks expired() whether to stop. expired() grants an
+    extension instead when the wall-clock limit is reached while output is still flowing.
+    """
+    _profiles = [(re.compile(pattern), wall, idle, extensions) for pattern, wall, idle, extensions in TIMEOUT_PROFILES]
+    _log_lock = threading.Lock()
+
+    def __init__(self, command: str, wall: float, idle: Optional[float] = None, max_extensions: int = 0, profile: str = "fixed"):
+        self.command = command
+        self.wall = wall
+        self.idle = idle
+        self.max_extensions = max_extensions
+        self.profile = profile
+        self.extensions = 0
+        self.outcome = None
+        self.output_bytes = 0
+        self.max_gap = 0.0
+        self.start()
+
+    @classmethod
+    def for_command(cls, command: str) -> "TimeoutPolicy":
+        segments = command_segments(command)
+        for pattern, wall, idle, extensions in cls._profiles:
+            if any(pattern.search(segment) for segment in segments):
+                return cls(command, wall, idle, extensions, pattern.pattern)
+        return cls(command, COMMAND_TIMEOUT, COMMAND_IDLE_TIMEOUT, COMMAND_MAX_EXTENSIONS, "default")
+
+    @classmethod
+    def coerce(cls, command: str, timeout) -> "TimeoutPolicy":
+        """Accept either a policy or a plain number of seconds (a fixed wall-clock limit)."""
+        return timeout if isinstance(timeout, TimeoutPolicy) else cls(command, timeout)
+
+    def start(self):
+        self.started = self.last_output = time.monotonic()
+        self.deadline = self.started + self.wall
+
+    def saw_output(self, size: int):
+        now = time.monotonic()
+        self.max_gap = max(self.max_gap, now - self.last_output)
+        self.last_output = now
+        self.output_bytes += size
+
+    def remaining(self) -> float:
+        """Seconds until expired() needs to be asked again."""
+        now = time.monotonic()
+        until = self.deadline - now
+        if self.idle is not None:
+            until = min(until, self.last_output + self.idle - now)
+        return max(0.0, until)
+
+    def expired(self) -> bool:
+        now = time.monotonic()
+        if self.idle is not None and now - self.last_output >= self.idle:
+            self.outcome = "idle_timeout"
+            return True
+        if now < self.deadline:
+            return False
+        if self.extensions < self.max_extensions and now - self.last_output < TIMEOUT_PROGRESS_WINDOW:
+            self.extensions += 1
+            self.deadline += TIMEOUT_EXTENSION
+            return False
+        self.outcome = "wall_timeout"
+        return True
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def note(self) -> str:
+        """Tell the model about extensions granted to a command that then finished."""
+        if not self.extensions:
+            return ""
+        return (
+            f"[timeout: extended {self.extensions}x by {TIMEOUT_EXTENSION}s while output continued; "
+            f"finished after {self.elapsed():.0f}s]"
+        )
+
+    def describe(self) -> str:
+        """Error text for a command stopped by this policy."""
+        if self.outcome == "idle_timeout":
+            return f"Error: Command produced no output for {self.idle:g} seconds and was stopped."
+        extended = f" (including {self.extensions} extension(s) of {TIMEOUT_EXTENSION}s)" if self.extensions else ""
+        return f"Error: Command timed out after {self.elapsed():.0f} seconds{extended}."
+
+    def record(self, outcome: Optional[str] = None):
+        """Append the decision to TIMEOUT_LOG."""
+        if outcome is not None:
+            self.outcome = outcome
+        if not TIMEOUT_LOG or self.profile == "fixed":
+            return
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "command": self.command[:200],
+            "profile": self.profile,
+            "wall": self.wall,
+            "idle": self.idle,
+            "max_extensions": self.max_extensions,
+            "extensions": self.extensions,
+            "outcome": self.outcome,
+            "elapsed": round(self.elapsed(), 3),
+            "max_gap": round(max(self.max_gap, time.monotonic() - self.last_output), 3),
+            "output_bytes": self.output_bytes,
+        }
+        with TimeoutPolicy._log_lock:
+            try:
+                os.makedirs(os.path.dirname(TIMEOUT_LOG) or ".", exist_ok=True)
+                with open(TIMEOUT_LOG, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError:
+                pass
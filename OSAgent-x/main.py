@@ -13,157 +13,40 @@ import json
 import requests
 import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Optional
 
+# The safety policy engine and the read-only classifier are shared by every variant
+# (osagent_common/, beside this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from osagent_common.read_only import is_read_only
+from osagent_common.safety_policy import SafetyPolicy
+
 # --- CONFIGURATION ---
 API_URL = "http://10.167.32.1:1234/v1/chat/completions"
 MODEL_TEMPERATURE = 0.1
 # Operation modes: False = Ask First (default), True = Autonomous
 MODEL_AUTOMATION = False
 LOG_DIR = "logs"
-# Safety configuration for Ubuntu 24.04 LTS system administration
-SAFE_COMMANDS = [
-    # System information (read-only)
-    "uname",
-    "hostname",
-    "hostnamectl",
-    "lsb_release",
-    "date",
-    "time",
-    "uptime",
-    "whoami",
-    "id",
-    "w",
-    "who",
-    "last",
-    "lastlog",
-    "ls",
-    "find",
-    "locate",
-    "which",
-    "whatis",
-    "whereis",
-    "type",
-    "cat",
-    "less",
-    "more",
-    "head",
-    "tail",
-    "wc",
-    "sort",
-    "uniq",
-    "grep",
-    "egrep",
-    "fgrep",
-    "zgrep",
-    "zcat",
-    "file",
-    "stat",
-    "df",
-    "du",
-    "free",
-    "top",
-    "htop",
-    "ps",
-    "pgrep",
-    "pidof",
-    "vmstat",
-    "iostat",
-    "netstat",
-    "ss",
-    "lsof",
-    "iptables",
-    "ufw",
-    "firewall-cmd",
-    "systemctl",
-    "service",
-    "journalctl",
-    "timedatectl",
-    "localectl",
-    "loginctl",
-    "hostnamectl",
-    "status",
-    "is-active",
-    "is-enabled",
-    "is-failed",
-    "list-units",
-    "list-unit-files",
-    "show",
-    # Package management (query only)
-    "apt",
-    "apt-cache",
-    "apt-show-versions",
-    "dpkg",
-    "rpm",
-    "yum",
-    "dnf",
-    # File operations (safe, read-only or non-destructive)
-    "mkdir",
-    "touch",
-    "cp",
-    "rsync",
-    "ln",
-    "chmod",
-    "chown",
-    "chgrp",
-    # Network diagnostics
-    "ping",
-    "traceroute",
-    "tracepath",
-    "mtr",
-    "dig",
-    "nslookup",
-    "host",
-    "curl",
-    "wget",
-    "scp",
-    "ssh",
-    "ftp",
-    "sftp",
-    # Log management
-    "journalctl",
-    "tail",
-    "less",
-    "more",
-    "grep",
-    "zgrep",
-    # System maintenance (safe operations)
-    "sudo",
-    "systemctl",
-    "service",
-    "initctl",
-]
-
-# Destructive commands that require explicit confirmation even in autonomous mode
-DESTRUCTIVE_COMMANDS = [
-    "rm",
-    "dd",
-    "> ",
-    "mkfs",
-    "fdisk",
-    "parted",
-    "sfdisk",
-    "wipefs",
-    "shred",
-    "format",
-    "del",
-    "erase",
-    "destroy",
-    "reset",
-    "reboot",
-    "shutdown",
-    "halt",
-    "poweroff",
-    "init",
-    "kill",
-    "killall",
-    "pkill",
-    "xkill",
-    "skill",
-    "nice",
-    "renice",
-]
+# Safety configuration for Ubuntu 24.04 LTS system administration: allowlist, destructive and
+# high-risk patterns, compiled once into a single matcher
+SAFETY_POLICY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_policy.yaml")
+
+# Plan-then-execute agentic mode (--agent --plan): the model returns a plan of commands
+# that run in plan order, consecutive read-only ones in parallel, and the model sees all
+# their outputs at once. --max-iterations overrides PLAN_MAX_ROUNDS.
+PLAN_MAX_ROUNDS = 3
+PLAN_MAX_STEPS = 10
+PLAN_MAX_PARALLEL = 4
+
+# Stall detection in agentic mode: fingerprints of each command and its output reveal
+# repeats and cycles. The response escalates from a corrective hint to a switch to
+# STALL_FALLBACK_MODEL (if set) and then to an early stop with a summary.
+STALL_WINDOW = 6  # Steps looked back on
+STALL_MAX_SAME_COMMAND = 3  # Runs of one command within the window, even with changing output
+STALL_FALLBACK_MODEL = None  # Model name on the same API to switch to; None = no switch
 
 # --- EMBEDDED KNOWLEDGE BASE ---
 KNOWLEDGE_BASE = {
@@ -271,75 +154,25 @@ class SessionLogger:
 
 
 class TerminalTool:
+    # Allowlist and blocklists (see SAFETY_POLICY_FILE)
+    policy = SafetyPolicy.load(SAFETY_POLICY_FILE)
+
     @staticmethod
     def _is_command_safe(command: str) -> tuple[bool, str]:
         """
         Check if a command is safe to execute based on allowlist/blocklist approach.
         Returns (is_safe, reason)
         """
-        command = command.strip()
-        if not command:
-            return False, "Empty command"
-
-        # Split command into parts to get the base command
-        parts = command.split()
-        base_command = parts[0] if parts else ""
-
-        # Handle sudo specially - check the actual command after sudo
-        if base_command == "sudo" and len(parts) > 1:
-            base_command = parts[1]
-
-        # Check against destructive commands (blocklist)
-        for destructive in DESTRUCTIVE_COMMANDS:
-            if destructive in command:
-                return False, f"Potentially destructive command detected: {destructive}"
-
-        # Special high-risk patterns that should always be blocked
-        high_risk_patterns = [
-            "rm -rf /",
-            "rm -rf\\",
-            ":(){ :|:& };:",
-            "> /dev/sd",
-            "dd if=",
-            "mkfs.",
-            "fdisk",
-            "parted",
-            "> /dev/",
-            "chmod -R 777",
-            "chown -R",
-            ": >",
-            "forkbomb",
-        ]
-
-        for pattern in high_risk_patterns:
-            if pattern in command:
-                return False, f"High-risk pattern detected: {pattern}"
-
-        # Check if base command is in safe list
-        if base_command in SAFE_COMMANDS:
-            return True, "Command is in safe list"
-
-        # If not explicitly allowed, check if it's a common safe utility
-        safe_prefixes = [
-            "ls",
-            "cat",
-            "grep",
-            "echo",
-            "pwd",
-            "find",
-            "which",
-            "whoami",
-            "id",
-            "groups",
-        ]
-        for prefix in safe_prefixes:
-            if base_command.startswith(prefix):
-                return True, f"Command starts with safe prefix: {prefix}"
+        verdict = TerminalTool.policy.check(command)
+        return verdict.allowed, verdict.reason
 
-        return (
-            False,
-            f"Command '{base_command}' not in allowlist and doesn't match safe patterns",
-        )
+    @staticmethod
+    def is_read_only(command: str) -> bool:
+        """
+        True if every command in the line only inspects the system (see READ_ONLY in
+        osagent_common/read_only.py) and the safety policy allows the line.
+        """
+        return is_read_only(command) and TerminalTool._is_command_safe(command)[0]
 
     @staticmethod
     def execute(command: str) -> str:
@@ -388,14 +221,31 @@ class ContextManager:
 
 
 class AgentLLM:
+    # Calls made and seconds spent waiting for them, for the agentic mode reports
+    calls = 0
+    seconds = 0.0
+    # Sent as the "model" field when set (see STALL_FALLBACK_MODEL); None = the server's default
+    model = None
+
     @staticmethod
     def chat(messages: List[Dict]) -> str:
+        AgentLLM.calls += 1
+        started = time.monotonic()
+        try:
+            return AgentLLM._chat(messages)
+        finally:
+            AgentLLM.seconds += time.monotonic() - started
+
+    @staticmethod
+    def _chat(messages: List[Dict]) -> str:
         payload = {
             "messages": messages,
             "temperature": MODEL_TEMPERATURE,
             "stream": False,
             "stop": ["User>", "System:"],
         }
+        if AgentLLM.model:
+            payload["model"] = AgentLLM.model
         try:
             response = requests.post(API_URL, json=payload, timeout=120)
             response.raise_for_status()
@@ -415,13 +265,117 @@ class AgentLLM:
             return f"Error: {str(e)}"
 
 
+class StallDetector:
+    """
+    Notices an agentic run going in circles, from fingerprints of each step (a command
+    and its output, or a reply without a command).
+
+    A step repeating an earlier one within STALL_WINDOW steps, a cycle of two or three
+    steps, or one command run STALL_MAX_SAME_COMMAND times is a stall. The response
+    escalates: a corrective hint, then a switch to STALL_FALLBACK_MODEL (if set), then an
+    early stop. STALL_WINDOW steps without a stall clear the record.
+    """
+
+    def __init__(self):
+        self.steps = []  # (command, command fingerprint, output fingerprint)
+        self.strikes = 0
+        self.clean_steps = 0
+        self.issue = ""
+        self.stopped = False
+
+    @staticmethod
+    def fingerprint(text: str) -> int:
+        # Clock times and spacing change between otherwise identical outputs
+        text = re.sub(r"\b\d{1,2}:\d{2}(:\d{2})?(\.\d+)?\b", "<time>", text)
+        return hash(" ".join(text.split()))
+
+    def _find_issue(self) -> Optional[str]:
+        command, command_fp, output_fp = self.steps[-1]
+        keys = [(c, o) for _, c, o in self.steps]
+        for period in (2, 3):
+            if len(keys) >= 2 * period and keys[-period:] == keys[-2 * period : -period]:
+                commands = ", ".join(f"`{c}`" for c, _, _ in self.steps[-period:])
+                return f"The last {2 * period} steps repeat a cycle of {period} ({commands}) with the same results."
+        recent = keys[-STALL_WINDOW - 1 : -1]
+        if (command_fp, output_fp) in recent:
+            ago = recent[::-1].index((command_fp, output_fp)) + 1
+            if not command:
+                return f"Your reply repeats the one from {ago} step(s) ago."
+            return f"`{command}` returned exactly the same output as {ago} step(s) ago."
+        runs = sum(1 for c, _ in keys[-STALL_WINDOW:] if c == command_fp)
+        if command and runs >= STALL_MAX_SAME_COMMAND:
+            return f"`{command}` was run {runs} times in the last {STALL_WINDOW} steps."
+        return None
+
+    def observe(self, command: str, output: str) -> Optional[str]:
+        """
+        Record one step (command "" for a reply without one). Returns None, or the action
+        to take: "hint", "switch" (to STALL_FALLBACK_MODEL) or "stop".
+        """
+        self.steps.append((command, self.fingerprint(command), self.fingerprint(output)))
+        issue = self._find_issue()
+        if issue is None:
+            self.clean_steps += 1
+            if self.clean_steps >= STALL_WINDOW:
+                self.strikes = 0
+            return None
+        self.issue = issue
+        self.clean_steps = 0
+        self.strikes += 1
+        if self.strikes == 1:
+            return "hint"
+        if self.strikes == 2 and STALL_FALLBACK_MODEL and AgentLLM.model != STALL_FALLBACK_MODEL:
+            return "switch"
+        self.stopped = True
+        return "stop"
+
+    def hint(self) -> str:
+        return (
+            f"NOTE: {self.issue} Repeating it will not produce new information. "
+            "Use the evidence you already have: run a different command that tests another "
+            "hypothesis, or finish with your conclusions."
+        )
+
+    def stop_prompt(self) -> str:
+        return (
+            f"STOP: {self.issue} The run is not making progress. Do not request any more "
+            "commands. Summarise what you found, what is still unknown, and the next step "
+            "you would suggest."
+        )
+
+
 # --- ORCHESTRATOR ---
 
 
+def handle_stall(action, detector, logger):
+    """Report a stall and act on it. Returns the note for the model's next message."""
+    print(f"\n[!] Stall detected: {detector.issue}")
+    logger.log("SYSTEM", f"Stall detected ({action}): {detector.issue}")
+    if action == "switch":
+        AgentLLM.model = STALL_FALLBACK_MODEL
+        print(f"[!] Switching to model {STALL_FALLBACK_MODEL}.")
+    if action == "stop":
+        print("[!] Stopping early.")
+        return detector.stop_prompt()
+    return detector.hint()
+
+
+def stop_with_summary(messages, history, logger):
+    """One last LLM call for a summary; any command it requests is not run."""
+    print("Agent summarising...", end="\r")
+    summary = AgentLLM.chat(messages)
+    print(f"\rAgent (summary): {summary}\n")
+    logger.log("AGENT", summary)
+    history.append({"role": "assistant", "content": summary})
+
+
 def process_agent_interaction(
-    user_input, terminal, logger, history, base_system_prompt
+    user_input, terminal, logger, history, base_system_prompt, detector=None
 ):
-    """Process a single interaction with the agent"""
+    """
+    Process a single interaction with the agent. With a StallDetector, every command is
+    checked for repeats; a stop ends the interaction with a summary (see detector.stopped).
+    """
     logger.log("USER", user_input)
 
     specialized_context = ContextManager.get_relevant_context(user_input)
@@ -474,9 +428,15 @@ def process_agent_interaction(
                 logger.log("SYSTEM", "User denied command execution.")
                 print("[!] Execution denied.")
 
-            messages.append(
-                {"role": "user", "content": f"COMMAND OUTPUT:\n{execution_result}"}
-            )
+            content = f"COMMAND OUTPUT:\n{execution_result}"
+            action = detector.observe(cmd, execution_result) if detector else None
+            if action is not None:
+                content += f"\n\n{handle_stall(action, detector, logger)}"
+            messages.append({"role": "user", "content": content})
+            if action == "stop":
+                history.append({"role": "user", "content": content})
+                stop_with_summary(messages, history, logger)
+                break
             continue
         else:
             break
@@ -551,12 +511,19 @@ def run_agentic_mode(initial_prompt, max_iterations=5):
 
     history = []
     current_prompt = initial_prompt
+    started = time.monotonic()
+    calls_before, seconds_before = AgentLLM.calls, AgentLLM.seconds
+    rounds = 0
+    detector = StallDetector()
 
     for i in range(max_iterations):
+        rounds += 1
         print(f"\n[Iteration {i + 1}/{max_iterations}]")
         history = process_agent_interaction(
-            current_prompt, terminal, logger, history, base_system_prompt
+            current_prompt, terminal, logger, history, base_system_prompt, detector
         )
+        if detector.stopped:
+            break
 
         # Check if the last response indicates task completion
         if history and len(history) >= 2:
@@ -572,6 +539,254 @@ def run_agentic_mode(initial_prompt, max_iterations=5):
         # For next iteration, use a follow-up prompt
         current_prompt = "Continue working toward the goal. Provide next steps or indicate completion with 'TASK_COMPLETE'."
 
+        # Answering "continue" with the same reply again is a stall too
+        action = detector.observe("", last_response) if history else None
+        if action is not None:
+            note = handle_stall(action, detector, logger)
+            if action == "stop":
+                history.append({"role": "user", "content": note})
+                messages = [{"role": "system", "content": base_system_prompt}] + history
+                stop_with_summary(messages, history, logger)
+                break
+            current_prompt = f"{note}\n{current_prompt}"
+
+    if detector.stopped:
+        saved = max_iterations - rounds
+        print(f"\n--- Stopped early after {rounds} of {max_iterations} iterations: {saved} iteration(s) saved ---")
+        logger.log("SYSTEM", f"Stall stop after {rounds} of {max_iterations} iterations; {saved} saved.")
+
+    report_run(
+        "Agentic mode",
+        logger,
+        rounds,
+        started,
+        AgentLLM.calls - calls_before,
+        AgentLLM.seconds - seconds_before,
+    )
+
+
+def report_run(mode, logger, rounds, started, llm_calls, llm_seconds, commands=None):
+    """Print and log how many rounds, LLM calls and seconds an agentic run took."""
+    wall = time.monotonic() - started
+    report = (
+        f"{mode}: {rounds} round(s), {llm_calls} LLM call(s), {wall:.1f}s wall time "
+        f"({llm_seconds:.1f}s waiting for the LLM)"
+    )
+    if commands is not None:
+        # The step-by-step loop needs one LLM call per command, plus the final answer,
+        # and runs the commands one after another
+        run_count, serial_seconds, command_seconds = commands
+        loop_calls = run_count + 1
+        loop_wall = wall - command_seconds + serial_seconds
+        if llm_calls:
+            loop_wall += (loop_calls - llm_calls) * llm_seconds / llm_calls
+        report += (
+            f"\nStep-by-step loop for the same {run_count} command(s): "
+            f"~{loop_calls} LLM calls, ~{loop_wall:.1f}s "
+            f"(saved {loop_calls - llm_calls} LLM call(s), ~{loop_wall - wall:.1f}s)"
+        )
+    print(f"\n--- {report} ---")
+    logger.log("SYSTEM", report)
+
+
+def parse_plan(response):
+    """
+    The plan in a plan-mode response: {"steps": [{"command", "purpose"}]} or
+    {"final": "..."}. EXEC tags are accepted as steps; anything else is a final answer.
+    """
+    match = re.search(r"\{.*\}", response, re.DOTALL)
+    if match:
+        try:
+            plan = json.loads(match.group(0))
+        except ValueError:
+            plan = None
+        if isinstance(plan, dict) and isinstance(plan.get("steps"), list):
+            steps = []
+            for step in plan["steps"]:
+                if isinstance(step, str):
+                    step = {"command": step}
+                if isinstance(step, dict) and str(step.get("command", "")).strip():
+                    steps.append(
+                        {
+                            "command": str(step["command"]).strip(),
+                            "purpose": str(step.get("purpose", "")),
+                        }
+                    )
+            if steps:
+                return {"steps": steps[:PLAN_MAX_STEPS]}
+        if isinstance(plan, dict) and "final" in plan:
+            return {"final": str(plan["final"])}
+    commands = re.findall(r"\[\[EXEC:\s*(.*?)\s*\]\]", response, re.DOTALL)
+    if commands:
+        return {"steps": [{"command": c, "purpose": ""} for c in commands][:PLAN_MAX_STEPS]}
+    return {"final": response}
+
+
+def confirm(prompt):
+    if MODEL_AUTOMATION:
+        return True
+    while True:
+        answer = input(prompt).lower().strip()
+        if answer in ["y", "yes"]:
+            return True
+        if answer in ["n", "no"]:
+            return False
+        print("Please enter 'y' (yes) or 'n' (no)")
+
+
+def execute_plan(steps, terminal, logger):
+    """
+    Run one plan in order: each run of consecutive read-only steps in parallel (approved
+    together), any other step on its own once everything before it has finished.
+    Returns (evidence, run_count, serial_seconds, wall_seconds) for the commands run.
+    """
+    read_only = [i for i, step in enumerate(steps) if terminal.is_read_only(step["command"])]
+    print(f"\n[?] Agent plans {len(steps)} step(s):")
+    for i, step in enumerate(steps):
+        kind = "read-only" if i in read_only else "may modify the system"
+        purpose = f" - {step['purpose']}" if step["purpose"] else ""
+        print(f"  {i + 1}. [{kind}] \033[93m{step['command']}\033[0m{purpose}")
+
+    results = {}
+    durations = {}
+    wall_seconds = 0.0
+
+    def timed(i):
+        started = time.monotonic()
+        result = terminal.execute(steps[i]["command"])
+        durations[i] = time.monotonic() - started
+        return result
+
+    i = 0
+    while i < len(steps):
+        if i not in read_only:
+            print(
+                f"\n[?] Step {i + 1} may modify the system: \033[93m{steps[i]['command']}\033[0m"
+            )
+            if confirm("[y]es to execute, [n]o to skip > "):
+                logger.log("SYSTEM", f"Executing Command: {steps[i]['command']}")
+                results[i] = timed(i)
+                wall_seconds += durations[i]
+            i += 1
+            continue
+        wave = []
+        while i < len(steps) and i in read_only:
+            wave.append(i)
+            i += 1
+        numbers = (
+            f"{wave[0] + 1}" if len(wave) == 1 else f"{wave[0] + 1}-{wave[-1] + 1}"
+        )
+        together = " in parallel" if len(wave) > 1 else ""
+        if not confirm(f"Run read-only step(s) {numbers}{together}? [y/n] > "):
+            continue
+        for j in wave:
+            logger.log("SYSTEM", f"Executing Command: {steps[j]['command']}")
+        parallel_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=PLAN_MAX_PARALLEL) as pool:
+            futures = {j: pool.submit(timed, j) for j in wave}
+            for j, future in futures.items():
+                results[j] = future.result()
+        wall_seconds += time.monotonic() - parallel_started
+
+    sections = []
+    for i, step in enumerate(steps):
+        result = results.get(i, "User denied execution.")
+        if i in results:
+            logger.log("TERMINAL_OUTPUT", result)
+        else:
+            logger.log("SYSTEM", f"User denied command execution: {step['command']}")
+        sections.append(f"[{i + 1}/{len(steps)}] {step['command']}\n{result.rstrip()}")
+    evidence = "\n\n".join(sections)
+    print(f"[*] Output:\n{evidence}")
+    return evidence, len(results), sum(durations.values()), wall_seconds
+
+
+def run_plan_mode(initial_prompt, max_rounds=PLAN_MAX_ROUNDS):
+    """
+    Plan-then-execute: each LLM call returns a whole investigation plan, whose steps
+    run before the model is called again with all of the evidence.
+    """
+    terminal = TerminalTool()
+    logger = SessionLogger(LOG_DIR)
+
+    base_system_prompt = (
+        "You are an Advanced Linux Automation Agent. You have access to a local terminal.\n\n"
+        "**PLAN MODE:** Do not request commands one at a time. Reply with ONLY a JSON object "
+        '{"steps": [{"command": "<shell command>", "purpose": "<what it tells you>"}]} '
+        "listing every command needed to gather the evidence for the goal. Independent "
+        "read-only commands next to each other run in parallel; every step runs in plan "
+        "order, so list a command after the ones it depends on. You then receive all "
+        "outputs at once.\n"
+        "When you have enough evidence (or the goal is done), reply with ONLY "
+        '{"final": "<your answer or summary>"}.'
+    )
+    specialized_context = ContextManager.get_relevant_context(initial_prompt)
+    if specialized_context:
+        base_system_prompt += f"\n\n--- ACTIVE KNOWLEDGE ---\n{specialized_context}"
+
+    print(f"\n--- PLAN MODE: Working toward goal ---")
+    print(f"Goal: {initial_prompt}")
+    print(f"Max rounds: {max_rounds}")
+    logger.log("USER", initial_prompt)
+
+    messages = [
+        {"role": "system", "content": base_system_prompt},
+        {"role": "user", "content": initial_prompt},
+    ]
+    started = time.monotonic()
+    calls_before, seconds_before = AgentLLM.calls, AgentLLM.seconds
+    rounds = run_count = 0
+    serial_seconds = command_seconds = 0.0
+    final = None
+    asked_for_final = False
+    while final is None:
+        print("Agent thinking...", end="\r")
+        response = AgentLLM.chat(messages)
+        print(f"\rAgent: {response}\n")
+        logger.log("AGENT", response)
+        messages.append({"role": "assistant", "content": response})
+        plan = parse_plan(response)
+        if "final" in plan:
+            final = plan["final"]
+            break
+        if rounds == max_rounds:
+            if asked_for_final:
+                final = f"No final answer after {max_rounds} round(s); stopped."
+                break
+            asked_for_final = True
+            messages.append(
+                {
+                    "role": "user",
+                    "content": 'No rounds left. Reply with ONLY {"final": "<your answer>"} '
+                    "based on the evidence so far.",
+                }
+            )
+            continue
+        rounds += 1
+        print(f"\n[Round {rounds}/{max_rounds}]")
+        evidence, count, serial, wall = execute_plan(plan["steps"], terminal, logger)
+        run_count += count
+        serial_seconds += serial
+        command_seconds += wall
+        messages.append(
+            {
+                "role": "user",
+                "content": f"EVIDENCE (round {rounds}):\n{evidence}\n\n"
+                "Reply with a new plan if you need more evidence, otherwise with the final answer.",
+            }
+        )
+
+    print(f"\n--- Final answer ---\n{final}")
+    report_run(
+        "Plan mode",
+        logger,
+        rounds,
+        started,
+        AgentLLM.calls - calls_before,
+        AgentLLM.seconds - seconds_before,
+        commands=(run_count, serial_seconds, command_seconds),
+    )
+
 
 if __name__ == "__main__":
     import argparse
@@ -588,17 +803,30 @@ if __name__ == "__main__":
         action="store_true",
         help="Enable agentic mode (continuous operation)",
     )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Plan-then-execute in agentic mode: run each plan's read-only steps in parallel",
+    )
     parser.add_argument(
         "--max-iterations",
         "-m",
         type=int,
-        default=5,
-        help="Maximum iterations for agentic mode",
+        default=None,
+        help="Maximum iterations for agentic mode (default 5), or rounds with --plan "
+        f"(default {PLAN_MAX_ROUNDS})",
     )
     args = parser.parse_args()
 
-    if args.agent and args.prompt:
-        run_agentic_mode(args.prompt, args.max_iterations)
+    if args.agent and args.prompt and args.plan:
+        run_plan_mode(
+            args.prompt,
+            PLAN_MAX_ROUNDS if args.max_iterations is None else args.max_iterations,
+        )
+    elif args.agent and args.prompt:
+        run_agentic_mode(
+            args.prompt, 5 if args.max_iterations is None else args.max_iterations
+        )
     elif args.prompt:
         # One-shot mode: process prompt then exit
         run_one_shot_mode(args.prompt)
@@ -0,0 +1 @@
+"""Code shared by every OSAgent variant. Each variant's main.py puts this directory's parent on sys.path."""
@@ -0,0 +1,311 @@
+"""
+Classifies command lines as read-only (they only inspect the system) or not.
+
+The line is parsed with safety_policy.parse_shell, and every simple command in it, including
+each command a wrapper such as sudo, env or xargs runs (safety_policy.command_argvs), must be
+listed in READ_ONLY with arguments its entry allows. Entries list what is read-only: the
+options a command may be given, its read-only subcommands and how many operands it may take.
+An option, subcommand or command that is not listed makes the line not read-only, so a new or
+unknown way of changing the system errs on the side of approval.
+
+Background jobs, command substitutions and output redirections to anything but /dev/null,
+/dev/stdout or /dev/stderr are never read-only.
+"""
+
+import itertools
+import os
+import re
+from typing import Callable, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from .safety_policy import (
+    WRAPPERS, ShellSyntaxError, Subshell, command_argvs, parse_shell, simple_commands, wrapped_command,
+)
+
+
+class ReadOnly(NamedTuple):
+    """What a read-only use of one command looks like."""
+    options: Optional[FrozenSet[str]] = None  # Allowed options without a value; None = any option
+    valued: FrozenSet[str] = frozenset()  # Allowed options that take a value (next word, or attached)
+    subcommands: Optional[FrozenSet[str]] = None  # Allowed first operands; None = any
+    actions: Optional[FrozenSet[str]] = None  # Allowed second operands (ip OBJECT ACTION); None = any
+    max_operands: Optional[int] = None  # Operands (not starting with - or +) it may take
+    bundles: bool = True  # Single-letter options may be bundled (-la); False: -name is one option
+    required: Optional[str] = None  # An option that must be present (top only ends with -b)
+    check: Optional[Callable[[List[str]], bool]] = None  # Further check of all arguments
+
+
+def _words(text: str) -> FrozenSet[str]:
+    return frozenset(text.split())
+
+
+ANY = ReadOnly()
+
+# sed scripts made only of addresses, printing/flow commands, s///flags without e or w, y and { }
+_SED_ADDRESS = r"(?:\d+(?:~\d+)?|\$|/(?:[^/\\\n]|\\.)*/[IM]*)"
+_SED_SCRIPT = re.compile(
+    rf"[\s;]*(?:(?:{_SED_ADDRESS}(?:\s*,\s*(?:{_SED_ADDRESS}|[+~]\d+))?)?\s*!?\s*"
+    r"(?:[pdqQ=nNPDhHgGxlzF{}]"
+    r"|s(?P<s>[^\\\n])(?:(?!(?P=s))[^\\\n]|\\.)*(?P=s)(?:(?!(?P=s))[^\\\n]|\\.)*(?P=s)[gpiImM0-9]*"
+    r"|y(?P<y>[^\\\n])(?:(?!(?P=y))[^\\\n]|\\.)*(?P=y)(?:(?!(?P=y))[^\\\n]|\\.)*(?P=y))[\s;]*)*\Z"
+)
+# awk programs that run commands, read them (getline) or write files and pipes
+_AWK_SIDE_EFFECTS = re.compile(r"\bsystem\s*\(|\bgetline\b|[>|]")
+
+
+def _sed_scripts(args: List[str]) -> bool:
+    """True if sed's scripts neither write (w) nor run (e); it reads no script file (-f is not listed)."""
+    scripts, operands, index = [], [], 0
+    while index < len(args):
+        arg = args[index]
+        bundle = re.fullmatch(r"-[nErsuz]*e(.*)", arg)
+        if arg == "--expression" or (bundle and not bundle.group(1)):
+            scripts.extend(args[index + 1:index + 2])
+            index += 2
+            continue
+        if arg.startswith("--expression="):
+            scripts.append(arg.split("=", 1)[1])
+        elif bundle:
+            scripts.append(bundle.group(1))
+        elif not arg.startswith("-") or arg == "-":
+            operands.append(arg)
+        index += 1
+    if not scripts:
+        scripts = operands[:1]
+    return bool(scripts) and all(_SED_SCRIPT.match(script) for script in scripts)
+
+
+def _awk_program(args: List[str]) -> bool:
+    return not any(_AWK_SIDE_EFFECTS.search(arg) for arg in args)
+
+
+def _lsof_ends(args: List[str]) -> bool:
+    """lsof -r / +r repeats until interrupted."""
+    return not any(arg[:1] in ("-", "+") and "r" in arg[1:] for arg in args)
+
+
+_FIND_TESTS = ("-name -iname -path -ipath -regex -iregex -wholename -iwholename -lname -ilname -type -xtype "
+               "-size -mtime -mmin -atime -amin -ctime -cmin -used -newer -anewer -cnewer -user -group -uid "
+               "-gid -perm -maxdepth -mindepth -links -inum -samefile -fstype -regextype -printf -context")
+_FIND_NEWER = " ".join(f"-newer{x}{y}" for x, y in itertools.product("aBcm", "aBcmt"))
+
+# Commands that only inspect the system, and the arguments that keep them read-only
+READ_ONLY = {
+    **dict.fromkeys(
+        ("ls", "pwd", "cat", "tac", "nl", "grep", "egrep", "fgrep", "zgrep", "zcat", "echo", "printf", "ps",
+         "pgrep", "pidof", "df", "du", "free", "uname", "whoami", "id", "groups", "head", "wc", "cut", "tr",
+         "which", "whereis", "whatis", "type", "stat", "uptime", "nproc", "lscpu", "lsblk", "lsmem", "lspci",
+         "lsusb", "lsmod", "lsb_release", "printenv", "last", "lastlog", "w", "who", "vmstat", "iostat",
+         "mpstat", "getent", "readlink", "realpath", "basename", "dirname", "test", "true", "false", "sleep",
+         "md5sum", "sha1sum", "sha256sum", "sha512sum", "ping", "dig", "host", "nslookup", "netstat", "diff",
+         "cmp", "cal", "locale", "tree"),
+        ANY),
+    "tail": ReadOnly(_words("-q --quiet --silent -v --verbose -z --zero-terminated -NUM"),
+                     _words("-n --lines -c --bytes")),  # Not -f / --follow: never ends
+    "uniq": ReadOnly(max_operands=1),  # uniq IN OUT writes OUT
+    "lsof": ReadOnly(check=_lsof_ends),  # Not -r / +r: repeats
+    "sort": ReadOnly(
+        _words("-b -d -f -g -i -M -h -n -R -r -V -c -C -m -s -u -z --ignore-leading-blanks --dictionary-order "
+               "--ignore-case --general-numeric-sort --ignore-nonprinting --month-sort --human-numeric-sort "
+               "--numeric-sort --random-sort --reverse --version-sort --check --merge --stable --unique "
+               "--zero-terminated --debug"),
+        _words("-k --key -t --field-separator -S --buffer-size -T --temporary-directory --parallel "
+               "--batch-size --random-source --sort --files0-from")),  # Not -o / --output
+    "file": ReadOnly(
+        _words("-b --brief -i --mime --mime-type --mime-encoding -L --dereference -h --no-dereference -k "
+               "--keep-going -l --list -N --no-pad -n --no-buffer -p --preserve-date -r --raw -s "
+               "--special-files -z --uncompress -Z --uncompress-noreport -0 --print0 -E --extension"),
+        _words("-e --exclude --exclude-quiet -f --files-from -F --separator -m --magic-file -P --parameter")),
+    "find": ReadOnly(
+        _words("-print -print0 -ls -prune -quit -not -a -and -o -or -follow -mount -xdev -depth -d "
+               "-daystart -noleaf -nouser -nogroup -true -false -empty -readable -writable -executable -L -P "
+               "-H -ignore_readdir_race -noignore_readdir_race -help --help -version --version"),
+        frozenset((_FIND_TESTS + " " + _FIND_NEWER).split()), bundles=False),  # No -exec, -delete, -fprint
+    "sed": ReadOnly(
+        _words("-n --quiet --silent -E -r --regexp-extended -s --separate -u --unbuffered -z --null-data "
+               "--posix --debug --sandbox"),
+        _words("-e --expression"), check=_sed_scripts),  # No -i, -f, w or e
+    "awk": ReadOnly(
+        _words("-b --characters-as-bytes -c --traditional -P --posix -S --sandbox -N --use-lc-numeric"),
+        _words("-F --field-separator -v --assign"), check=_awk_program),  # No -f, -i, -E, system(), > or |
+    "top": ReadOnly(
+        _words("-b -c -H -i -S -1 -E -e"), _words("-n -d -p -u -U -o -O -w"), required="-b"),
+    "date": ReadOnly(
+        _words("-u --utc --universal -R --rfc-email --debug"),
+        _words("-d --date -r --reference -I --iso-8601 --rfc-3339"), max_operands=0),  # Not -s / MMDDhhmm
+    "hostname": ReadOnly(
+        _words("-a --alias -A --all-fqdns -d --domain -f --fqdn --long -i --ip-address -I --all-ip-addresses "
+               "-s --short -y --yp --nis -V --version -h --help"), max_operands=0),  # Not NAME / -F / -b
+    "dmesg": ReadOnly(
+        _words("-T --ctime -H --human -k --kernel -u --userspace -x --decode -t --notime -r --raw -S --syslog "
+               "-P --nopager -d --show-delta -e --reltime -J --json -p --force-prefix -L --color"),
+        _words("-l --level -f --facility --time-format -F --file -s --buffer-size --since --until")),
+    "journalctl": ReadOnly(
+        _words("-k --dmesg -x --catalog -e --pager-end -r --reverse --no-pager -q --quiet --disk-usage "
+               "--list-boots -a --all --no-hostname --utc -m --merge --system --user -l --full --no-full "
+               "--show-cursor --header --no-tail --list-catalog --dump-catalog --fields --verify"),
+        _words("-u --unit --user-unit -n --lines -b --boot -p --priority -S --since -U --until -o --output "
+               "-g --grep -t --identifier -T --exclude-identifier -D --directory --file -M --machine "
+               "--output-fields -F --field -c --cursor --after-cursor --cursor-file --case-sensitive "
+               "--facility --namespace --root --image")),  # Not -f, --vacuum-*, --rotate, --flush, ...
+    "ss": ReadOnly(
+        _words("-h --help -V --version -H --no-header -O --oneline -n --numeric -r --resolve -a --all -l "
+               "--listening -o --options -e --extended -m --memory -p --processes -T --threads -i --info "
+               "--tos --cgroup -s --summary -b --bpf -Z --context -z --contexts -4 --ipv4 -6 --ipv6 -0 "
+               "--packet -t --tcp -M --mptcp -S --sctp -u --udp -d --dccp -w --raw -x --unix --vsock "
+               "--tipc --xdp"),
+        _words("-N --net -f --family -A --query --socket -F --filter")),  # Not -K / --kill or -D / --diag
+    "ip": ReadOnly(
+        _words("-4 -6 -0 -s -stats -statistics -d -details -j -json -p -pretty -c -color -br -brief -o "
+               "-oneline -h -human -human-readable -r -resolve -a -all -t -timestamp -ts -tshort"),
+        _words("-f -family -n -netns"),
+        subcommands=_words("a addr address l link r ro route n neigh neighbor neighbour rule ru maddr "
+                           "maddress mr mroute tunnel tun ntable netconf stats"),
+        actions=_words("show sh s list ls lst get help"), bundles=False),  # Not add, append, prepend, restore
+    "systemctl": ReadOnly(
+        _words("-a --all --failed -l --full --plain --no-legend --no-pager --user --system --value -r "
+               "--recursive --reverse --before --after --version -h --help -q --quiet --show-types"),
+        _words("-t --type --state -p --property -n --lines -o --output -H --host -M --machine"),
+        subcommands=_words("status show cat list-units list-unit-files list-timers list-sockets list-paths "
+                           "list-dependencies list-jobs list-machines is-active is-enabled is-failed "
+                           "is-system-running get-default show-environment help")),
+    "apt": ReadOnly(subcommands=_words("list show showsrc policy search depends rdepends")),
+    "apt-cache": ReadOnly(subcommands=_words("show showsrc showpkg search policy depends rdepends madison stats "
+                                             "pkgnames")),
+    "snap": ReadOnly(subcommands=_words("list info find version services connections changes")),
+    "hostnamectl": ReadOnly(subcommands=_words("status")),
+    "timedatectl": ReadOnly(subcommands=_words("status show list-timezones timesync-status show-timesync")),
+    "dpkg": ReadOnly(
+        _words("-l --list -L --listfiles -s --status -S --search -p --print-avail -c --contents -I --info "
+               "--print-architecture --print-foreign-architectures --get-selections --audit -C "
+               "--compare-versions --version --help --no-pager"),
+        _words("-f --field --admindir --root")),  # Not -i, -r, -P, -x, -b, --set-selections, ...
+    # Wrappers: read-only if their own options are, and the command they run is
+    "sudo": ReadOnly(_words("-n --non-interactive -E --preserve-env -H --set-home -P --preserve-groups -S --stdin "
+                            "-b --background"),
+                     _words("-u --user -g --group -h --host -p --prompt -C --close-from -D --chdir -r --role "
+                            "-t --type -T --command-timeout")),  # Not -e / --edit
+    "doas": ReadOnly(_words("-n -s"), _words("-u -C")),
+    "env": ReadOnly(_words("-i --ignore-environment -0 --null"), _words("-u --unset -C --chdir")),
+    "nice": ReadOnly(frozenset(), _words("-n --adjustment")),
+    "ionice": ReadOnly(_words("-t --ignore"), _words("-c --class -n --classdata")),  # Not -p PID
+    "nohup": ReadOnly(frozenset()),
+    "time": ReadOnly(_words("-p --portability -v --verbose -q --quiet"), _words("-f --format")),
+    "timeout": ReadOnly(_words("--preserve-status --foreground -v --verbose"),
+                        _words("-s --signal -k --kill-after")),
+    "stdbuf": ReadOnly(frozenset(), _words("-i --input -o --output -e --error")),
+    "command": ReadOnly(_words("-p -v -V")),
+    "xargs": ReadOnly(_words("-0 --null -r --no-run-if-empty -t --verbose -x --exit"),
+                      _words("-a --arg-file -d --delimiter -E -I -L --max-lines -n --max-args -P --max-procs "
+                             "-s --max-chars")),
+}
+
+_HARMLESS_TARGETS = ("/dev/null", "/dev/stdout", "/dev/stderr")
+
+
+def is_read_only(command: str) -> bool:
+    """
+    True if every command in the command line only inspects the system: each pipeline stage,
+    chained and subshell command, and the command run by a wrapper such as sudo, env or xargs.
+    """
+    try:
+        script = parse_shell(command)
+    except ShellSyntaxError:
+        return False
+    if _runs_in_background(script):
+        return False
+    for simple in simple_commands(script):
+        # Writes, process substitution and command substitution are never read-only
+        if simple.substitutions or any(
+            redirect.writes and redirect.target not in _HARMLESS_TARGETS for redirect in simple.redirects
+        ):
+            return False
+        after_xargs = False
+        try:
+            for argv in command_argvs(list(simple.words)):
+                if not argv_read_only(argv, after_xargs):
+                    return False
+                after_xargs = os.path.basename(argv[0]) == "xargs"
+        except ShellSyntaxError:
+            return False  # An sh -c / eval script the parser cannot follow
+    return True
+
+
+def _runs_in_background(script) -> bool:
+    for pipeline, operator in script.items:
+        if operator == "&":
+            return True
+        for command in pipeline.commands:
+            if isinstance(command, Subshell) and _runs_in_background(command.body):
+                return True
+    return False
+
+
+def argv_read_only(argv: List[str], after_xargs: bool = False) -> bool:
+    """
+    True if one command of command_argvs is read-only. A wrapper's own arguments are checked here
+    and the command it runs is the next argv. after_xargs: xargs appends operands the line does
+    not show, so commands with an operand limit are not read-only.
+    """
+    name = os.path.basename(argv[0])
+    spec = READ_ONLY.get(name)
+    if spec is None:
+        return False
+    args = argv[1:]
+    if name in WRAPPERS:
+        wrapped = wrapped_command(argv)
+        if not wrapped:
+            return False
+        args = argv[1:len(argv) - len(wrapped)]
+    operands, seen, index = [], set(), 0
+    while index < len(args):
+        arg = args[index]
+        index += 1
+        if arg == "--":
+            operands.extend(args[index:])
+            break
+        if not arg.startswith("-") or arg == "-":
+            operands.append(arg)
+            continue
+        option = _option(spec, arg)
+        if option is None:
+            return False
+        names, takes_value = option
+        seen.update(names)
+        if takes_value and index < len(args) and (not spec.bundles or not _is_option(args[index])):
+            index += 1
+    if spec.required is not None and spec.required not in seen:
+        return False
+    if spec.subcommands is not None and operands and operands[0] not in spec.subcommands:
+        return False
+    if spec.actions is not None and len(operands) > 1 and operands[1] not in spec.actions:
+        return False
+    if spec.max_operands is not None and (
+        after_xargs or sum(not operand.startswith("+") for operand in operands) > spec.max_operands
+    ):
+        return False
+    return spec.check is None or spec.check(args)
+
+
+def _is_option(word: str) -> bool:
+    return word.startswith("-") and word != "-" and not re.fullmatch(r"-\d+", word)
+
+
+def _option(spec: ReadOnly, arg: str) -> Optional[Tuple[List[str], bool]]:
+    """The option names in arg and whether the next word is their value; None if one is not allowed."""
+    if spec.options is None:
+        return [], False
+    if arg.startswith("--") or not spec.bundles:
+        name = arg.split("=", 1)[0]
+        if name in spec.valued:
+            return [name], "=" not in arg
+        return ([name], False) if name in spec.options else None
+    if re.fullmatch(r"-\d+", arg):
+        return ([arg], False) if "-NUM" in spec.options else None
+    names = []
+    for position, letter in enumerate(arg[1:], 2):
+        names.append(f"-{letter}")
+        if names[-1] in spec.valued:
+            return names, position == len(arg)  # Otherwise the value is attached (-n5)
+        if names[-1] not in spec.options:
+            return None
+    return names, False
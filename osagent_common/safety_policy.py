@@ -0,0 +1,996 @@
+"""
+Declarative command safety policy, compiled once into a single matcher.
+
+The policy file (YAML, next to main.py) lists rule groups in priority order. Every group
+has a verdict ("allow" or "deny"), a reason template and one match type:
+
+    regex        re.search of each pattern in the whole command line (anchored: true -> re.match
+                 at the start of each command in the line)
+    substring    plain text anywhere in the command line
+    limit        max_length and/or max_count of single characters in the line exceeded
+    command      the command name is one of the listed names
+    not_command  the command name is none of the listed names
+    prefix       each command (on: line) or its name (on: base) starts with a prefix
+    redirect     an output redirection target (> file, >> file, &> file, ...) matches a regex
+
+Optional per group: ignore_case (regex/substring), modes (the group only applies when one of
+those modes is requested). Patterns may be a list or a mapping of label -> pattern; the label is
+what {pattern} shows in the reason. Reasons may also use {base} (the command name), {command}
+(the whole line), {target} (redirect rules) and the named groups of the pattern that matched.
+Numbered backreferences are not supported in patterns.
+
+Top-level options: strip and lowercase (normalisation applied before matching), empty (verdict
+for an empty command), unparsed (verdict for a line the parser cannot follow; deny by default,
+{error} in the reason says why), default and mode_defaults (verdict when no rule matches),
+cache_size (verdicts remembered per normalised command and mode set; 0 turns the cache off).
+
+The line is parsed once into a shell syntax tree (parse_shell). Every simple command in it is
+checked on its own: each stage of a pipeline, each part of a && / || / ; chain, commands in
+subshells, { } groups, if/while/for bodies, case arms and $( ), `...`, <( ) and >( )
+substitutions (also in the body of a here-document with an unquoted delimiter), the script
+given to sh -c / bash -c / eval, and commands run by find -exec. Wrappers such as sudo, env,
+timeout, nice and xargs are looked through: the wrapper and the command it runs must both
+pass. The line is denied if any command is; otherwise the verdict of the rule that comes first
+in the policy wins. A line the parser cannot follow (function definitions, coproc, select,
+unbalanced quotes) gets the unparsed verdict, unless a line-wide deny rule matches first.
+
+All regex, substring and limit rules become one alternation regex, command lists become one
+dict, and prefixes become a trie, so a check is one regex search plus a few lookups per
+command regardless of the number of rules. The first rule in file order that matches decides;
+rules ahead of the one the search found are only tried individually when the search found
+something.
+"""
+
+import functools
+import re
+import shlex
+from typing import Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import yaml
+
+
+# --- SHELL SYNTAX TREE ---
+
+
+class ShellSyntaxError(ValueError):
+    """The command is malformed, or uses shell syntax parse_shell does not handle."""
+
+
+class Redirect(NamedTuple):
+    fd: str  # Explicit descriptor ("2" in 2>file), "" for the default one
+    op: str  # >, >>, >|, &>, &>>, >&, <, <&, <>, <<<
+    target: str
+
+    @property
+    def writes(self) -> bool:
+        """True for a redirection that writes to a file (not a descriptor duplication)."""
+        if self.op in (">&", "<&"):
+            return self.op == ">&" and not (self.target.isdigit() or self.target == "-")
+        return self.op in (">", ">>", ">|", "&>", "&>>", "<>")
+
+
+class SimpleCommand(NamedTuple):
+    assignments: Tuple[str, ...]  # Leading NAME=value words
+    words: Tuple[str, ...]  # After quote removal; substitutions are kept as written
+    redirects: Tuple[Redirect, ...]
+    substitutions: Tuple["Script", ...]  # $( ), `...`, <( ) and >( ) anywhere in the command
+
+
+class Subshell(NamedTuple):
+    body: "Script"
+    redirects: Tuple[Redirect, ...]
+    substitutions: Tuple["Script", ...]  # In the redirect targets
+    brace: bool  # { list; } rather than ( list )
+
+
+class Pipeline(NamedTuple):
+    commands: Tuple[Union[SimpleCommand, Subshell], ...]
+
+
+class Script(NamedTuple):
+    items: Tuple[Tuple[Pipeline, str], ...]  # Each pipeline and the operator after it ("" at the end)
+
+
+class _ShellParser:
+    """Recursive-descent parser for the subset of bash that agents produce."""
+
+    _REDIRECT = re.compile(r"(\d*)(&>>|&>|>>|>\||>&|>|<<<|<<-|<<|<&|<>|<)")
+    _ASSIGNMENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(\[[^\]]*\])?\+?=")
+    _PLAIN_WORD = re.compile(r"[^\s;&|()<>'\"\\$`]+(?=[\s;&|()<>]|$)")
+    _WORD_RUN = re.compile(r"[^\s;&|()<>'\"\\$`]+")
+    # A line made of plain words only: no operators, quotes, expansions or comments
+    _PLAIN_LINE = re.compile(r"[^;&|()<>'\"\\$`#\n]*\Z")
+    _BLANKS = re.compile(r"(?:[ \t]+|\\\n|#[^\n]*)*")
+    _BLANKS_NEWLINES = re.compile(r"(?:[ \t\n]+|\\\n|#[^\n]*)*")
+    _METACHARS = frozenset(" \t\n;&|()<>")
+    # Reserved words that only structure the script; the commands around them are still checked
+    _TRANSPARENT = frozenset({"if", "then", "else", "elif", "fi", "while", "until", "do", "done", "!", "time"})
+    _UNSUPPORTED = frozenset({"esac", "function", "coproc", "select"})
+    _KEYWORDS = _TRANSPARENT | _UNSUPPORTED | {"for", "case", "{", "[["}
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+
+    def parse(self) -> Script:
+        script = self._list(None)
+        if self.pos < len(self.text):
+            raise ShellSyntaxError(f"unexpected {self.text[self.pos]!r} at offset {self.pos}")
+        return script
+
+    def _peek(self, length: int = 1) -> str:
+        return self.text[self.pos:self.pos + length]
+
+    def _expect(self, token: str):
+        if not self.text.startswith(token, self.pos):
+            raise ShellSyntaxError(f"expected {token!r} at offset {self.pos}")
+        self.pos += len(token)
+
+    def _blank(self, newlines: bool):
+        """Skip blanks, line continuations and comments (and newlines, if asked)."""
+        self.pos = (self._BLANKS_NEWLINES if newlines else self._BLANKS).match(self.text, self.pos).end()
+
+    def _plain_word(self) -> Optional[str]:
+        found = self._PLAIN_WORD.match(self.text, self.pos)
+        return found.group() if found else None
+
+    def _list(self, closer: Optional[str]) -> Script:
+        items = []
+        while True:
+            self._blank(newlines=True)
+            if self.pos >= len(self.text) or self._at_closer(closer):
+                break
+            pipeline = self._pipeline(closer)
+            operator = self._operator(closer)
+            items.append((pipeline, operator))
+            if not operator:
+                self._blank(newlines=False)
+                if self.pos < len(self.text) and self._peek() != ")" and self._plain_word() != "}" \
+                        and not self._at_closer(closer):
+                    raise ShellSyntaxError(f"unexpected {self._peek()!r} at offset {self.pos}")
+        return Script(tuple(items))
+
+    def _at_closer(self, closer: Optional[str]) -> bool:
+        if closer == ")":
+            return self._peek() == ")"
+        if closer == "}":
+            return self._plain_word() == "}"
+        if closer == "esac":  # The end of a case arm
+            return self.text.startswith((";;", ";&"), self.pos) or self._plain_word() == "esac"
+        return False
+
+    def _operator(self, closer: Optional[str] = None) -> str:
+        self._blank(newlines=False)
+        for operator in ("&&", "||", ";;", ";&", ";", "&", "\n"):
+            if self.text.startswith(operator, self.pos):
+                if operator in (";;", ";&"):
+                    if closer == "esac":
+                        return ""  # Ends the case arm; _case consumes it
+                    if operator == ";;":
+                        raise ShellSyntaxError("';;' outside a case statement")
+                    continue
+                self.pos += len(operator)
+                return operator
+        return ""
+
+    def _pipeline(self, closer: Optional[str]) -> Pipeline:
+        commands = [self._command(closer)]
+        while True:
+            self._blank(newlines=False)
+            if self.text.startswith("||", self.pos) or self._peek() != "|":
+                break
+            self.pos += 2 if self.text.startswith("|&", self.pos) else 1
+            self._blank(newlines=True)
+            commands.append(self._command(closer))
+        return Pipeline(tuple(commands))
+
+    def _command(self, closer: Optional[str]) -> Union[SimpleCommand, Subshell]:
+        self._blank(newlines=False)
+        if self.text.startswith("((", self.pos):
+            self._skip_balanced()  # Arithmetic command
+            return SimpleCommand((), (), (), ())
+        if self._peek() == "(":
+            self.pos += 1
+            body = self._list(")")
+            self._expect(")")
+            return self._compound(body, brace=False)
+        if self._plain_word() == "case":
+            return self._case()
+        if self._plain_word() == "{":
+            self.pos += 1
+            body = self._list("}")
+            self._blank(newlines=True)
+            self._expect("}")
+            return self._compound(body, brace=True)
+        return self._simple(closer)
+
+    def _case(self) -> Subshell:
+        """case WORD in PATTERN) LIST ;; ... esac, as a group of all arms' commands."""
+        substitutions, items = [], []
+        self.pos += len("case")
+        self._blank(newlines=False)
+        self._word(substitutions)
+        self._blank(newlines=True)
+        if self._plain_word() != "in":
+            raise ShellSyntaxError(f"expected 'in' at offset {self.pos}")
+        self.pos += len("in")
+        while True:
+            self._blank(newlines=True)
+            if self._plain_word() == "esac":
+                self.pos += len("esac")
+                break
+            if self.pos >= len(self.text):
+                raise ShellSyntaxError("unterminated case")
+            if self._peek() == "(":
+                self.pos += 1
+            while True:  # Patterns: a | b )
+                self._blank(newlines=False)
+                self._word(substitutions)
+                self._blank(newlines=False)
+                if self._peek() != "|":
+                    break
+                self.pos += 1
+            self._expect(")")
+            items.extend(self._list("esac").items)
+            self._blank(newlines=True)
+            for terminator in (";;&", ";;", ";&"):
+                if self.text.startswith(terminator, self.pos):
+                    self.pos += len(terminator)
+                    break
+        group = self._compound(Script(tuple(items)), brace=True)
+        return group._replace(substitutions=tuple(substitutions) + group.substitutions)
+
+    def _compound(self, body: Script, brace: bool) -> Subshell:
+        redirects, substitutions = [], []
+        while True:
+            self._blank(newlines=False)
+            redirect = self._redirect(substitutions)
+            if redirect is None:
+                break
+            redirects.append(redirect)
+        return Subshell(body, tuple(redirects), tuple(substitutions), brace)
+
+    def _simple(self, closer: Optional[str]) -> SimpleCommand:
+        assignments, words, redirects, substitutions = [], [], [], []
+        header = False  # Inside a for loop header: words are values, not a command
+        self._blank(newlines=False)
+        begin = self.pos
+        while True:
+            self._blank(newlines=False)
+            if self.pos >= len(self.text):
+                break
+            ch = self.text[self.pos]
+            if ch in "<>&" or ch.isdigit():
+                redirect = self._redirect(substitutions)
+                if redirect is not None:
+                    redirects.append(redirect)
+                    continue
+            if ch in "\n;&|)":
+                break
+            if ch == "(":
+                raise ShellSyntaxError("function definitions and arrays are not supported")
+            plain = self._plain_word()
+            if plain is not None and words:
+                self.pos += len(plain)
+                words.append(plain)
+                continue
+            if not words and not assignments and not header:
+                if (closer == "}" and plain == "}") or (closer == "esac" and plain == "esac"):
+                    break
+                if plain in self._TRANSPARENT:
+                    self.pos += len(plain)
+                    continue
+                if plain in self._UNSUPPORTED:
+                    raise ShellSyntaxError(f"'{plain}' is not supported")
+                if plain == "for":
+                    self.pos += len(plain)
+                    self._blank(newlines=False)
+                    if self.text.startswith("((", self.pos):
+                        self._skip_balanced()
+                    header = True
+                    continue
+                if plain == "[[":
+                    words.extend(self._test_expression(substitutions))
+                    continue
+            start = self.pos
+            value = self._word(substitutions)
+            if header:
+                continue
+            if not words and self._ASSIGNMENT.match(self.text, start):
+                assignments.append(value)
+            else:
+                words.append(value)
+        if self.pos == begin and self.pos < len(self.text) and self.text[self.pos] in ";&|)":
+            raise ShellSyntaxError(f"unexpected {self.text[self.pos]!r} at offset {self.pos}")
+        return SimpleCommand(tuple(assignments), tuple(words), tuple(redirects), tuple(substitutions))
+
+    def _test_expression(self, substitutions: list) -> List[str]:
+        """[[ ... ]]: operators inside are part of the test, not of the shell."""
+        words = [self._word(substitutions)]
+        while words[-1] != "]]":
+            self._blank(newlines=True)
+            if self.pos >= len(self.text):
+                raise ShellSyntaxError("unterminated [[")
+            for operator in ("&&", "||", "<", ">", "(", ")", "!"):
+                if self.text.startswith(operator, self.pos):
+                    self.pos += len(operator)
+                    words.append(operator)
+                    break
+            else:
+                words.append(self._word(substitutions))
+        return words
+
+    def _redirect(self, substitutions: list) -> Optional[Redirect]:
+        if self.text.startswith((">(", "<("), self.pos):
+            return None  # Process substitution
+        found = self._REDIRECT.match(self.text, self.pos)
+        if not found:
+            return None
+        self.pos = found.end()
+        self._blank(newlines=False)
+        if self.pos >= len(self.text) or (self._peek() in self._METACHARS and not self.text.startswith((">(", "<("), self.pos)):
+            raise ShellSyntaxError(f"missing target after {found.group(2)!r}")
+        start = self.pos
+        target = self._word(substitutions)
+        if found.group(2) in ("<<", "<<-"):
+            quoted = any(ch in "'\"\\" for ch in self.text[start:self.pos])
+            self._here_document(target, found.group(2) == "<<-", None if quoted else substitutions)
+        return Redirect(found.group(1), found.group(2), target)
+
+    def _here_document(self, delimiter: str, strip_tabs: bool, substitutions: Optional[list]):
+        """Cut the body of a here-document (the lines after the current one, up to the delimiter)
+        out of the text. With an unquoted delimiter the body is expanded like a double-quoted
+        string, so its substitutions run as part of the command."""
+        begin = self.text.find("\n", self.pos) + 1
+        if begin == 0:
+            return  # No body at all
+        end = after = begin
+        while end < len(self.text):
+            line_end = self.text.find("\n", end)
+            line_end = len(self.text) if line_end < 0 else line_end
+            line = self.text[end:line_end]
+            after = min(line_end + 1, len(self.text))
+            if (line.lstrip("\t") if strip_tabs else line) == delimiter:
+                break
+            end = after
+        else:
+            after = len(self.text)  # Unterminated: the body runs to the end
+        if substitutions is not None:
+            body = _ShellParser(self.text[begin:end])
+            while body.pos < len(body.text):
+                ch = body.text[body.pos]
+                if ch == "$":
+                    body._dollar(substitutions)
+                elif ch == "`":
+                    body._backtick(substitutions)
+                else:
+                    body.pos += 2 if ch == "\\" else 1
+        self.text = self.text[:begin] + self.text[after:]
+
+    def _word(self, substitutions: list) -> str:
+        text, start, out = self.text, self.pos, []
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch in self._METACHARS:
+                if self.pos == start and text.startswith((">(", "<("), self.pos):
+                    self.pos += 2
+                    substitutions.append(self._list(")"))
+                    self._expect(")")
+                    text = self.text  # A here-document body may have been cut out
+                    out.append(text[start:self.pos])
+                    continue
+                break
+            run = self._WORD_RUN.match(text, self.pos)
+            if run:
+                out.append(run.group())
+                self.pos = run.end()
+            elif ch == "\\":
+                if text.startswith("\\\n", self.pos):
+                    self.pos += 2
+                    continue
+                out.append(text[self.pos + 1:self.pos + 2])
+                self.pos += 2
+            elif ch == "'":
+                end = text.find("'", self.pos + 1)
+                if end < 0:
+                    raise ShellSyntaxError("unterminated single quote")
+                out.append(text[self.pos + 1:end])
+                self.pos = end + 1
+            elif ch == '"':
+                self.pos += 1
+                out.append(self._double_quoted(substitutions))
+                text = self.text
+            elif ch == "$":
+                out.append(self._dollar(substitutions))
+                text = self.text
+            elif ch == "`":
+                out.append(self._backtick(substitutions))
+            else:
+                out.append(ch)
+                self.pos += 1
+        if self.pos == start:
+            raise ShellSyntaxError(f"expected a word at offset {start}")
+        return "".join(out)
+
+    def _double_quoted(self, substitutions: list) -> str:
+        text, out = self.text, []
+        while self.pos < len(text):
+            ch = text[self.pos]
+            if ch == '"':
+                self.pos += 1
+                return "".join(out)
+            if ch == "\\":
+                following = text[self.pos + 1:self.pos + 2]
+                if following in ('"', "\\", "$", "`"):
+                    out.append(following)
+                elif following != "\n":
+                    out.append(ch + following)
+                self.pos += 2
+            elif ch == "$":
+                out.append(self._dollar(substitutions))
+                text = self.text
+            elif ch == "`":
+                out.append(self._backtick(substitutions))
+            else:
+                out.append(ch)
+                self.pos += 1
+        raise ShellSyntaxError("unterminated double quote")
+
+    def _dollar(self, substitutions: list) -> str:
+        text, start = self.text, self.pos
+        if text.startswith("$((", start):
+            self.pos += 1
+            self._skip_balanced()
+        elif text.startswith("$(", start):
+            self.pos += 2
+            substitutions.append(self._list(")"))
+            self._blank(newlines=True)
+            self._expect(")")
+        elif text.startswith("${", start):
+            self.pos += 2
+            while True:
+                if self.pos >= len(text):
+                    raise ShellSyntaxError("unterminated ${")
+                ch = text[self.pos]
+                if ch == "}":
+                    self.pos += 1
+                    break
+                if ch == "$":
+                    self._dollar(substitutions)
+                    text = self.text
+                elif ch == "`":
+                    self._backtick(substitutions)
+                elif ch == '"':
+                    self.pos += 1
+                    self._double_quoted(substitutions)
+                    text = self.text
+                elif ch == "'":
+                    end = text.find("'", self.pos + 1)
+                    self.pos = len(text) if end < 0 else end + 1
+                else:
+                    self.pos += 2 if ch == "\\" else 1
+        elif text.startswith("$'", start):
+            end = self.pos + 2
+            while end < len(text) and text[end] != "'":
+                end += 2 if text[end] == "\\" else 1
+            if end >= len(text):
+                raise ShellSyntaxError("unterminated $'")
+            self.pos = end + 1
+            return text[start + 2:end]
+        else:
+            self.pos += 1
+        return self.text[start:self.pos]
+
+    def _backtick(self, substitutions: list) -> str:
+        text, start = self.text, self.pos
+        end = start + 1
+        while end < len(text) and text[end] != "`":
+            end += 2 if text[end] == "\\" else 1
+        if end >= len(text):
+            raise ShellSyntaxError("unterminated backquote")
+        inner = re.sub(r"\\([\\`$])", r"\1", text[start + 1:end])
+        substitutions.append(_ShellParser(inner).parse())
+        self.pos = end + 1
+        return text[start:self.pos]
+
+    def _skip_balanced(self):
+        """Skip a (( )) or $(( )) arithmetic expression starting at the first parenthesis."""
+        depth = 0
+        while self.pos < len(self.text):
+            ch = self.text[self.pos]
+            self.pos += 1
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+                if depth == 0:
+                    return
+        raise ShellSyntaxError("unterminated arithmetic expression")
+
+
+def parse_shell(command: str) -> Script:
+    """Parse a command line into a syntax tree. Raises ShellSyntaxError."""
+    if _ShellParser._PLAIN_LINE.match(command):
+        words = command.split()
+        if not words:
+            return Script(())
+        if words[0] not in _ShellParser._KEYWORDS:
+            count = 0
+            while count < len(words) and _ShellParser._ASSIGNMENT.match(words[count]):
+                count += 1
+            simple = SimpleCommand(tuple(words[:count]), tuple(words[count:]), (), ())
+            return Script(((Pipeline((simple,)), ""),))
+    try:
+        return _ShellParser(command).parse()
+    except RecursionError:
+        raise ShellSyntaxError("nested too deeply") from None
+
+
+def simple_commands(script: Script) -> Iterator[SimpleCommand]:
+    """Every simple command in the tree, including those in subshells and substitutions.
+    Redirections of a subshell or { } group are reported as a command without words."""
+    for pipeline, _ in script.items:
+        for command in pipeline.commands:
+            if isinstance(command, SimpleCommand):
+                yield command
+                for substitution in command.substitutions:
+                    yield from simple_commands(substitution)
+            else:
+                yield from simple_commands(command.body)
+                if command.redirects:
+                    yield SimpleCommand((), (), command.redirects, ())
+                for substitution in command.substitutions:
+                    yield from simple_commands(substitution)
+
+
+# Commands that run another command given as their arguments: the options that take a value,
+# and the number of operands before the command (timeout's duration)
+WRAPPERS: Dict[str, Tuple[FrozenSet[str], int]] = {
+    "sudo": (frozenset({"-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t", "-U", "-T", "--user", "--group",
+                        "--host", "--prompt", "--close-from", "--chdir", "--role", "--type", "--other-user",
+                        "--command-timeout"}), 0),
+    "doas": (frozenset({"-u", "-C"}), 0),
+    "env": (frozenset({"-u", "-C", "--unset", "--chdir"}), 0),
+    "nice": (frozenset({"-n", "--adjustment"}), 0),
+    "ionice": (frozenset({"-c", "-n", "--class", "--classdata"}), 0),
+    "nohup": (frozenset(), 0),
+    "time": (frozenset({"-f", "-o", "--format", "--output"}), 0),
+    "timeout": (frozenset({"-s", "-k", "--signal", "--kill-after"}), 1),
+    "stdbuf": (frozenset({"-i", "-o", "-e"}), 0),
+    "command": (frozenset(), 0),
+    "exec": (frozenset({"-a"}), 0),
+    "setsid": (frozenset(), 0),
+    "xargs": (frozenset({"-a", "-d", "-E", "-I", "-L", "-n", "-P", "-s", "--arg-file", "--delimiter",
+                         "--max-lines", "--max-args", "--max-procs", "--max-chars", "--process-slot-var"}), 0),
+}
+# Shells whose -c argument, and builtins whose arguments, are themselves a script
+SCRIPT_RUNNERS = frozenset({"sh", "bash", "dash", "zsh", "ksh", "eval"})
+FIND_EXEC = frozenset({"-exec", "-execdir", "-ok", "-okdir"})
+
+
+def wrapped_command(words: List[str]) -> List[str]:
+    """The command a wrapper runs: its words after the wrapper's options, assignments and operands."""
+    options, operands = WRAPPERS[words[0].rsplit("/", 1)[-1]]
+    index = 1
+    while index < len(words):
+        word = words[index]
+        if word == "--":
+            index += 1
+            break
+        if word.startswith("-") and len(word) > 1:
+            index += 2 if word in options else 1
+        elif "=" in word and re.match(r"[A-Za-z_][A-Za-z0-9_]*=", word):
+            index += 1
+        else:
+            break
+    return words[index + operands:]
+
+
+def command_argvs(words: List[str], depth: int = 0) -> Iterator[List[str]]:
+    """The words of a simple command and of every command it runs through a wrapper,
+    sh -c / eval or find -exec. Raises ShellSyntaxError for a script that cannot be parsed."""
+    while words:
+        name = words[0].rsplit("/", 1)[-1]
+        yield words
+        if name in SCRIPT_RUNNERS and depth < 8:
+            if name == "eval":
+                script = " ".join(words[1:])
+            elif "-c" in words[1:-1]:
+                script = words[words.index("-c", 1) + 1]
+            else:
+                return
+            for command in simple_commands(parse_shell(script)):
+                yield from command_argvs(list(command.words), depth + 1)
+            return
+        if name == "find":
+            for index, word in enumerate(words):
+                if word in FIND_EXEC:
+                    rest = words[index + 1:]
+                    end = next((i for i, w in enumerate(rest) if w in (";", "+")), len(rest))
+                    yield from command_argvs(rest[:end], depth + 1)
+            return
+        if name not in WRAPPERS:
+            return
+        words = wrapped_command(words)
+
+
+def command_invocations(words: List[str]) -> Iterator[Tuple[str, str]]:
+    """(text, name) of each command in command_argvs."""
+    for argv in command_argvs(words):
+        yield " ".join(argv), argv[0].rsplit("/", 1)[-1]
+
+
+# Where command_segments splits a line the parser cannot follow
+_COMMAND_SEPARATOR = re.compile(r"\|\||&&|[|;\n]")
+
+
+def command_segments(command: str) -> List[str]:
+    """
+    The simple commands of a command line (pipeline stages, chained, grouped and substituted
+    commands), each shell-quoted and stripped of leading VAR=value assignments and of wrappers
+    such as sudo, nice, timeout or xargs together with their options and option values.
+    Lines the shell parser cannot follow are split at pipes, ;, && and || instead.
+    """
+    try:
+        argvs = [list(simple.words) for simple in simple_commands(parse_shell(command))]
+    except ShellSyntaxError:
+        argvs = []
+        for segment in _COMMAND_SEPARATOR.split(command):
+            try:
+                words = shlex.split(segment)
+            except ValueError:
+                words = segment.split()
+            while words and re.match(r"^[A-Za-z_][A-Za-z0-9_]*=", words[0]):
+                words = words[1:]
+            argvs.append(words)
+    segments = []
+    for words in argvs:
+        while words and words[0].rsplit("/", 1)[-1] in WRAPPERS:
+            words = wrapped_command(words)
+        if words:
+            segments.append(" ".join(shlex.quote(word) for word in words))
+    return segments
+
+
+# One shell word as written: unquoted characters, backslash escapes and quoted strings
+COMMAND_WORD_PATTERN = re.compile(r"""(?:[^\s'"\\]|\\[\s\S]|'[^']*'|"(?:[^"\\]|\\[\s\S])*")+""")
+
+
+def command_key(command: str) -> str:
+    """
+    The command line with the whitespace between words collapsed, to recognise a repeated command.
+    Quoted and escaped text is kept as written, so grep 'a  b' and grep 'a b' stay different.
+    Lines shlex cannot split (unbalanced quotes) are only stripped.
+    """
+    try:
+        shlex.split(command)
+    except ValueError:
+        return command.strip()
+    return " ".join(COMMAND_WORD_PATTERN.findall(command))
+
+
+# --- POLICY ---
+
+
+class Verdict(NamedTuple):
+    allowed: bool
+    reason: str
+    rule: Optional[str]  # "group: pattern" of the deciding rule, None for a default verdict
+
+
+class _Rule(NamedTuple):
+    rule_id: str
+    allowed: bool
+    reason: str
+    label: str
+    scope: str  # "line", "start" (each command's text), "base" (each command's name) or "redirect"
+
+
+class _Invocation(NamedTuple):
+    text: str  # The command and its arguments, "" for redirections without a command
+    base: str  # The command name
+    targets: Tuple[str, ...]  # Files it redirects output to
+
+
+class _Matcher(NamedTuple):
+    regexes: Dict[str, Tuple["re.Pattern", List[Tuple[int, "re.Pattern"]]]]  # Per scope: combined, one by one
+    commands: Dict[str, int]
+    not_commands: List[Tuple[int, FrozenSet[str]]]
+    line_prefixes: dict
+    base_prefixes: dict
+    default: Verdict
+
+
+class SafetyPolicy:
+    _MATCH_TYPES = ("regex", "substring", "limit", "command", "not_command", "prefix", "redirect")
+    _UNPARSED = {"verdict": "deny", "reason": "Command could not be checked: {error}"}
+    _NAMED_GROUP = re.compile(r"\(\?P<(\w+)>")
+    _TRIE_END = ""
+
+    def __init__(self, policy: dict, source: str = "<policy>"):
+        self.source = source
+        self.strip = bool(policy.get("strip", True))
+        self.lowercase = bool(policy.get("lowercase", False))
+        self.empty = self._verdict(policy.get("empty"), "empty")
+        self.unparsed = self._verdict(policy.get("unparsed") or self._UNPARSED, "unparsed")
+        self.default = self._verdict(policy.get("default") or {"verdict": "allow", "reason": ""}, "default")
+        self.mode_defaults = {
+            mode: self._verdict(spec, f"mode_defaults.{mode}")
+            for mode, spec in (policy.get("mode_defaults") or {}).items()
+        }
+        self.rules: List[_Rule] = []
+        self._searches: Dict[int, "re.Pattern"] = {}
+        self._groups: List[Tuple[dict, List[int]]] = []
+        for number, group in enumerate(policy.get("rules") or []):
+            self._add_group(group, number)
+        self.modes = frozenset(self.mode_defaults).union(
+            mode for group, _ in self._groups for mode in group.get("modes") or ()
+        )
+        self._compiled: Dict[FrozenSet[str], _Matcher] = {}
+        cache_size = int(policy.get("cache_size", 1024))
+        self._decide = functools.lru_cache(maxsize=cache_size)(self._evaluate) if cache_size else self._evaluate
+
+    @classmethod
+    def load(cls, path: str) -> "SafetyPolicy":
+        """Read and compile a policy file. Raises ValueError if the file is missing or invalid."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                policy = yaml.safe_load(f)
+        except (OSError, yaml.YAMLError) as e:
+            raise ValueError(f"Cannot load safety policy {path}: {e}") from e
+        if not isinstance(policy, dict):
+            raise ValueError(f"Safety policy {path} must be a mapping")
+        result = cls(policy, path)
+        result.matcher()  # compile the mode-less matcher up front so errors surface at startup
+        return result
+
+    def _error(self, where: str, message: str) -> ValueError:
+        return ValueError(f"Safety policy {self.source}, {where}: {message}")
+
+    def _verdict(self, spec: Optional[dict], where: str) -> Optional[Verdict]:
+        if spec is None:
+            return None
+        if spec.get("verdict") not in ("allow", "deny"):
+            raise self._error(where, "verdict must be 'allow' or 'deny'")
+        return Verdict(spec["verdict"] == "allow", str(spec.get("reason", "")), None)
+
+    @staticmethod
+    def _scope(group: dict) -> str:
+        match = group["match"]
+        if match in ("regex", "substring", "limit"):
+            return "start" if group.get("anchored") else "line"
+        if match == "prefix" and group.get("on") != "base":
+            return "start"
+        return "redirect" if match == "redirect" else "base"
+
+    def _add_group(self, group: dict, number: int):
+        name = str(group.get("name", f"rule group {number + 1}"))
+        match = group.get("match")
+        if match not in self._MATCH_TYPES:
+            raise self._error(name, f"match must be one of {', '.join(self._MATCH_TYPES)}")
+        verdict = self._verdict(group, name)
+        reason = str(group.get("reason", verdict.reason))
+        if match == "limit":
+            labels = []
+            if "max_length" in group:
+                labels.append("max_length")
+            labels.extend(f"max_count {char}" for char in group.get("max_count") or {})
+            patterns = dict.fromkeys(labels)
+        elif isinstance(group.get("patterns"), dict):
+            patterns = group["patterns"]
+        else:
+            patterns = {str(p): p for p in group.get("patterns") or []}
+        if not patterns:
+            raise self._error(name, "no patterns")
+        if match == "not_command":
+            patterns = {"": frozenset(map(str, patterns.values()))}  # one rule for the whole list
+        scope = self._scope(dict(group, match=match))
+        indexes = []
+        for label, pattern in patterns.items():
+            index = len(self.rules)
+            if match in ("regex", "substring", "limit", "redirect"):
+                source = self._search_pattern(group, str(label), pattern)
+                try:
+                    self._searches[index] = re.compile(source)
+                except (re.error, TypeError, ValueError) as e:
+                    raise self._error(name, f"invalid pattern {pattern!r}: {e}") from e
+            indexes.append(index)
+            rule_id = f"{name}: {label}" if label != "" else name
+            self.rules.append(_Rule(rule_id, verdict.allowed, reason, str(label), scope))
+        self._groups.append((dict(group, name=name, patterns=patterns), indexes))
+
+    @staticmethod
+    def _search_pattern(group: dict, label: str, pattern) -> str:
+        """A rule as one regex with re.search semantics."""
+        match = group["match"]
+        if match == "limit":
+            if label == "max_length":
+                return rf"\A(?=[\s\S]{{{int(group['max_length']) + 1}}})"
+            char = re.escape(label[len("max_count "):])
+            limit = int(group["max_count"][label[len("max_count "):]])
+            return rf"\A(?=(?:[^{char}]*{char}){{{limit + 1}}})"
+        body = re.escape(pattern) if match == "substring" else pattern
+        if group.get("ignore_case"):
+            body = f"(?i:{body})"
+        return rf"\A(?:{body})" if group.get("anchored") else body
+
+    def _trie_insert(self, trie: dict, prefix: str, index: int):
+        node = trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[self._TRIE_END] = min(node.get(self._TRIE_END, index), index)
+
+    def _trie_lookup(self, trie: dict, text: str) -> Optional[int]:
+        best = trie.get(self._TRIE_END)
+        node = trie
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            hit = node.get(self._TRIE_END)
+            if hit is not None and (best is None or hit < best):
+                best = hit
+        return best
+
+    def matcher(self, modes: Iterable[str] = ()) -> _Matcher:
+        """The compiled matcher for a set of active modes (built once per distinct set)."""
+        active = frozenset(modes).intersection(self.modes) if modes else frozenset()
+        cached = self._compiled.get(active)
+        if cached is not None:
+            return cached
+        parts: Dict[str, list] = {"line": [], "start": [], "redirect": []}
+        searches: Dict[str, list] = {"line": [], "start": [], "redirect": []}
+        commands, not_commands, line_prefixes, base_prefixes = {}, [], {}, {}
+        for group, indexes in self._groups:
+            if group.get("modes") and not active.intersection(group["modes"]):
+                continue
+            match = group["match"]
+            for index, pattern in zip(indexes, group["patterns"].values()):
+                scope = self.rules[index].scope
+                if index in self._searches:
+                    search = self._searches[index]
+                    searches[scope].append((index, search))
+                    # Give the rule's own named groups a per-rule prefix so they can't collide. The
+                    # empty marker group goes last: a group around the whole rule would stop re from
+                    # skipping ahead to the possible first characters of the alternation.
+                    body = self._NAMED_GROUP.sub(rf"(?P<r{index}_\1>", search.pattern)
+                    parts[scope].append(f"(?:{body})(?P<r{index}>)")
+                elif match == "command":
+                    commands.setdefault(str(pattern), index)
+                elif match == "prefix":
+                    trie = base_prefixes if scope == "base" else line_prefixes
+                    self._trie_insert(trie, str(pattern), index)
+                else:
+                    not_commands.append((index, pattern))
+        default = self.default
+        for mode in self.mode_defaults:
+            if mode in active:
+                default = self.mode_defaults[mode]
+                break
+        regexes = {}
+        for scope, alternatives in parts.items():
+            if alternatives:
+                try:
+                    regexes[scope] = (re.compile("|".join(alternatives)), searches[scope])
+                except re.error as e:
+                    raise self._error("combined matcher", str(e)) from e
+        compiled = _Matcher(regexes, commands, not_commands, line_prefixes, base_prefixes, default)
+        self._compiled[active] = compiled
+        return compiled
+
+    @staticmethod
+    def _first_hit(regex: Tuple["re.Pattern", list], text: str) -> Optional[int]:
+        combined, searches = regex
+        found = combined.search(text)
+        if not found:
+            return None
+        best = int(found.lastgroup[1:])
+        # The search stops at the leftmost match; an earlier rule may still match further on
+        for index, search in searches:
+            if index >= best:
+                break
+            if search.search(text):
+                return index
+        return best
+
+    def normalise(self, command: str) -> str:
+        if self.strip:
+            command = command.strip()
+        return command.lower() if self.lowercase else command
+
+    @staticmethod
+    def invocations(text: str) -> List[_Invocation]:
+        """Every command the line runs, each with the files it redirects output to."""
+        result = []
+        for command in simple_commands(parse_shell(text)):
+            targets = tuple(redirect.target for redirect in command.redirects if redirect.writes)
+            if not command.words:
+                if targets:
+                    result.append(_Invocation("", "", targets))
+                continue
+            for text_, base in command_invocations(list(command.words)):
+                result.append(_Invocation(text_, base, targets))
+                targets = ()
+        return result
+
+    def check(self, command: str, modes: Iterable[str] = ()) -> Verdict:
+        """Verdict for a command line: denied if any command in it is, otherwise the verdict
+        of the rule that comes first in the policy."""
+        text = self.normalise(command)
+        if self.empty is not None and not text.strip():
+            return self.empty
+        active = frozenset(modes).intersection(self.modes) if modes else frozenset()
+        return self._decide(text, active)
+
+    def cache_info(self):
+        """Hits and misses of the verdict cache (None when it is turned off)."""
+        return self._decide.cache_info() if hasattr(self._decide, "cache_info") else None
+
+    def _evaluate(self, text: str, active: FrozenSet[str]) -> Verdict:
+        compiled = self.matcher(active)
+        line = compiled.regexes.get("line")
+        line_best = self._first_hit(line, text) if line else None
+        try:
+            invocations = self.invocations(text)
+        except ShellSyntaxError as e:
+            # Commands the parser cannot see into are never allowed; a matching deny rule still names the reason
+            if line_best is not None and not self.rules[line_best].allowed:
+                return self._render(line_best, _Invocation(text, "", ()), text, "", compiled)
+            return self.unparsed._replace(reason=self.unparsed.reason.format(error=e, command=text))
+        if not any(invocation.text for invocation in invocations):
+            # No command words (assignments or redirections only): judge the line as one command
+            base = re.match(r"[^\s;&|()<>]*", text).group() or text
+            invocations.append(_Invocation(text, base, ()))
+        decided, decided_key = None, None
+        for invocation in invocations:
+            best, target = line_best, ""
+            candidates = []
+            if invocation.text:
+                start = compiled.regexes.get("start")
+                if start:
+                    candidates.append(self._first_hit(start, invocation.text))
+                candidates.append(compiled.commands.get(invocation.base))
+                if compiled.line_prefixes:
+                    candidates.append(self._trie_lookup(compiled.line_prefixes, invocation.text))
+                if compiled.base_prefixes:
+                    candidates.append(self._trie_lookup(compiled.base_prefixes, invocation.base))
+            for candidate in candidates:
+                if candidate is not None and (best is None or candidate < best):
+                    best = candidate
+            redirect = compiled.regexes.get("redirect")
+            for path in invocation.targets if redirect else ():
+                hit = self._first_hit(redirect, path)
+                if hit is not None and (best is None or hit < best):
+                    best, target = hit, path
+            if invocation.text:
+                for index, names in compiled.not_commands:
+                    if best is not None and index > best:
+                        break
+                    if invocation.base not in names:
+                        best = index
+                        break
+            elif best is None:
+                continue  # Redirections alone only count when a rule matches them
+            verdict = self._render(best, invocation, text, target, compiled)
+            # A denial beats any allowance; otherwise the rule earliest in the policy wins
+            key = (verdict.allowed, len(self.rules) if best is None else best)
+            if decided_key is None or key < decided_key:
+                decided, decided_key = verdict, key
+        if decided is None:
+            rule = compiled.default
+            return rule._replace(reason=rule.reason.format(base="", command=text))
+        return decided
+
+    def _render(self, best: Optional[int], invocation: _Invocation, text: str, target: str,
+                compiled: _Matcher) -> Verdict:
+        if best is None:
+            rule = compiled.default
+            return rule._replace(reason=rule.reason.format(base=invocation.base, command=text))
+        rule = self.rules[best]
+        fields = {"pattern": rule.label, "base": invocation.base, "command": text, "target": target}
+        if best in self._searches:
+            scoped = {"line": text, "start": invocation.text, "redirect": target}[rule.scope]
+            named = self._searches[best].search(scoped)
+            if named:
+                fields.update((name, value or "") for name, value in named.groupdict().items())
+        return Verdict(rule.allowed, rule.reason.format(**fields), rule.rule_id)
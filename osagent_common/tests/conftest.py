@@ -0,0 +1,5 @@
+import os
+import sys
+
+# osagent_common is imported as a package from the repository root, as the variants do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
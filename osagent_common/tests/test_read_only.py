@@ -0,0 +1,91 @@
+import pytest
+
+from osagent_common.read_only import is_read_only
+
+
+@pytest.mark.parametrize("command", [
+    "ls -la /etc",
+    "ls 2>&1 | head",
+    "cat /var/log/syslog | grep error | wc -l",
+    "grep -r foo /etc 2>/dev/null",
+    "ps aux --sort=-%mem | head",
+    "sed -n '1,5p' file",
+    "sed -ne 's/a/b/p' file",
+    "awk -F: '{print $1}' /etc/passwd",
+    "tail -n 20 file",
+    "tail -20 file",
+    "top -bn1",
+    "date +%s",
+    "hostname -I",
+    "find / -name '*.log' -mtime +7",
+    "find . \\( -name a -o -name b \\) -print",
+    "sort -rn file",
+    "uniq -c file",
+    "ip -br a",
+    "ip route show",
+    "ip -j route get 1.1.1.1",
+    "systemctl status nginx",
+    "journalctl -u nginx -n 50 --no-pager",
+    "journalctl -xe",
+    "dpkg -l",
+    "dpkg -S /bin/ls",
+    "apt list --installed",
+    "ss -tulpn",
+    "dmesg -T",
+    "lsof -i :22",
+    "sudo cat /etc/shadow",
+    "nice -n 5 ls",
+    "timeout 5 cat file",
+    "find . -name '*.py' | xargs grep foo",
+])
+def test_read_only(command):
+    assert is_read_only(command)
+
+
+@pytest.mark.parametrize("command", [
+    "ip route prepend 10.0.0.0/8 dev eth0",
+    "ip route append default via 10.0.0.1",
+    "ip route restore < /tmp/r",
+    "ip link set eth0 up",
+    "ip netns exec ns ls",
+    "dpkg -x a.deb /",
+    "dpkg -i a.deb",
+    "dpkg --set-selections",
+    "journalctl --setup-keys",
+    "journalctl --rotate",
+    "journalctl -fu nginx",
+    "tail -f file",
+    "top",
+    "date 010101",
+    "date -s tomorrow",
+    "hostname newname",
+    "find . -delete",
+    "find . -exec rm {} \\;",
+    "sed -i s/a/b/ file",
+    "sed -ne 'w /etc/x' file",
+    "sed 's/a/b/e' file",
+    "awk '{print > \"x\"}' file",
+    "awk 'BEGIN { system(\"id\") }'",
+    "sort -o out file",
+    "uniq in out",
+    "ss -K dst 1.1.1.1",
+    "dmesg -c",
+    "lsof -r 1",
+    "systemctl restart nginx",
+    "apt install nginx",
+    "sudo -e /etc/hosts",
+    "env touch file",
+    "time -o out ls",
+    "xargs rm",
+    "xargs hostname",
+    "echo x | sudo tee /etc/hosts",
+    "ls > out",
+    "ls &",
+    "echo $(rm file)",
+    "ls; rm file",
+    "sh -c 'ls'",
+    "unknown-tool --list",
+    "ls 'unterminated",
+])
+def test_not_read_only(command):
+    assert not is_read_only(command)